@@ -0,0 +1,279 @@
+# --- API JSON de correção monetária ---
+# servida no mesmo processo do app (montada junto do Shiny no app_correcao), sem criar sessão do Shiny por chamada.
+#   GET  /api/correcao?indice=IPCA&data_inicial=2020-01&data_final=2021-01&valor=100
+#   POST /api/correcao  com um objeto {"indice", "data_inicial", "data_final", "valor"} ou uma lista deles
+# devolve o fator acumulado, a inflação no período (%) e o valor corrigido, os mesmos números do resultados() e dos KPIs.
+# as respostas levam ETag com a versão dos dados: num GET com If-None-Match que confere devolvemos 304, e o
+# Cache-Control deixa um proxy reverso reaproveitar a resposta do GET enquanto os dados não mudarem (POST: no-store).
+# "indice" aceita também um índice composto, como IGP_DI+IPCA@2010-01 (motor_correcao.segmentos_composto).
+# com "pro_rata" (true, corridos ou uteis) a correção vai do dia exato ao dia exato (motor_correcao.corrigir_pro_rata),
+# com datas como 2020-01-17 ou 17/01/2020; vale para /api/correcao (em cada pedido) e /api/parcelas.
+# além da correção avulsa:
+#   POST /api/parcelas com {"indice", "data_alvo", "parcelas": [{"data", "valor"}, ...]}  cada parcela corrigida e o total
+#   GET  /api/fatores?indice=IPCA&data_alvo=2025-01[&formato=csv|csv.gz|xlsx]   tabela de fatores de todos os meses até a data alvo
+#   GET  /api/fatores/matriz?indice=IPCA&formato=csv|csv.gz|xlsx               matriz completa (data inicial x data final)
+# os arquivos (csv, csv.gz, xlsx) são gravados em streaming pelo exportacao.escrever_tabela.
+import os
+
+import numpy as np
+import pandas as pd
+
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from exportacao import matriz_fatores_bytes, tabela_fatores_bytes, validar_formato_tabela
+from metricas import rastreio
+from tarefas import executar, iterar
+from motor_correcao import (
+    DIAS_PRO_RATA,
+    aguardar_indice,
+    corrigir,
+    corrigir_lote,
+    corrigir_parcelas,
+    corrigir_pro_rata,
+    ler_data,
+    simbolo_moeda,
+    tabela_fatores_alvo,
+    validar_nome,
+    versao_dados,
+)
+
+MAX_AGE_API = int(os.environ.get("CORRECAO_API_MAX_AGE", "3600"))
+
+def ler_pedido(pedido):
+    try:
+        nome, valor = pedido["indice"], float(pedido["valor"])
+        data_inicial, data_final = ler_data(pedido["data_inicial"]), ler_data(pedido["data_final"])
+    except (KeyError, TypeError) as erro:
+        raise ValueError(f"Pedido incompleto: informe indice, data_inicial, data_final e valor ({erro}).")
+    if not np.isfinite(valor):  # float() aceita "nan" e "inf", que não viram JSON na resposta
+        raise ValueError(f"Valor inválido: {pedido['valor']!r}.")
+    return validar_nome(nome), data_inicial, data_final, valor
+
+# um valor enorme vezes o fator de uma moeda antiga pode passar do maior float (inf), que também não vira JSON
+def validar_resultado(resposta):
+    if not np.isfinite(resposta["valor_corrigido"]):
+        raise ValueError("Valor corrigido fora do intervalo representável: informe um valor menor.")
+    return resposta
+
+# a soma das parcelas corrigidas também pode passar do maior float
+def validar_total(total):
+    if not np.isfinite(total):
+        raise ValueError("Total corrigido fora do intervalo representável: informe valores menores.")
+    return total
+
+
+# "pro_rata" do pedido: ausente/false -> correção mensal (None); true -> a contagem configurada; ou "corridos"/"uteis"
+def ler_pro_rata(pedido):
+    pro_rata = pedido.get("pro_rata")
+    if pro_rata in (None, False, "", "0", "false"):
+        return None
+    if pro_rata in (True, "1", "true"):
+        return DIAS_PRO_RATA
+    return str(pro_rata)
+
+
+# correção avulsa (O(1)), mensal ou pro rata die
+def corrigir_pedido(pedido):
+    nome, data_inicial, data_final, valor = ler_pedido(pedido)
+    pro_rata = ler_pro_rata(pedido)
+    if pro_rata is None:
+        return nome, lambda: validar_resultado(corrigir(nome, data_inicial, data_final, valor))
+    return nome, lambda: validar_resultado(corrigir_pro_rata(nome, data_inicial, data_final, valor, pro_rata))
+
+
+# lista de pedidos: uma única correção vetorizada (corrigir_lote) por modo (mensal, pro rata), no pool de tarefas,
+# fora do event loop
+def corrigir_pedidos(pedidos):
+    respostas = [None] * len(pedidos)
+    validos = {}  # pro_rata -> [(posicao, valor, data_inicial, data_final, nome)]
+    for posicao, pedido in enumerate(pedidos):
+        try:
+            nome, data_inicial, data_final, valor = ler_pedido(pedido)
+            pro_rata = ler_pro_rata(pedido)
+            validos.setdefault(pro_rata, []).append((posicao, valor, data_inicial, data_final, nome))
+        except (ValueError, AttributeError) as erro:
+            respostas[posicao] = {"erro": str(erro)}
+
+    for pro_rata, linhas in validos.items():
+        try:
+            corrigir_grupo(respostas, pro_rata, linhas)
+        except ValueError as erro:  # contagem de dias desconhecida
+            for posicao, *_ in linhas:
+                respostas[posicao] = {"erro": str(erro)}
+    return respostas
+
+def corrigir_grupo(respostas, pro_rata, linhas):
+    posicoes, valores, datas_iniciais, datas_finais, nomes = zip(*linhas)
+    lote = corrigir_lote(pd.DataFrame({
+        "valor": valores, "data_inicial": datas_iniciais, "data_final": datas_finais, "indice": nomes,
+    }), pro_rata)
+    moedas = simbolo_moeda(np.array(datas_finais, dtype="datetime64[D]"))
+    formato_data = "%Y-%m" if pro_rata is None else "%Y-%m-%d"
+    for posicao, linha, moeda in zip(posicoes, lote.itertuples(index=False), moedas):
+        if not linha.erro and not np.isfinite(linha.valor_corrigido):
+            linha = linha._replace(erro="Valor corrigido fora do intervalo representável: informe um valor menor.")
+        if linha.erro:
+            respostas[posicao] = {"erro": linha.erro}
+            continue
+        respostas[posicao] = {
+            "indice": linha.indice,
+            "data_inicial": linha.data_inicial.strftime(formato_data),
+            "data_final": linha.data_final.strftime(formato_data),
+            "valor": linha.valor,
+            "fator_acumulado": linha.fator_acumulado,
+            "inflacao_periodo": (linha.fator_acumulado - 1) * 100,
+            "valor_corrigido": linha.valor_corrigido,
+            "moeda": str(moeda),
+            "versao_dados": lote.attrs["versoes_dados"][linha.indice],
+        }
+        if pro_rata is not None:
+            respostas[posicao]["pro_rata"] = pro_rata
+
+
+# cada chamada é um rastreio; o id vem do X-Request-Id (proxy) ou é gerado, e volta no cabeçalho da resposta
+async def correcao(request):
+    with rastreio("api_correcao", request.headers.get("x-request-id")) as id_rastreio:
+        resposta = await responder_correcao(request)
+    resposta.headers["X-Request-Id"] = id_rastreio
+    return resposta
+
+
+# If-None-Match (RFC 9110, 13.1.2): "*" ou uma lista de ETags separadas por vírgula, comparadas de forma fraca
+# (W/"x" confere com "x")
+def etag_confere(if_none_match, etag):
+    if not if_none_match:
+        return False
+    etags = [item.strip() for item in if_none_match.split(",")]
+    return "*" in etags or etag in [item.removeprefix("W/") for item in etags]
+
+
+async def responder_correcao(request):
+    versao = versao_dados()
+    etag = f'"{versao}"'
+    # só o GET é reaproveitável por um proxy; o POST (avulso ou lista) não deve ser guardado
+    cache_control = f"public, max-age={MAX_AGE_API}" if request.method == "GET" else "no-store"
+    cabecalhos = {"ETag": etag, "Cache-Control": cache_control}
+    if request.method == "GET" and etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cabecalhos)
+
+    try:
+        if request.method == "GET":
+            nome, calcular = corrigir_pedido(request.query_params)
+            await aguardar_indice(nome)
+            resposta = calcular()
+        else:
+            corpo = await request.json()
+            if isinstance(corpo, list):
+                resposta = await executar("api_lista", corrigir_pedidos, corpo)
+            else:
+                nome, calcular = corrigir_pedido(corpo)
+                await aguardar_indice(nome)
+                resposta = calcular()
+    except ValueError as erro:
+        return JSONResponse({"erro": str(erro)}, status_code=400)
+
+    # a versão pode ter mudado se alguma série terminou de carregar durante o pedido
+    cabecalhos["ETag"] = f'"{versao_dados()}"'
+    return JSONResponse(resposta, headers=cabecalhos)
+
+
+def ler_indice(parametros):
+    return validar_nome(parametros.get("indice") or "")
+
+
+tipos_tabela = {
+    "csv": "text/csv; charset=utf-8",
+    "csv.gz": "application/gzip",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+# tabela de fatores até a data alvo: json (uma linha por mês) ou o arquivo csv/csv.gz/xlsx
+async def fatores(request):
+    with rastreio("api_fatores", request.headers.get("x-request-id")) as id_rastreio:
+        try:
+            nome = ler_indice(request.query_params)
+            data_alvo = ler_data(request.query_params.get("data_alvo"))
+            formato = request.query_params.get("formato", "json")
+            if formato != "json":
+                validar_formato_tabela(formato)
+            await aguardar_indice(nome)
+            tabela = await executar("api_fatores", tabela_fatores_alvo, nome, data_alvo)
+            if formato == "json":
+                resposta = JSONResponse({
+                    "indice": nome,
+                    "data_alvo": data_alvo.strftime("%Y-%m"),
+                    "versao_dados": tabela.attrs["versao_dados"],
+                    "fatores": tabela[["date", "moeda", "fator_acumulado", "fator_historico", "fator"]].to_dict("records"),
+                })
+            else:
+                pedacos = iterar("api_fatores", tabela_fatores_bytes(tabela, formato))
+                resposta = StreamingResponse(pedacos, media_type=tipos_tabela[formato], headers={
+                    "Content-Disposition": f'attachment; filename="fatores_{nome}_{data_alvo:%m-%Y}.{formato}"',
+                })
+        except ValueError as erro:
+            resposta = JSONResponse({"erro": str(erro)}, status_code=400)
+    resposta.headers["X-Request-Id"] = id_rastreio
+    return resposta
+
+
+# matriz completa do índice: o gerador roda no pool de tarefas e cada pedaço é enviado assim que sai
+async def matriz_fatores(request):
+    try:
+        nome = ler_indice(request.query_params)
+        formato = request.query_params.get("formato", "csv")
+        validar_formato_tabela(formato)
+        await aguardar_indice(nome)
+    except ValueError as erro:
+        return JSONResponse({"erro": str(erro)}, status_code=400)
+    pedacos = iterar("api_matriz_fatores", matriz_fatores_bytes(nome, formato))
+    return StreamingResponse(pedacos, media_type=tipos_tabela[formato], headers={
+        "Content-Disposition": f'attachment; filename="matriz_fatores_{nome}.{formato}"',
+    })
+
+
+# fluxo de parcelas corrigido até a data alvo (uma única correção vetorizada, em uma thread)
+async def parcelas(request):
+    with rastreio("api_parcelas", request.headers.get("x-request-id")) as id_rastreio:
+        try:
+            corpo = await request.json()
+            if not isinstance(corpo, dict):
+                raise ValueError("Envie um objeto com indice, data_alvo e parcelas.")
+            nome = ler_indice(corpo)
+            data_alvo = ler_data(corpo.get("data_alvo"))
+            lista = pd.DataFrame(corpo.get("parcelas") or [], columns=["data", "valor"])
+            lista["data"] = [ler_data(data) for data in lista["data"]]
+            pro_rata = ler_pro_rata(corpo)
+            await aguardar_indice(nome)
+            tabela, total = await executar("api_parcelas", corrigir_parcelas, nome, lista, data_alvo, pro_rata)
+            resposta = JSONResponse({
+                "indice": nome,
+                "data_alvo": data_alvo.strftime("%Y-%m" if pro_rata is None else "%Y-%m-%d"),
+                "moeda": tabela.attrs["moeda_alvo"],
+                "total_corrigido": validar_total(total),
+                "versao_dados": tabela.attrs["versao_dados"],
+                "parcelas": [
+                    {"erro": linha["erro"]} if linha["erro"] else {
+                        "data": linha["data"],
+                        "valor": linha["valor"],
+                        "moeda": linha["moeda"],
+                        "fator_acumulado": linha["fator_acumulado"],
+                        "fator_historico": linha["fator_historico"],
+                        "valor_corrigido": linha["valor_corrigido"],
+                    }
+                    for linha in tabela.to_dict("records")
+                ],
+            })
+        except (ValueError, TypeError, AttributeError) as erro:
+            resposta = JSONResponse({"erro": str(erro)}, status_code=400)
+    resposta.headers["X-Request-Id"] = id_rastreio
+    return resposta
+
+
+rotas_api = [
+    Route("/api/correcao", correcao, methods=["GET", "POST"]),
+    Route("/api/parcelas", parcelas, methods=["POST"]),
+    Route("/api/fatores", fatores),
+    Route("/api/fatores/matriz", matriz_fatores),
+]
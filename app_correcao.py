@@ -1,108 +1,61 @@
 # --- imports ---
-import ipeadatapy as ipea
+# a interface (shiny, shinywidgets, faicons) só é importada aqui; o cálculo vem do motor_correcao,
+# que não depende de nenhuma biblioteca de interface. O plotly só é importado ao desenhar os gráficos.
+import asyncio
+import time
+
+from contextlib import asynccontextmanager
+
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-import plotly.graph_objects as go
 import faicons as fa
-import io
-
-from datetime import datetime
-from shinywidgets import output_widget, render_plotly
-from shiny import App, reactive, render, ui
-
-# --- Premissas para correção monetária considerando as datas ---
-# 1970 até fev/1986 -> cruzeiro (Cr$) | cruzeiro para real fator de conversão = 1 / (1000^3 * 2750);
-data_corte_cruzeiro = datetime(1986, 3, 1)
-fator_cruzeiro_real = 1 / (1000**3 * 2750)
-fator_real_cruzeiro = 1000**3 * 2750
-# mar/1986 até jan/1989 -> cruzado (Cz$) | cruzado para real fator de conversão = 1 / (1000^2 * 2750);
-data_corte_cruzado = datetime(1989, 2, 1)
-fator_cruzado_real = 1 / (1000**2 * 2750)
-fator_real_cruzado = 1000**2 * 2750
-# fev/1989 até mar/1990 -> cruzado novo (NCz$) | cruzado novo para real fator de conversão = 1 / (1000 * 2750);
-data_corte_cruzadonovo = datetime(1990, 4, 1)
-fator_cruzadonovo_real = 1 / (1000 * 2750)
-fator_real_cruzadonovo = 1000 * 2750
-# abr/1990 até jul/1993 ->  cruzeiro (Cr$) | cruzeiro para real fator de conversão = 1 / (1000 * 2750);
-data_corte_cruzeiro2 = datetime(1993, 8, 1)
-fator_cruzeiro2_real = 1 / (1000 * 2750)
-fator_real_cruzeiro2 = 1000 * 2750
-# ago/1993 até jun/1994 -> cruzeiro real (CR$) | cruzeiro real para real fator de conversão = 1 / 2750;
-data_corte_cruzeiroreal = datetime(1994, 7, 1)
-fator_cruzeiroreal_real = 1 / 2750
-fator_real_cruzeiroreal = 2750
-# jul/1994 em diante -> real (R$)
-
-# --- Funções globais ---
-# função para definir o fator histórico da moeda antiga para real
-def fator_historico(data):
-    if data < data_corte_cruzeiro:
-        return fator_cruzeiro_real
-    elif data < data_corte_cruzado:
-        return fator_cruzado_real
-    elif data < data_corte_cruzadonovo:
-        return fator_cruzadonovo_real
-    elif data < data_corte_cruzeiro2:
-        return fator_cruzeiro2_real
-    elif data < data_corte_cruzeiroreal:
-        return fator_cruzeiroreal_real
-    else:
-        return 1.0  # já em real
-
-# função para definir o fator histórico do real para  moeda antiga
-def fator_historico_real_moedaantiga(data):
-    if data < data_corte_cruzeiro:
-        return fator_real_cruzeiro
-    elif data < data_corte_cruzado:
-        return fator_real_cruzado
-    elif data < data_corte_cruzadonovo:
-        return fator_real_cruzadonovo
-    elif data < data_corte_cruzeiro2:
-        return fator_real_cruzeiro2
-    elif data < data_corte_cruzeiroreal:
-        return fator_real_cruzeiroreal
-    else:
-        return 1.0  # já em real
-
-# função para fazer a correção monetária considerando a inflação
-fator_acumulado = {}
-
-def inflacao(periodo):
-    fator = 1.0
-    for data, variacao in periodo.items():
-        fator = fator * (1 + variacao/100)
-    return fator
-
-# função para fazer a correção monetária considerando uma deflação
-def deflacao(periodo, valor_data_inicial):
-    denominador = 1.0
-    fator_inicial = (1 + valor_data_inicial/100 ) 
-    for data, variacao in periodo.items():
-        denominador = (1 + variacao/100) * denominador
-        fator = fator_inicial / denominador
-    return fator
-
-
-# --- lógica para ler e guardar os dados dos índices de correção monetária do ipeadata ---
-# dicionário de índices de correção monetária
-indices = {
-    "IPCA": "PRECOS12_IPCAG12",
-    "IGP_M": "IGP12_IGPMG12",
-    "IGP_DI": "IGP12_IGPDIG12",
-    "SELIC_OVER": "BM12_TJOVER12",
-    "INPC": "PRECOS12_INPCBR12",
-    "IPC_BR": "IGP12_IPCG12",
-    "IPC_FIPE": "FIPE12_FIPE0001"
-}
-
-# criando um dicionário para amarzenar os dataframe de cada índice inflacionário
-dados_indices = {}
-
-# carregando os índices inflacionários
-for nome, codigo in indices.items():
-    dados_indices[nome] = ipea.timeseries(codigo)
 
+from shinywidgets import output_widget, render_widget
+from shiny import App, reactive, render, req, ui
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+
+from api_correcao import rotas_api
+from exportacao import (
+    bytes_serie,
+    downloads_series,
+    em_blocos,
+    escrever_tabela,
+    formatos_exportacao,
+    formatos_tabela,
+    matriz_fatores_bytes,
+    tabela_fatores_bytes,
+)
+from metricas import ATIVO as METRICAS_ATIVAS, ajustar, etapa, incrementar, observar, rastreio, texto_prometheus
+from tarefas import executar, iterar
+from motor_correcao import (
+    DIAS_PRO_RATA,
+    LINHAS_BLOCO_MATRIZ,
+    PRONTO,
+    aguardar_indice,
+    aplicar_valor,
+    comparacao_periodo,
+    corrigir_arquivo,
+    corrigir_parcelas,
+    corrigir_pro_rata,
+    datas_mensais,
+    eh_composto,
+    estados_indices,
+    indices,
+    iniciar_atualizacao,
+    iniciar_carga,
+    ler_arquivo_parcelas,
+    ler_parcelas,
+    normalizar_nome,
+    simbolo_moeda,
+    tabela_fatores,
+    tabela_fatores_alvo,
+)
+
+# carregando os índices inflacionários em segundo plano; o app começa a responder sem esperar a carga terminar.
+# depois, a cada CORRECAO_ATUALIZACAO_HORAS, as séries são atualizadas sem reiniciar o app (motor_correcao.atualizar_dados)
+iniciar_carga()
+iniciar_atualizacao()
 
 # --- 1. UI (User Interface) ---
 app_ui = ui.page_sidebar( #sidebar = construção da página do User Interface
@@ -113,70 +66,93 @@ app_ui = ui.page_sidebar( #sidebar = construção da página do User Interface
             label="selecione o índice inflacionário:",
             choices=list(indices.keys()),
         ),
+        # índice composto (opcional): quando preenchido, vale no lugar do índice selecionado acima
+        ui.input_text(
+            id="indice_composto",
+            label="ou um índice composto:",
+            placeholder="IGP_DI+IPCA@2010-01",
+        ),
 
-        ui.input_date(id="data_inicial_str", label="data inicial:", value="2025-01-01", format="mm-yyyy"),
-        ui.input_date(id="data_final_str", label="data final:", value="2025-02-01", format="mm-yyyy"),
+        ui.input_date(id="data_inicial_str", label="data inicial:", value="2025-01-01", format="dd-mm-yyyy"),
+        ui.input_date(id="data_final_str", label="data final:", value="2025-02-01", format="dd-mm-yyyy"),
+        # pro rata die: os KPIs, o lote e as parcelas contam os dias (corridos ou úteis, CORRECAO_PRO_RATA_DIAS);
+        # desmarcado, só o mês das datas importa. A tabela e o gráfico continuam mês a mês
+        ui.input_checkbox(id="pro_rata", label="pro rata die (dia a dia)", value=False),
         ui.input_numeric(id="valor_nominal", label="valor a ser corrigido", value=100, min=0),
-        ui.input_action_button(id="button_calcular", label="Calcular"),
-        
+        # botões de tarefa: ficam ocupados (e não aceitam outro clique) enquanto o cálculo roda no pool de tarefas
+        ui.input_task_button(id="button_calcular", label="Calcular", label_busy="Calculando..."),
+        # formato de todas as planilhas de resultado (correção, lote, parcelas, comparação e tabelas de fatores)
+        ui.input_radio_buttons(
+            id="formato_tabela",
+            label="formato das planilhas:",
+            choices=formatos_tabela,
+            selected="xlsx",
+            inline=True,
+        ),
 
-        ui.h5("Dados Brutos:"),
-        # IPCA
-        ui.download_button(
-            id="download_ipca",
-            label=ui.span(fa.icon_svg("download", "solid"), "IPCA"),
-            class_="btn-sm",
-            style="margin-bottom: 5px; margin-right: 5px;"
+        # correção em lote: planilha com as colunas valor, data_inicial, data_final e indice
+        ui.h5("Correção em Lote:"),
+        ui.input_file(
+            id="arquivo_lote",
+            label="planilha (valor, data_inicial, data_final, indice):",
+            accept=[".csv", ".xlsx"],
         ),
-        
-        # IGP-M
         ui.download_button(
-            id="download_igpm",
-            label=ui.span(fa.icon_svg("download", "solid"), "IGP-M"),
+            id="download_lote",
+            label=ui.span(fa.icon_svg("download", "solid"), "Planilha corrigida"),
             class_="btn-sm",
             style="margin-bottom: 5px; margin-right: 5px;"
         ),
 
-        # IGP-DI
-        ui.download_button(
-            id="download_igpdi",
-            label=ui.span(fa.icon_svg("download", "solid"), "IGP-DI"),
-            class_="btn-sm",
-            style="margin-bottom: 5px; margin-right: 5px;"
+        # parcelas (data, valor) corrigidas pelo índice escolhido até a data final e somadas
+        ui.h5("Correção de Parcelas:"),
+        ui.input_text_area(
+            id="texto_parcelas",
+            label="uma parcela por linha (data;valor):",
+            placeholder="01/2020;1.500,00\n02/2020;1.500,00",
+            rows=4,
         ),
-    
-        # SELIC-OVER
-        ui.download_button(
-            id="download_selicover",
-            label=ui.span(fa.icon_svg("download", "solid"), "SELIC-OVER"),
-            class_="btn-sm",
-            style="margin-bottom: 5px; margin-right: 5px;"
+        ui.input_file(
+            id="arquivo_parcelas",
+            label="ou uma planilha (data, valor):",
+            accept=[".csv", ".xlsx"],
         ),
+        ui.input_task_button(id="button_parcelas", label="Corrigir parcelas", label_busy="Corrigindo...", class_="btn-sm"),
 
-        # INPC
+        # tabelas de fatores do índice escolhido: todos os meses desde 1970 corrigidos até a data final
+        # e a matriz completa (data inicial x data final)
+        ui.h5("Tabelas de Fatores:"),
         ui.download_button(
-            id="download_inpc",
-            label=ui.span(fa.icon_svg("download", "solid"), "INPC"),
+            id="download_tabela_fatores",
+            label=ui.span(fa.icon_svg("download", "solid"), "Até a data final"),
             class_="btn-sm",
             style="margin-bottom: 5px; margin-right: 5px;"
         ),
-
-        # IPC-BR
         ui.download_button(
-            id="download_ipcbr",
-            label=ui.span(fa.icon_svg("download", "solid"), "IPC-BR"),
+            id="download_matriz_fatores",
+            label=ui.span(fa.icon_svg("download", "solid"), "Matriz completa"),
             class_="btn-sm",
             style="margin-bottom: 5px; margin-right: 5px;"
         ),
 
-        # IPC-FIPE
-        ui.download_button(
-            id="download_ipcfipe",
-            label=ui.span(fa.icon_svg("download", "solid"), "IPC-FIPE"),
-            class_="btn-sm",
-            style="margin-bottom: 5px; margin-right: 5px;"
+        ui.h5("Dados Brutos:"),
+        ui.input_radio_buttons(
+            id="formato_download",
+            label=None,
+            choices=formatos_exportacao,
+            selected="xlsx",
+            inline=True,
         ),
-
+        # um botão por índice (IPCA, IGP-M, IGP-DI, SELIC-OVER, INPC, IPC-BR, IPC-FIPE)
+        *[
+            ui.download_button(
+                id=f"download_{prefixo}",
+                label=ui.span(fa.icon_svg("download", "solid"), rotulo),
+                class_="btn-sm",
+                style="margin-bottom: 5px; margin-right: 5px;"
+            )
+            for nome, (prefixo, rotulo) in downloads_series.items()
+        ],
          # Fonte dos dados: Ipeadata https://www.ipeadata.gov.br/Default.aspx
         ui.a(
             ui.p(
@@ -218,11 +194,44 @@ app_ui = ui.page_sidebar( #sidebar = construção da página do User Interface
     ),
 
     ui.card( #Este trecho cria um card independente, ou seja, uma seção (caixa) isolada na página
-        ui.card_header("Comparação entre Índices"),
+        ui.card_header(
+            ui.span("Comparação entre Índices"),
+            ui.input_radio_buttons(
+                id="tipo_comparacao",
+                label=None,
+                choices={"variacao": "Variação mensal (%)", "acumulado": "R$ 100 corrigidos"},
+                selected="variacao",
+                inline=True,
+            ),
+            ui.input_checkbox(id="escala_log", label="escala log", value=False),
+            ui.download_button(
+                "download_comparacao",
+                label=ui.span(fa.icon_svg("file-excel", "regular")),
+                class_="btn-sm float-end",
+                style="margin-left: 10px;"
+            ),
+            class_="d-flex justify-content-between align-items-center"
+        ),
         output_widget("comparacao_plot"),
         full_screen=True
     ),
 
+    # parcelas corrigidas até a data final, com o total no rodapé
+    ui.card(
+        ui.card_header(
+            ui.span("Correção de Parcelas"),
+            ui.download_button(
+                "download_parcelas",
+                label=ui.span(fa.icon_svg("file-excel", "regular")),
+                class_="btn-sm float-end",
+                style="margin-left: 10px;"
+            ),
+            class_="d-flex justify-content-between align-items-center"
+        ),
+        ui.output_data_frame("df_parcelas"),
+        full_screen=True
+    ),
+
      # --- LINKS SOCIAIS NA PARTE INFERIOR ---
     ui.div(
         ui.span("Desenvolvido por Lucas Magalhães Ast | ", style="margin-right: 8px;"),
@@ -261,6 +270,9 @@ app_ui = ui.page_sidebar( #sidebar = construção da página do User Interface
 
 # --- 2. Server ---
 def server(input, output, session):
+    incrementar("correcao_sessoes_total")
+    ajustar("correcao_sessoes_ativas", 1)
+    session.on_ended(lambda: ajustar("correcao_sessoes_ativas", -1))
 
     # função para trabalhar com os inputs do tipo data
     @reactive.Calc
@@ -271,227 +283,296 @@ def server(input, output, session):
         if data_inicial is None or data_final is None:
             return None
 
-        # Formatar date para datetime
-        data_inicial_fmt = datetime.combine(data_inicial, datetime.min.time())
-        data_final_fmt = datetime.combine(data_final, datetime.min.time())
+        # padroniza o "dd" para "01" e garante a ordem (menor, maior)
+        return datas_mensais(data_inicial, data_final)
 
-        # Padroniza sempre para o "dd" seja "01"
-        data_inicial_fmt = data_inicial_fmt.replace(day=1)
-        data_final_fmt = data_final_fmt.replace(day=1)
+    # índice usado nos cálculos: o composto digitado (ex. IGP_DI+IPCA@2010-01) ou o selecionado na lista
+    @reactive.Calc
+    def indice_em_uso():
+        composto = (input.indice_composto() or "").strip()
+        return normalizar_nome(composto) if composto else input.indice_codigo()
 
-        # garantir a ordem(menor, maior)
-        inicio = min(data_inicial_fmt, data_final_fmt) # garantir qual é a menor data
-        fim = max(data_inicial_fmt, data_final_fmt) # garantirr qual é a maior data
-        return data_inicial_fmt, data_final_fmt, inicio, fim
+    # --- MOTOR DE CÁLCULO ---
+    # o clique em Calcular é separado em duas partes: o período (índice e datas) e o valor. Cada uma só muda
+    # quando o que foi digitado muda, então se o usuário trocar só o valor a tabela de fatores do período
+    # (a parte cara) é reaproveitada e só a multiplicação pelo valor roda de novo.
+    periodo_calculado = reactive.Value(None)  # (índice, data_inicial_fmt, data_final_fmt)
+    valor_calculado = reactive.Value(None)
+    pro_rata_calculado = reactive.Value(None)  # (índice, data_inicial, data_final) com o dia, se pro rata die
+
+    @reactive.Effect
+    @reactive.event(input.button_calcular)
+    def registrar_calculo():
+        datas = datas_convertidas()
+        periodo = None if datas is None else (indice_em_uso(), datas[0], datas[1])
+        # reactive.Value só compara identidade; comparando aqui, um período igual não invalida a tabela de fatores
+        if periodo != periodo_calculado.get():
+            periodo_calculado.set(periodo)
+        if input.valor_nominal() != valor_calculado.get():
+            valor_calculado.set(input.valor_nominal())
+        pro_rata = (indice_em_uso(), input.data_inicial_str(), input.data_final_str()) if datas and input.pro_rata() else None
+        if pro_rata != pro_rata_calculado.get():
+            pro_rata_calculado.set(pro_rata)
+
+    # período e valor do último clique em Calcular; antes do primeiro clique as saídas ficam em branco (req).
+    # as saídas dependem desses valores (e não do botão), então só são refeitas quando o cálculo muda
+    def ultimo_calculo():
+        periodo, valor = periodo_calculado.get(), valor_calculado.get()
+        with reactive.isolate():
+            req(input.button_calcular())
+        return periodo, valor
+
+    # tabela de fatores do período (date, variacao_mensal, fator_acumulado): refeita só quando o período muda.
+    # roda como tarefa estendida, no pool de tarefas (tarefas.py): o event loop fica livre para as outras sessões
+    # e o botão Calcular mostra "Calculando..." enquanto ela roda
+    @ui.bind_task_button(button_id="button_calcular")
+    @reactive.extended_task
+    async def tarefa_fatores(indice_escolhido, data_inicial_fmt, data_final_fmt):
+        # um rastreio por período calculado: com CORRECAO_RASTREIO=1 a espera pela série e a tabela saem no log
+        with rastreio("fatores_periodo"):
+            with etapa("aguardar_indice", indice=indice_escolhido):
+                await aguardar_indice(indice_escolhido)
+            with etapa("tabela_fatores", indice=indice_escolhido):
+                return await executar(
+                    "tabela_fatores", tabela_fatores, indice_escolhido, data_inicial_fmt, data_final_fmt
+                )
+
+    # um período novo cancela o cálculo do anterior, se ainda estiver rodando
+    @reactive.Effect
+    def calcular_fatores():
+        periodo = periodo_calculado.get()
+        tarefa_fatores.cancel()
+        if periodo is not None:
+            tarefa_fatores.invoke(*periodo)
+
+    # o índice ou as datas mudaram enquanto a tabela ainda era calculada: o resultado já não interessa.
+    # o período volta a None para que o próximo clique dispare o cálculo de novo, mesmo que seja o mesmo período
+    @reactive.Effect
+    def cancelar_fatores():
+        datas = datas_convertidas()
+        periodo = None if datas is None else (indice_em_uso(), datas[0], datas[1])
+        with reactive.isolate():
+            if tarefa_fatores.status() == "running" and periodo != periodo_calculado.get():
+                tarefa_fatores.cancel()
+                periodo_calculado.set(None)
 
-    # aplicação do período no índice escolhido no input.
     @reactive.Calc
-    def dados_periodo():
-        indice_escolhido = input.indice_codigo()
-        indice_df = dados_indices[indice_escolhido]
-        data_inicial, data_final, inicio, fim = datas_convertidas()
-        periodo = indice_df.loc[inicio:fim, "VALUE ((% a.m.))"]
-        # valida se as datas existem na série
-        if data_inicial not in indice_df.index or data_final not in indice_df.index:
-            data_inicial_valida = min(indice_df.index)
-            data_final_valida = max(indice_df.index)
-            raise ValueError(
-                f"As datas digitadas não estão no período do {indice_escolhido}. "
-                f"Use entre {data_inicial_valida} até {data_final_valida}."
-            )
-        return periodo, indice_df
+    async def fatores_periodo():
+        if periodo_calculado.get() is None:
+            return None
+        return tarefa_fatores.result()
 
-    # --- MOTOR DE CÁLCULO ---
-    # o data frame gerado aqui é oq será usado para os outputs
+    # o data frame gerado aqui é oq será usado para os outputs: a tabela de fatores vezes o valor
     @reactive.Calc
-    @reactive.event(input.button_calcular)
-    def resultados():
-        valor = input.valor_nominal()
+    async def resultados():
+        periodo, valor = ultimo_calculo()
         if valor is None:
             return None
-
-        dados_periodo_result = dados_periodo()
-        if dados_periodo_result is None:
+        fatores = await fatores_periodo()
+        if fatores is None:
             return None
-        dados_filtrados, indice_df = dados_periodo_result
-        data_inicial_fmt, data_final_fmt, inicio, fim = datas_convertidas()
-
-        # DataFrame operacional (numérico)
-        df_result = pd.DataFrame(dados_filtrados).copy()
-        # insere coluna date (string formatada) como primeira coluna
-        df_result.insert(0, "date", df_result.index.strftime("%m-%Y"))
-
-        # inflação (data_inicial <= data_final)
-        if data_inicial_fmt <= data_final_fmt:
-            fator = 1.0
-            fatores_acumulados = []
-
-            for mes, variacao in df_result["VALUE ((% a.m.))"].items(): # mes nesse caso é o index, o items() retorna o valor da variação de cada index.
-                fator = fator * (1 + variacao / 100)
-                fatores_acumulados.append(fator)
-
-            df_result["fator_acumulado"] = fatores_acumulados # criando a coluna "fator_acumulado"
-
-            # data frame final
-            df_result["valor_corrigido"] = valor * df_result["fator_acumulado"] * fator_historico(data_inicial_fmt)# criando a coluna "valor_corrigido"
-
-
-        # deflação (data_inicial > data_final)
-        else:
-            fator = 1.0
-            fatores_acumulados = []
-
-            for mes, variacao in df_result["VALUE ((% a.m.))"].items():
-                fator = fator * (1 + variacao / 100)
-                fator_deflacionado = 1 / fator
-                fatores_acumulados.append(fator_deflacionado)
-
+        with etapa("aplicar_valor"):
+            return aplicar_valor(fatores, valor)
+    
 
-            df_result["fator_acumulado"] = fatores_acumulados
-            df_result["valor_corrigido"] = valor * df_result["fator_acumulado"] * fator_historico_real_moedaantiga(data_final_fmt)
+    # correção pro rata die do último clique: O(1) no índice diário da série; com ela os KPIs mostram a correção
+    # do dia exato ao dia exato no lugar da última linha da tabela mensal
+    @reactive.Calc
+    async def correcao_diaria():
+        periodo, valor = ultimo_calculo()
+        pedido = pro_rata_calculado.get()
+        if pedido is None or valor is None:
+            return None
+        nome, data_inicial, data_final = pedido
+        await aguardar_indice(nome)
+        return corrigir_pro_rata(nome, data_inicial, data_final, valor)
 
-        # renomeia coluna (mantendo colunas numéricas)
-        df_result.rename(columns={"VALUE ((% a.m.))": "variacao_mensal"}, inplace=True)
+    # --- DOWNLOAD DAS SÉRIES DO IPEADATA E DAS TABELAS DE RESULTADO ---
+    # as tabelas de resultado são gravadas bloco a bloco no pool de tarefas (exportacao.escrever_tabela), no formato
+    # escolhido em "formato das planilhas", e cada pedaço do arquivo é enviado assim que fica pronto
+    def baixar_tabela(nome, blocos, folha, indice=False):
+        return iterar(nome, escrever_tabela(nome, blocos, input.formato_tabela(), folha, indice))
 
-        # garante tipos numéricos (float)
-        df_result["variacao_mensal"] = df_result["variacao_mensal"].astype(float)
-        df_result["fator_acumulado"] = df_result["fator_acumulado"].astype(float)
-        df_result["valor_corrigido"] = df_result["valor_corrigido"].astype(float)
+    # Função para baixar o df_result
+    @session.download(filename=lambda: f"serie_indice.{input.formato_tabela()}")
+    async def download_excel():
+        df = await resultados() # df_result original
+        # versão dos dados com que o resultado foi calculado, para saber de qual divulgação do índice ele veio
+        df = df.assign(versao_dados=df.attrs["versao_dados"])
+        async for pedaco in baixar_tabela("download_excel", em_blocos(df), "resultado"):
+            yield pedaco
+
+    # Função para baixar a planilha enviada já corrigida. Cada bloco é corrigido e gravado em uma thread e enviado
+    # assim que fica pronto, então nem o arquivo de entrada nem o de saída ficam inteiros na memória.
+    # O andamento (linhas corrigidas) aparece numa barra de progresso; se o download for interrompido o
+    # gerador é fechado e os blocos seguintes não são corrigidos.
+    @session.download(filename=lambda: f"correcao_lote.{input.formato_tabela()}")
+    async def download_lote():
+        arquivo = input.arquivo_lote()
+        if not arquivo:
+            raise ValueError("Envie uma planilha (CSV ou XLSX) para a correção em lote.")
+        blocos = corrigir_arquivo(arquivo[0]["datapath"], arquivo[0]["name"], DIAS_PRO_RATA if input.pro_rata() else None)
+        # o progresso conta as linhas corrigidas (um pedaço do arquivo não corresponde a um bloco do lote)
+        contador = {"linhas": 0}
+
+        def contar_linhas(blocos):
+            for bloco in blocos:
+                contador["linhas"] += len(bloco)
+                yield bloco
+
+        pedacos = escrever_tabela("download_lote", contar_linhas(blocos), input.formato_tabela(), "lote")
+        with ui.Progress() as progresso:
+            progresso.set(message="Corrigindo a planilha...")
+            andamento = lambda n: progresso.set(message="Corrigindo a planilha...", detail=f"{contador['linhas']:,} linhas")
+            async for pedaco in iterar("download_lote", pedacos, andamento):
+                yield pedaco
+
+    # Tabela de fatores do índice escolhido até a data final (um fator por mês desde 1970, já com a moeda de cada mês)
+    @session.download(filename=lambda: f"fatores_{indice_em_uso()}_{input.data_final_str():%m-%Y}.{input.formato_tabela()}")
+    async def download_tabela_fatores():
+        nome, formato = indice_em_uso(), input.formato_tabela()
+        data_inicial, data_final, inicio, fim = datas_convertidas()
+        await aguardar_indice(nome)
+        tabela = await executar("download_tabela_fatores", tabela_fatores_alvo, nome, data_final)
+        async for pedaco in iterar("download_tabela_fatores", tabela_fatores_bytes(tabela, formato)):
+            yield pedaco
+
+    # Matriz completa de fatores do índice (data inicial x data final), enviada em pedaços à medida que é gerada
+    @session.download(filename=lambda: f"matriz_fatores_{indice_em_uso()}.{input.formato_tabela()}")
+    async def download_matriz_fatores():
+        nome, formato = indice_em_uso(), input.formato_tabela()
+        serie = await aguardar_indice(nome)
+        pedacos = matriz_fatores_bytes(nome, formato)
+        # cada pedaço é um bloco de LINHAS_BLOCO_MATRIZ datas iniciais
+        blocos = -(-len(serie.variacoes) // LINHAS_BLOCO_MATRIZ)
+        with ui.Progress(min=0, max=blocos) as progresso:
+            progresso.set(0, message="Gerando a matriz de fatores...")
+            andamento = lambda n: progresso.set(min(n, blocos), message="Gerando a matriz de fatores...")
+            async for pedaco in iterar("download_matriz_fatores", pedacos, andamento):
+                yield pedaco
+
+    # Função para baixar as séries brutas do ipeadata, no formato escolhido. Os bytes vêm prontos do
+    # exportacao.bytes_serie (gerados uma vez por versão dos dados e compartilhados entre as sessões).
+    def download_serie(nome, prefixo):
+        @session.download(id=f"download_{prefixo}", filename=lambda: f"{prefixo}_ipeadata.{input.formato_download()}")
+        async def _():
+            formato = input.formato_download()
+            await aguardar_indice(nome)
+            yield await executar("download_serie", bytes_serie, nome, formato)
+
+    for nome, (prefixo, rotulo) in downloads_series.items():
+        download_serie(nome, prefixo)
+
+
+    # --- CORREÇÃO DE PARCELAS ---
+    # todas as parcelas (digitadas ou da planilha enviada) corrigidas de uma vez até a data final, no índice escolhido
+    # (tarefa estendida no pool de tarefas; um clique novo cancela a correção anterior)
+    @ui.bind_task_button(button_id="button_parcelas")
+    @reactive.extended_task
+    async def tarefa_parcelas(nome, data_alvo, arquivo, texto, pro_rata):
+        with rastreio("parcelas"):
+            if arquivo:
+                parcelas = await executar("ler_parcelas", ler_arquivo_parcelas, arquivo[0]["datapath"], arquivo[0]["name"])
+            else:
+                parcelas = await executar("ler_parcelas", ler_parcelas, texto)
+            await aguardar_indice(nome)
+            return await executar("parcelas", corrigir_parcelas, nome, parcelas, data_alvo, pro_rata)
+
+    @reactive.Effect
+    @reactive.event(input.button_parcelas)
+    def calcular_parcelas():
+        datas = datas_convertidas()
+        req(datas)
+        tarefa_parcelas.cancel()
+        # com pro rata die, até o dia exato da data final
+        pro_rata = DIAS_PRO_RATA if input.pro_rata() else None
+        data_alvo = datas[1] if pro_rata is None else input.data_final_str()
+        tarefa_parcelas.invoke(indice_em_uso(), data_alvo, input.arquivo_parcelas(), input.texto_parcelas() or "", pro_rata)
 
-        return df_result
-    
+    @reactive.Calc
+    async def parcelas_corrigidas():
+        return tarefa_parcelas.result()
 
-    # --- DOWNLOAD DAS SÉRIES DO IPEADATA E DO DF_RESULT ---
-    # Função para baixar o df_result
-    @session.download(filename=lambda: "serie_indice.xlsx")
-    def download_excel():
-        df = resultados() # df_result original
-        buffer = io.BytesIO()
-        df.to_excel(buffer, index=False)
-        buffer.seek(0)
-        return buffer
-
-    # Função para baixar as séries brutas do ipeadata
-    #IPCA
-    @session.download(filename=lambda: "ipca_ipeadata.xlsx")
-    def download_ipca():
-        df_ipca = dados_indices["IPCA"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_ipca.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-    
-    # IGP-M
-    @session.download(filename=lambda: "igpm_ipeadata.xlsx")
-    def download_igpm():
-        df_igpm= dados_indices["IGP_M"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_igpm.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-    
-    # IGP-DI
-    @session.download(filename=lambda: "igpdi_ipeadata.xlsx")
-    def download_igpdi():
-        df_igpdi = dados_indices["IGP_DI"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_igpdi.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-
-    # SELIC-OVER
-    @session.download(filename=lambda: "selicover_ipeadata.xlsx")
-    def download_selicover():
-        df_selicover = dados_indices["SELIC_OVER"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_selicover.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-    
-    # INPC
-    @session.download(filename=lambda: "inpc_ipeadata.xlsx")
-    def download_inpc():
-        df_inpc = dados_indices["INPC"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_inpc.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-    
-    # IPC-BR
-    @session.download(filename=lambda: "ipcbr_ipeadata.xlsx")
-    def download_ipcbr():
-        df_ipcbr = dados_indices["IPC_BR"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_ipcbr.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
-    
-    # IPC-FIPE
-    @session.download(filename=lambda: "ipcfipe_ipeadata.xlsx")
-    def download_ipcfipe():
-        df_ipcfipe = dados_indices["IPC_FIPE"]
-        buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
-        df_ipcfipe.to_excel(buffer)
-        buffer.seek(0)
-        return buffer
+    @output
+    @render.data_frame
+    async def df_parcelas():
+        try:
+            tabela, total = await parcelas_corrigidas()
+        except ValueError as erro:
+            return pd.DataFrame({"Aviso": [str(erro)]})
+        moeda = tabela.attrs["moeda_alvo"]
+        display_df = tabela.assign(
+            valor=[f"{x:,.2f}" for x in tabela["valor"].tolist()],
+            fator_acumulado=[f"{x:,.6f}" for x in tabela["fator_acumulado"].tolist()],
+            valor_corrigido=[f"{moeda} {x:,.2f}" for x in tabela["valor_corrigido"].tolist()],
+        ).drop(columns="fator_historico")
+        data_alvo = tabela.attrs["data_alvo"].strftime("%m-%Y" if tabela.attrs["pro_rata"] is None else "%d-%m-%Y")
+        resumo = f"{len(tabela)} parcelas · total corrigido até {data_alvo}: {moeda} {total:,.2f}"
+        return render.DataGrid(display_df, summary=f"Linhas {{start}} a {{end}} de {{total}} · {resumo}")
+
+    @session.download(filename=lambda: f"parcelas_corrigidas.{input.formato_tabela()}")
+    async def download_parcelas():
+        tabela, total = await parcelas_corrigidas()
+        versao = tabela.attrs["versao_dados"]
+        # última linha com o total corrigido das parcelas sem erro
+        linha_total = pd.DataFrame({"data": ["total"], "valor_corrigido": [total], "versao_dados": [versao]})
+        blocos = [*em_blocos(tabela.assign(versao_dados=versao)), linha_total]
+        async for pedaco in baixar_tabela("download_parcelas", blocos, "parcelas"):
+            yield pedaco
 
 
     # --- DATA FRAME COM TODOS OS ÍNDICES PARA FAZER O GRÁFICO COMPARATIVO ---
-    @reactive.Calc
+    # recorte da matriz (meses x índices) já montada no motor; índices ainda carregando ficam de fora.
+    # um índice composto escolhido entra como mais uma linha do gráfico. Roda no pool de tarefas
+    @reactive.extended_task
+    async def tarefa_comparacao(inicio, fim, compostos):
+        return await executar("comparacao", comparacao_periodo, inicio, fim, 100.0, compostos)
+
+    @reactive.Effect
     @reactive.event(input.button_calcular)
     # função para criar um data frame com todos os índices 
-    def todos_indices_periodo():
-        data_inicial, data_final, inicio, fim = datas_convertidas() # puxo a função das datas convertidas
+    def calcular_comparacao():
+        datas = datas_convertidas() # puxo a função das datas convertidas
+        req(datas)
+        data_inicial, data_final, inicio, fim = datas
+        nome = indice_em_uso()
+        tarefa_comparacao.cancel()
+        tarefa_comparacao.invoke(inicio, fim, (nome,) if eh_composto(nome) else ())
 
-        dfs = []
-        for nome, df in dados_indices.items(): # localizo o nome do índice e o data frame do índice no dicionário dados_índices
-            p = df.loc[inicio:fim, "VALUE ((% a.m.))"].copy() # pego o intervalo do período e pego somente a coluna de variação mensal, o loop faz para todos os índices.
-            p = pd.DataFrame(p) # transformo em um data frame
-            p = p.rename(columns={"VALUE ((% a.m.))": "variacao_mensal"})  # renomeio a coluna de variação mensal.
-            p["indice"] = nome #crio uma coluna com o nome de "indice"
-            p["date"] = p.index.strftime("%Y-%m") # crio uma coluna com a data formatada.
-            dfs.append(p) # guarda esse pedaço do DataFrame dentro da lista dfs.
+    @reactive.Calc
+    def todos_indices_periodo():
+        return tarefa_comparacao.result()
 
-        return pd.concat(dfs, axis=0) # o "concat" concatena todos os dataframe verticalmente
+    # a tabela mostrada no gráfico (variação mensal ou acumulado), um índice por coluna
+    @session.download(filename=lambda: f"comparacao_{input.tipo_comparacao()}.{input.formato_tabela()}")
+    async def download_comparacao():
+        variacoes, acumulado = todos_indices_periodo()
+        df = acumulado if input.tipo_comparacao() == "acumulado" else variacoes
+        async for pedaco in baixar_tabela("download_comparacao", em_blocos(df), "comparacao", indice=True):
+            yield pedaco
 
 
 
     # --- KPIs (render.ui usado dentro de value_box) ---
     @output
     @render.ui
-    @reactive.event(input.button_calcular)
     def kpi_valor_nominal():
-        v = input.valor_nominal()
-        data_inicial = input.data_inicial_str()
-        data_final = input.data_final_str()
-        data_inicial_fmt = datetime.combine(data_inicial, datetime.min.time())
-        data_final_fmt = datetime.combine(data_final, datetime.min.time())
-        # Padroniza sempre para o "dd" seja "01"
-        data_inicial_fmt = data_inicial_fmt.replace(day=1)
-        data_final_fmt = data_final_fmt.replace(day=1)
-
-        # teste lógico para pegar o símbolo monetário do valor nominal.
-        if v is None:
+        periodo, v = ultimo_calculo()
+
+        # símbolo monetário do valor nominal, pela data inicial
+        if v is None or periodo is None:
             return "—"
-        elif data_inicial_fmt < data_corte_cruzeiro:
-            return f"Cr$ {v:,.2f}"
-        elif data_inicial_fmt < data_corte_cruzado:
-            return f"Cz$ {v:,.2f}"
-        elif data_inicial_fmt < data_corte_cruzadonovo:
-            return f"NCz$ {v:,.2f}"
-        elif data_inicial_fmt < data_corte_cruzeiro2:
-            return f"Cr$ {v:,.2f}"
-        elif data_inicial_fmt < data_corte_cruzeiroreal:
-            return f"CR$ {v:,.2f}"
-        else:
-            return f"R$ {v:,.2f}"
+        indice_escolhido, data_inicial_fmt, data_final_fmt = periodo
+        return f"{simbolo_moeda(data_inicial_fmt)} {v:,.2f}"
 
 
     @output
     @render.ui
-    @reactive.event(input.button_calcular)
-    def kpi_fator_acumulado():
-        df = resultados()
+    async def kpi_fator_acumulado():
+        diaria = await correcao_diaria()
+        if diaria is not None:
+            return f"{diaria['fator_acumulado']:,.6f}"
+        df = await resultados()
         if df is None or df.empty:
             return "—"
         # pega o último fator acumulado
@@ -500,15 +581,17 @@ def server(input, output, session):
 
     @output
     @render.ui
-    @reactive.event(input.button_calcular)
-    def kpi_inflacao_periodo():
-        df = resultados()
+    async def kpi_inflacao_periodo():
+        diaria = await correcao_diaria()
+        if diaria is not None:
+            return f"{diaria['inflacao_periodo']:,.2f} %"
+        df = await resultados()
         if df is None or df.empty:
             return "—"
         last = df["fator_acumulado"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
         # se inflação (início <= fim), inflação% = (fator - 1) * 100
         # se deflação (início > fim), usamos (1 - fator)*100 para indicar deflação
-        data_inicial_fmt, data_final_fmt, inicio, fim = datas_convertidas()
+        indice_escolhido, data_inicial_fmt, data_final_fmt = periodo_calculado.get()
         if data_inicial_fmt <= data_final_fmt:
             inf = (last - 1) * 100
             return f"{inf:,.2f} %"
@@ -518,127 +601,145 @@ def server(input, output, session):
 
     @output
     @render.ui
-    @reactive.event(input.button_calcular)
-    def kpi_valor_corrigido():
-        df = resultados()
-        data_inicial = input.data_inicial_str()
-        data_final = input.data_final_str()
-        data_inicial_fmt = datetime.combine(data_inicial, datetime.min.time())
-        data_final_fmt = datetime.combine(data_final, datetime.min.time())
-        # Padroniza sempre para o "dd" seja "01"
-        data_inicial_fmt = data_inicial_fmt.replace(day=1)
-        data_final_fmt = data_final_fmt.replace(day=1)
-
+    async def kpi_valor_corrigido():
+        diaria = await correcao_diaria()
+        if diaria is not None:
+            return f"{diaria['moeda']} {diaria['valor_corrigido']:,.2f}"
+        df = await resultados()
         if df is None or df.empty:
             return "—"
-        elif data_final_fmt < data_corte_cruzeiro:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"Cr$ {last:,.2f}"
-        elif data_final_fmt < data_corte_cruzado:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"Cz$ {last:,.2f}"
-        elif data_final_fmt < data_corte_cruzadonovo:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"NCz$ {last:,.2f}"
-        elif data_final_fmt < data_corte_cruzeiro2:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"Cr$ {last:,.2f}"
-        elif data_final_fmt < data_corte_cruzeiroreal:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"CR$ {last:,.2f}"
-        else:
-            last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
-            return f"R$ {last:,.2f}"
+        indice_escolhido, data_inicial_fmt, data_final_fmt = periodo_calculado.get()
+        last = df["valor_corrigido"].iloc[-1] # .iloc[-1] é para acessar a última linha do DataFrame, ou seja, posição negativa significa contar a partir do final.
+        return f"{simbolo_moeda(data_final_fmt)} {last:,.2f}"
 
     # --- Tabela: exibimos uma versão formatada para display (strings) ---
+    # as colunas que não dependem do valor (date, variação, fator) são formatadas uma vez por período
+    @reactive.Calc
+    async def fatores_formatados():
+        fatores = await fatores_periodo()
+        if fatores is None:
+            return None
+        # formata colunas numéricas para visual (mantendo df original em resultados())
+        return pd.DataFrame({
+            "date": fatores["date"],
+            "variacao_mensal": [f"{x:,.2f}" for x in fatores["variacao_mensal"].tolist()],
+            "fator_acumulado": [f"{x:,.6f}" for x in fatores["fator_acumulado"].tolist()],
+        }, index=fatores.index)
+
     @output
     @render.data_frame
-    @reactive.event(input.button_calcular)
-    def df_result():
-        df = resultados()
-        data_inicial = input.data_inicial_str()
-        data_final = input.data_final_str()
-        data_inicial_fmt = datetime.combine(data_inicial, datetime.min.time())
-        data_final_fmt = datetime.combine(data_final, datetime.min.time())
-        # Padroniza sempre para o "dd" seja "01"
-        data_inicial_fmt = data_inicial_fmt.replace(day=1)
-        data_final_fmt = data_final_fmt.replace(day=1)
+    async def df_result():
+        df = await resultados()
 
         if df is None:
             return pd.DataFrame({"Aviso": ["Verifique inputs e datas"]})
-        # cria cópia para exibição (formatada)
-        display_df = df.copy()
-        # formata colunas numéricas para visual (mantendo df original em resultados())
-        display_df["variacao_mensal"] = display_df["variacao_mensal"].map(lambda x: f"{x:,.2f}")
-        display_df["fator_acumulado"] = display_df["fator_acumulado"].map(lambda x: f"{x:,.6f}")
-
-        # teste lógico quando for deflação para colocar o símbolo da moeda de forma correta.
-        if data_final_fmt < data_corte_cruzeiro:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"Cr$ {x:,.2f}")
-        elif data_final_fmt < data_corte_cruzado:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"Cz$ {x:,.2f}")
-        elif data_final_fmt < data_corte_cruzadonovo:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"NCz$ {x:,.2f}")
-        elif data_final_fmt < data_corte_cruzeiro2:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"Cr$ {x:,.2f}")
-        elif data_final_fmt < data_corte_cruzeiroreal:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"CR$ {x:,.2f}")
-        else:
-            display_df["valor_corrigido"] = display_df["valor_corrigido"].map(lambda x: f"R$ {x:,.2f}")
+        # cópia formatada das colunas do período; só o valor corrigido é formatado a cada valor novo
+        indice_escolhido, data_inicial_fmt, data_final_fmt = periodo_calculado.get()
+        # símbolo da moeda vigente na data final (moeda antiga quando for deflação para antes de 1994)
+        simbolo = simbolo_moeda(data_final_fmt)
+        display_df = (await fatores_formatados()).assign(
+            valor_corrigido=[f"{simbolo} {x:,.2f}" for x in df["valor_corrigido"].tolist()]
+        )
 
-        
-        # organiza as ordens das colunas
-        display_df = display_df[["date", "variacao_mensal", "fator_acumulado", "valor_corrigido"]]
-        
-        return render.DataGrid(display_df)
+        # rodapé da tabela com a versão dos dados usada neste cálculo (os dados podem ser atualizados com o app aberto)
+        versao = f"dados {df.attrs['indice']} versão {df.attrs['versao_dados']}, de {df.attrs['atualizada_em']:%d/%m/%Y %H:%M}"
+        return render.DataGrid(display_df, summary=f"Linhas {{start}} a {{end}} de {{total}} · {versao}")
 
-    # --- Gráfico: usa os valores numéricos de resultados() ---
+    # --- Gráficos: um widget por sessão, criado uma única vez ---
+    # os dois gráficos são FigureWidgets montados na abertura da página, sem dependências reativas; a cada cálculo
+    # a figura é montada no pool de tarefas e só as linhas e o layout do widget existente são trocados
+    # (graficos.atualizar_widget), sem mandar de novo o javascript do plotly a cada clique
     @output
-    @render_plotly
+    @render_widget
     def variacao_plot():
-        df = resultados()
-        if df is None or df.empty:
-            return None
-    
-        fig = px.line(
-            df,
-            x=df["date"],
-            y=df["variacao_mensal"],
-            markers=True,
-            title=""
-        )
-        fig.update_layout(
-            xaxis_title="Mês/Ano",
-            yaxis_title="Variação (%)",
-            hovermode="x unified"
-        )
-        return fig
+        from graficos import widget_vazio
+        return widget_vazio()
 
-    
     @output
-    @render_plotly
+    @render_widget
     def comparacao_plot():
-        df = todos_indices_periodo()
-        if df is None or df.empty:
-            return None
-
-        fig = px.line(
-            df,
-            x="date",
-            y="variacao_mensal",
-            color="indice",
-            markers=True,
-            title=""
-        )
-
-        fig.update_layout(
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
-            hovermode="x unified",
-            xaxis_title="Mês/Ano",
-            yaxis_title="Variação Mensal (%)"
-        )
-        return fig
+        from graficos import widget_vazio
+        return widget_vazio()
+
+    # usa os valores numéricos de resultados(): linha única da variação mensal; em períodos longos é reduzida (LTTB)
+    # e desenhada em WebGL. Um período ou índice composto inválido deixa o gráfico vazio (o aviso aparece na
+    # tabela): num efeito, um erro não tratado encerraria a sessão
+    @reactive.Effect
+    async def atualizar_variacao_plot():
+        from graficos import atualizar_widget, figura_linhas
+        widget = variacao_plot.widget
+        try:
+            df = await resultados()
+        except ValueError:
+            df = None
+        fig = None
+        if df is not None and not df.empty:
+            fig = await executar("grafico", figura_linhas, df[["variacao_mensal"]], "Mês/Ano", "Variação (%)")
+        atualizar_widget(widget, fig)
+
+    @reactive.Effect
+    async def atualizar_comparacao_plot():
+        from graficos import atualizar_widget, figura_linhas
+        widget = comparacao_plot.widget
+        try:
+            comparacao = todos_indices_periodo()
+        except ValueError:
+            comparacao = None
+        fig = None
+        if comparacao is not None:
+            # variação mensal ou quanto R$ 100 viram em cada índice ao longo do período
+            variacoes, acumulado = comparacao
+            # a escala log só faz sentido para o acumulado (a variação mensal pode ser negativa)
+            if input.tipo_comparacao() == "acumulado":
+                df, titulo_y, escala_log = acumulado, "R$ 100 corrigidos", input.escala_log()
+            else:
+                df, titulo_y, escala_log = variacoes, "Variação Mensal (%)", False
+            if not df.empty:
+                fig = await executar("grafico", figura_linhas, df, "Mês/Ano", titulo_y, escala_log)
+                fig.update_layout(
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+                    legend_title_text="indice",
+                )
+        atualizar_widget(widget, fig)
 
 
 # fim do server
-app  = App(app_ui, server)
\ No newline at end of file
+app_shiny = App(app_ui, server)
+
+# --- endpoint de prontidão para o load balancer ---
+# 200 quando todas as séries estão carregadas; 503 enquanto alguma ainda carrega (ou falhou)
+def pronto(request):
+    estados = estados_indices()
+    todas_prontas = all(estado == PRONTO for estado in estados.values())
+    return JSONResponse({"pronto": todas_prontas, "indices": estados}, status_code=200 if todas_prontas else 503)
+
+# --- métricas no formato do Prometheus (metricas.py); 404 quando desligadas com CORRECAO_METRICAS=0 ---
+def metricas(request):
+    if not METRICAS_ATIVAS:
+        return PlainTextResponse("métricas desativadas\n", status_code=404)
+    return PlainTextResponse(texto_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# --- atraso do event loop (correcao_event_loop_atraso_segundos) ---
+# um timer de INTERVALO_VIGIA_LOOP_SEGUNDOS mede quanto passou do previsto: é o tempo que qualquer evento pronto
+# (clique, mensagem do websocket, requisição da API) esperou atrás de trabalho síncrono rodando no loop
+INTERVALO_VIGIA_LOOP_SEGUNDOS = 0.1
+
+async def vigiar_event_loop():
+    while True:
+        inicio = time.perf_counter()
+        await asyncio.sleep(INTERVALO_VIGIA_LOOP_SEGUNDOS)
+        atraso = time.perf_counter() - inicio - INTERVALO_VIGIA_LOOP_SEGUNDOS
+        observar("correcao_event_loop_atraso_segundos", max(atraso, 0.0))
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    vigia = asyncio.create_task(vigiar_event_loop()) if METRICAS_ATIVAS else None
+    yield
+    if vigia is not None:
+        vigia.cancel()
+
+# a API JSON (api_correcao) e os endpoints de prontidão e de métricas são servidos no mesmo processo, ao lado do Shiny
+app = Starlette(
+    routes=[Route("/pronto", pronto), Route("/metrics", metricas), *rotas_api, Mount("/", app=app_shiny)],
+    lifespan=ciclo_de_vida,
+)
\ No newline at end of file
@@ -0,0 +1,235 @@
+# --- benchmarks do motor de correção, da inicialização e das exportações ---
+# roda sem rede, sobre as fixtures das 7 séries (benchmarks/fixtures.py). Saída em JSON para comparar commits:
+#   python benchmarks/bench_correcao.py --saida bench.json
+#   python benchmarks/bench_correcao.py --comparar bench_antes.json     (compara com uma execução anterior)
+#   python benchmarks/bench_correcao.py --filtro lote                   (só os casos com "lote" no nome)
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from datetime import datetime
+
+import fixtures
+
+RAIZ = fixtures.RAIZ
+DIRETORIO_FIXTURES, TIPO_FIXTURES = fixtures.diretorio_fixtures()
+fixtures.configurar_ambiente(DIRETORIO_FIXTURES)
+
+import numpy as np
+import pandas as pd
+
+import exportacao
+import motor_correcao as motor
+
+
+# mede "funcao" depois de um aquecimento; devolve estatísticas em segundos
+def medir(nome, funcao, repeticoes=20, linhas=None):
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    resultado = {
+        "nome": nome,
+        "repeticoes": repeticoes,
+        "mediana_s": statistics.median(tempos),
+        "p95_s": tempos[min(len(tempos) - 1, int(0.95 * len(tempos)))],
+        "min_s": tempos[0],
+    }
+    if linhas:
+        resultado["linhas_por_s"] = linhas / resultado["mediana_s"]
+    return resultado
+
+
+# tempo de um trecho de código em um processo python novo (importação, inicialização)
+def medir_subprocesso(nome, codigo, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=RAIZ, env=os.environ, capture_output=True, text=True, check=True
+        )
+        tempos.append(float(saida.stdout.strip().splitlines()[-1]))
+    tempos.sort()
+    return {"nome": nome, "repeticoes": repeticoes, "mediana_s": statistics.median(tempos), "p95_s": tempos[-1], "min_s": tempos[0]}
+
+
+def lote_aleatorio(linhas, semente=0, freq="MS"):
+    rng = np.random.default_rng(semente)
+    meses = pd.date_range("1995-01-01", "2025-01-01", freq=freq)
+    nomes = np.array(list(motor.indices))
+    return pd.DataFrame({
+        "valor": rng.uniform(1, 10_000, linhas),
+        "data_inicial": meses[rng.integers(0, len(meses), linhas)],
+        "data_final": meses[rng.integers(0, len(meses), linhas)],
+        "indice": nomes[rng.integers(0, len(nomes), linhas)],
+    })
+
+
+def medir_lote(nome, linhas, repeticoes, pro_rata=None):
+    lote = lote_aleatorio(linhas, freq="MS" if pro_rata is None else "D")
+    return medir(nome, lambda: motor.corrigir_lote(lote, pro_rata), repeticoes, linhas=linhas)
+
+
+def medir_exportacao(nome, formato):
+    serie = motor.serie_pronta("IGP_DI")
+    return medir(nome, lambda: exportacao.gerar_bytes("IGP_DI", motor.dados_brutos(serie), formato), 5)
+
+
+def medir_exportacao_resultado(nome, formato):
+    tabela = motor.tabela_correcao("IGP_DI", *LONGO, 100.0)
+    return medir(nome, lambda: gravar(exportacao.escrever_tabela(nome, [tabela], formato)), 5)
+
+
+# lote corrigido de 100 mil linhas gravado em streaming (download_lote)
+def medir_exportacao_lote(nome, formato):
+    corrigido = motor.corrigir_lote(lote_aleatorio(100_000))
+    return medir(nome, lambda: gravar(exportacao.escrever_tabela(nome, exportacao.em_blocos(corrigido), formato)), 3, linhas=len(corrigido))
+
+
+# consome os pedaços de um arquivo gerado em streaming (sem juntar) e devolve o tamanho total
+def gravar(pedacos):
+    return sum(map(len, pedacos))
+
+
+def medir_so_valor(nome):
+    fatores = motor.tabela_fatores("IGP_DI", *LONGO)
+    return medir(nome, lambda: motor.aplicar_valor(fatores, 250.0), 200)
+
+
+def medir_parcelas(nome):
+    lote = lote_aleatorio(10_000)
+    parcelas = pd.DataFrame({"data": lote["data_inicial"], "valor": lote["valor"]})
+    return medir(nome, lambda: motor.corrigir_parcelas("IGP_DI", parcelas, LONGO[1]), 20, linhas=len(parcelas))
+
+
+CURTO = (datetime(2024, 1, 1), datetime(2024, 12, 1))
+LONGO = (datetime(1975, 1, 1), datetime(2025, 1, 1))
+DIAS = (datetime(2019, 1, 17), datetime(2024, 12, 3))
+
+
+# lista de (nome, função que mede o caso); os dados de cada caso só são montados se ele for rodar
+def casos():
+    lista = [
+        # correção individual: O(1) (API/KPIs) e a tabela mês a mês (resultados()), inflação e deflação
+        ("corrigir_12m_inflacao", lambda n: medir(n, lambda: motor.corrigir("IPCA", *CURTO, 100.0), 2000)),
+        ("corrigir_50a_inflacao", lambda n: medir(n, lambda: motor.corrigir("IGP_DI", *LONGO, 100.0), 2000)),
+        ("corrigir_50a_deflacao", lambda n: medir(n, lambda: motor.corrigir("IGP_DI", *reversed(LONGO), 100.0), 2000)),
+        ("tabela_12m_inflacao", lambda n: medir(n, lambda: motor.tabela_correcao("IPCA", *CURTO, 100.0), 200)),
+        ("tabela_50a_inflacao", lambda n: medir(n, lambda: motor.tabela_correcao("IGP_DI", *LONGO, 100.0), 200)),
+        ("tabela_50a_deflacao", lambda n: medir(n, lambda: motor.tabela_correcao("IGP_DI", *reversed(LONGO), 100.0), 200)),
+        # só o valor mudou: a tabela de fatores do período é reaproveitada e só a multiplicação roda
+        ("tabela_50a_so_valor", medir_so_valor),
+        # recorte de um período na série (aritmética de meses + validação das datas)
+        ("fatia_50a", lambda n: medir(n, lambda: motor.dados_periodo(motor.serie_pronta("IGP_DI"), *LONGO, *LONGO), 2000)),
+        # tabela de fatores de todos os meses até a data alvo e a matriz completa (data inicial x data final) em csv
+        ("tabela_fatores_alvo", lambda n: medir(n, lambda: motor.calcular_tabela_fatores_alvo(
+            motor.serie_pronta("IGP_DI"), LONGO[1], motor.DATA_INICIAL_TABELAS
+        ), 200)),
+        ("matriz_fatores_csv", lambda n: medir(n, lambda: gravar(exportacao.matriz_fatores_bytes("IGP_DI", "csv")), 3)),
+        ("matriz_fatores_xlsx", lambda n: medir(n, lambda: gravar(exportacao.matriz_fatores_bytes("IGP_DI", "xlsx")), 3)),
+        # fluxo de 10 mil parcelas corrigidas até a mesma data alvo
+        ("parcelas_10000", medir_parcelas),
+        # correção em lote
+        ("lote_10000", lambda n: medir_lote(n, 10_000, 20)),
+        ("lote_100000", lambda n: medir_lote(n, 100_000, 5)),
+        ("lote_1000000", lambda n: medir_lote(n, 1_000_000, 3)),
+        # pro rata die (datas com dia, índice diário): deve custar o mesmo que o mensal
+        ("corrigir_pro_rata_uteis", lambda n: medir(n, lambda: motor.corrigir_pro_rata("SELIC_OVER", *DIAS, 100.0, "uteis"), 2000)),
+        ("lote_1000000_pro_rata", lambda n: medir_lote(n, 1_000_000, 3, "corridos")),
+        # comparação entre índices
+        ("comparacao_12m", lambda n: medir(n, lambda: motor.comparacao_periodo(*CURTO), 200)),
+        ("comparacao_50a", lambda n: medir(n, lambda: motor.comparacao_periodo(*LONGO), 200)),
+    ]
+    # exportações (geração dos bytes, sem o cache por versão), o resultado (download_excel) e o lote corrigido
+    for formato in exportacao.formatos_exportacao:
+        lista.append((f"exportar_serie_{formato}", lambda n, formato=formato: medir_exportacao(n, formato)))
+    lista.append(("exportar_resultado_xlsx", lambda n: medir_exportacao_resultado(n, "xlsx")))
+    for formato in exportacao.formatos_tabela:
+        lista.append((f"exportar_lote_100000_{formato}", lambda n, formato=formato: medir_exportacao_lote(n, formato)))
+    # importação e inicialização (processo novo)
+    lista.append(("importar_motor", lambda n: medir_subprocesso(
+        n, "import time; t = time.perf_counter(); import motor_correcao; print(time.perf_counter() - t)"
+    )))
+    lista.append(("inicializar_app_ate_pronto", lambda n: medir_subprocesso(
+        n,
+        "import time; t = time.perf_counter(); import app_correcao, motor_correcao as m\n"
+        "for nome in m.indices: m.serie_pronta(nome)\n"
+        "print(time.perf_counter() - t)",
+    )))
+    return lista
+
+
+# bytes ocupados pelas séries carregadas (variações + índice de fatores das 7 séries)
+def memoria_series():
+    return int(sum(
+        serie.variacoes.nbytes + serie.fatores.nbytes for serie in map(motor.serie_pronta, motor.indices)
+    ))
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def comparar(atual, anterior, tolerancia=0.10):
+    antes = {caso["nome"]: caso for caso in anterior["resultados"]}
+    print(f"{'caso':32} {'antes (ms)':>12} {'agora (ms)':>12} {'razão':>8}")
+    for caso in atual["resultados"]:
+        if caso["nome"] not in antes:
+            continue
+        a, b = antes[caso["nome"]]["mediana_s"], caso["mediana_s"]
+        marca = "  <- mais lento" if b > a * (1 + tolerancia) else ""
+        print(f"{caso['nome']:32} {a * 1000:12.3f} {b * 1000:12.3f} {b / a:8.2f}{marca}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks offline do motor de correção monetária")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    parser.add_argument("--filtro", default="", help="roda só os casos cujo nome contém este texto")
+    args = parser.parse_args()
+
+    motor.iniciar_carga()
+    for nome in motor.indices:
+        motor.serie_pronta(nome)
+
+    resultados = []
+    for nome, executar in casos():
+        if args.filtro not in nome:
+            continue
+        resultado = executar(nome)
+        resultados.append(resultado)
+        print(f"{nome:32} {resultado['mediana_s'] * 1000:10.3f} ms", file=sys.stderr)
+
+    relatorio = {
+        "commit": commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "fixtures": TIPO_FIXTURES,
+        "memoria_series_bytes": memoria_series(),
+        "resultados": resultados,
+    }
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(relatorio, json.load(arquivo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+# --- teste de carga do app: muitas sessões do Shiny ao mesmo tempo, sem rede ---
+# sobe o app (um processo uvicorn por worker, sobre as fixtures das séries) e simula N sessões, como navegadores:
+# cada uma troca o índice, as datas e o valor, clica em Calcular, espera os KPIs, a tabela e os gráficos chegarem
+# e baixa as planilhas de resultado; repete até acabar a duração. Ao mesmo tempo, uma sonda pede /pronto a cada
+# 200 ms em cada worker (o tempo de resposta de uma requisição leve sob carga).
+#   python benchmarks/carga_sessoes.py --sessoes 20 --duracao 60 --saida carga.json
+#   python benchmarks/carga_sessoes.py --sessoes 50 --workers 2 --comparar carga_antes.json
+# as sessões são distribuídas entre os workers como um balanceador com sessão fixa faria (o websocket e os
+# downloads de uma sessão vão sempre ao mesmo processo). Variáveis CORRECAO_* do ambiente valem para o app
+# (por exemplo CORRECAO_TAREFAS_MAX ou CORRECAO_COMPARTILHAR=1).
+# relatório: percentis de latência e vazão por ação, atraso do event loop de cada worker (histograma
+# correcao_event_loop_atraso_segundos do /metrics, só o intervalo do teste) e memória (RSS) de cada worker.
+# as sessões falam com o app pelo pacote websockets (no requirements.txt), o mesmo que o uvicorn usa com --ws websockets.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+
+from datetime import datetime
+
+import websockets
+
+import fixtures
+
+RAIZ = fixtures.RAIZ
+DIRETORIO_FIXTURES, TIPO_FIXTURES = fixtures.diretorio_fixtures()
+fixtures.configurar_ambiente(DIRETORIO_FIXTURES)
+
+from exportacao import downloads_series
+from motor_correcao import indices
+
+HOST = "127.0.0.1"
+PRAZO_SEGUNDOS = 120.0  # tempo máximo de uma ação (cálculo ou download) antes de contar como falha
+INTERVALO_SONDA_SEGUNDOS = 0.2
+INTERVALO_MEMORIA_SEGUNDOS = 0.5
+
+# saídas que um clique em Calcular atualiza: o cálculo só termina quando todas chegaram (os gráficos são widgets
+# criados uma vez por sessão: depois da abertura, chegam como mensagens do widget, não como valores de saída)
+saidas_calculo = (
+    "kpi_inflacao_periodo",
+    "kpi_fator_acumulado",
+    "kpi_valor_corrigido",
+    "df_result",
+    "variacao_plot",
+    "comparacao_plot",
+)
+# downloads depois de cada cálculo: as tabelas de resultado (escrever_tabela, no formato_tabela das entradas) e os
+# botões das séries brutas (exportacao.bytes_serie, no formato_download), com os mesmos ids do app. Ficam de fora
+# download_lote (precisa de uma planilha enviada), download_parcelas (precisa das parcelas corrigidas) e
+# download_matriz_fatores (a matriz inteira a cada clique); entram com --downloads
+downloads_padrao = ",".join(
+    ["download_excel", "download_tabela_fatores", "download_comparacao"]
+    + [f"download_{prefixo}" for prefixo, _ in downloads_series.values()]
+)
+
+
+# entradas iniciais de uma sessão, como o navegador manda ao abrir a página
+def entradas_iniciais(porta):
+    entradas = {
+        "indice_codigo": "IPCA",
+        "indice_composto": "",
+        "data_inicial_str:shiny.date": "2025-01-01",
+        "data_final_str:shiny.date": "2025-02-01",
+        "pro_rata": False,
+        "valor_nominal": 100,
+        "button_calcular:shiny.action": 0,
+        "button_parcelas:shiny.action": 0,
+        "formato_tabela": "xlsx",
+        "formato_download": "xlsx",
+        "texto_parcelas": "",
+        "tipo_comparacao": "variacao",
+        "escala_log": False,
+        ".clientdata_url_protocol": "http:",
+        ".clientdata_url_hostname": HOST,
+        ".clientdata_url_port": str(porta),
+        ".clientdata_url_pathname": "/",
+        ".clientdata_url_search": "",
+    }
+    for saida in (*saidas_calculo, "kpi_valor_nominal", "df_parcelas"):
+        entradas[f".clientdata_output_{saida}_hidden"] = False
+    return entradas
+
+
+# índice, período e valor sorteados para um clique
+def sortear_entradas(rng):
+    inicio = rng.randrange(1995 * 12, 2024 * 12)
+    fim = rng.randrange(inicio + 1, 2025 * 12)
+    mes = lambda n: f"{n // 12}-{n % 12 + 1:02d}-01"
+    return {
+        "indice_codigo": rng.choice(list(indices)),
+        "data_inicial_str:shiny.date": mes(inicio),
+        "data_final_str:shiny.date": mes(fim),
+        "valor_nominal": round(rng.uniform(1, 100_000), 2),
+    }
+
+
+# --- HTTP mínimo sobre asyncio (sem threads no gerador de carga) ---
+# devolve o status, o tamanho do corpo, se ele chegou inteiro (um download que falha no meio já respondeu 200,
+# mas termina sem o último pedaço) e, se pedido, o corpo (ainda com a codificação em pedaços, se houver)
+async def pedir(porta, caminho, guardar_corpo=False):
+    leitor, escritor = await asyncio.open_connection(HOST, porta)
+    try:
+        escritor.write(f"GET {caminho} HTTP/1.1\r\nHost: {HOST}:{porta}\r\nConnection: close\r\n\r\n".encode())
+        status = int((await leitor.readline()).split()[1])
+        cabecalhos = {}
+        while (linha := await leitor.readline()) not in (b"\r\n", b""):
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        corpo = []
+        total = 0
+        final = b""
+        while pedaco := await leitor.read(1 << 16):
+            total += len(pedaco)
+            final = (final + pedaco)[-5:]
+            if guardar_corpo:
+                corpo.append(pedaco)
+        if cabecalhos.get("transfer-encoding") == "chunked":
+            inteiro = final == b"0\r\n\r\n"
+        else:
+            inteiro = total == int(cabecalhos.get("content-length", total))
+        return status, total, inteiro, b"".join(corpo)
+    finally:
+        escritor.close()
+
+
+class Registro:
+    def __init__(self):
+        self.tempos = {}  # ação -> [segundos]
+        self.falhas = {}  # ação -> número de falhas
+        self.ativo = False  # só registra dentro da janela do teste (fora da subida das sessões)
+
+    def anotar(self, acao, segundos, ok):
+        if not self.ativo:
+            return
+        if ok:
+            self.tempos.setdefault(acao, []).append(segundos)
+        else:
+            self.falhas[acao] = self.falhas.get(acao, 0) + 1
+
+
+# --- uma sessão simulada ---
+class Sessao:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.id = None
+        self.recebidas = set()
+        self.erros = {}
+        self.graficos = {}  # id do widget (model_id) -> saída; os gráficos são atualizados por mensagens do widget
+        self.calculando = False  # botão Calcular ocupado (tarefa estendida da tabela de fatores rodando)
+        self.chegou = asyncio.Event()
+
+    async def ler(self):
+        async for mensagem in self.websocket:
+            dados = json.loads(mensagem)
+            if "config" in dados:
+                self.id = dados["config"]["sessionId"]
+            if dados.get("values") or dados.get("errors"):
+                self.recebidas.update(dados.get("values") or {})
+                for saida, valor in (dados.get("values") or {}).items():
+                    if isinstance(valor, dict) and "model_id" in valor:
+                        self.graficos[valor["model_id"]] = saida
+                for saida, erro in (dados.get("errors") or {}).items():
+                    self.recebidas.add(saida)
+                    if erro.get("message"):
+                        self.erros[saida] = erro["message"]
+                self.chegou.set()
+            comunicacao = (dados.get("custom") or {}).get("shinywidgets_comm_msg")
+            if comunicacao is not None:
+                saida = self.graficos.get(json.loads(comunicacao)["content"]["comm_id"])
+                if saida is not None:
+                    self.recebidas.add(saida)
+                    self.chegou.set()
+            for mensagem_entrada in dados.get("inputMessages") or []:
+                if mensagem_entrada["id"] == "button_calcular":
+                    self.calculando = mensagem_entrada["message"].get("state") == "busy"
+                    self.chegou.set()
+
+    # todas as saídas chegaram depois do clique e o botão não está ocupado: se o período mudou, as saídas podem
+    # chegar uma vez com o resultado anterior, junto com o botão ficando ocupado, e de novo ao fim da tarefa
+    async def esperar_saidas(self, saidas):
+        while self.calculando or not set(saidas) <= self.recebidas:
+            await self.chegou.wait()
+            self.chegou.clear()
+
+
+async def simular_sessao(numero, porta, atraso, fim, args, registro):
+    rng = random.Random(args.semente * 100_003 + numero)
+    downloads = [nome for nome in args.downloads.split(",") if nome]
+    await asyncio.sleep(atraso)
+    async with websockets.connect(f"ws://{HOST}:{porta}/websocket/", max_size=None) as websocket:
+        sessao = Sessao(websocket)
+        leitor = asyncio.create_task(sessao.ler())
+        try:
+            # página aberta: as saídas chegam uma vez (em branco) antes do primeiro clique
+            await websocket.send(json.dumps({"method": "init", "data": entradas_iniciais(porta)}))
+            await asyncio.wait_for(sessao.esperar_saidas(saidas_calculo), PRAZO_SEGUNDOS)
+            cliques = 0
+            while time.perf_counter() < fim:
+                cliques += 1
+                sessao.recebidas.clear()
+                sessao.erros.clear()
+                inicio = time.perf_counter()
+                await websocket.send(json.dumps({
+                    "method": "update",
+                    "data": {**sortear_entradas(rng), "button_calcular:shiny.action": cliques},
+                }))
+                try:
+                    await asyncio.wait_for(sessao.esperar_saidas(saidas_calculo), PRAZO_SEGUNDOS)
+                    registro.anotar("calcular", time.perf_counter() - inicio, not sessao.erros)
+                except asyncio.TimeoutError:
+                    registro.anotar("calcular", PRAZO_SEGUNDOS, False)
+
+                for nome in downloads:
+                    inicio = time.perf_counter()
+                    try:
+                        status, total, inteiro, _ = await asyncio.wait_for(
+                            pedir(porta, f"/session/{sessao.id}/download/{nome}?w="), PRAZO_SEGUNDOS
+                        )
+                        registro.anotar(nome, time.perf_counter() - inicio, status == 200 and inteiro and total > 0)
+                    except (asyncio.TimeoutError, OSError):
+                        registro.anotar(nome, PRAZO_SEGUNDOS, False)
+
+                if args.pensar > 0:
+                    await asyncio.sleep(rng.expovariate(1 / args.pensar))
+        finally:
+            leitor.cancel()
+
+
+# tempo de resposta de /pronto (requisição leve, atendida no event loop) durante o teste
+async def sondar(porta, fim, registro):
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        try:
+            status, _, _, _ = await asyncio.wait_for(pedir(porta, "/pronto"), PRAZO_SEGUNDOS)
+            registro.anotar("sonda_pronto", time.perf_counter() - inicio, status == 200)
+        except (asyncio.TimeoutError, OSError):
+            registro.anotar("sonda_pronto", PRAZO_SEGUNDOS, False)
+        await asyncio.sleep(INTERVALO_SONDA_SEGUNDOS)
+
+
+# --- workers: processos do app, memória e atraso do event loop ---
+def iniciar_workers(quantidade, porta_inicial):
+    workers = []
+    for porta in range(porta_inicial, porta_inicial + quantidade):
+        processo = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app_correcao:app", "--host", HOST, "--port", str(porta),
+             "--log-level", "warning", "--ws", "websockets"],
+            cwd=RAIZ, env=os.environ,
+        )
+        workers.append({"porta": porta, "processo": processo, "rss_max_bytes": 0})
+    for worker in workers:
+        esperar_pronto(worker)
+    return workers
+
+
+def esperar_pronto(worker, prazo=PRAZO_SEGUNDOS):
+    limite = time.perf_counter() + prazo
+    while time.perf_counter() < limite:
+        if worker["processo"].poll() is not None:
+            raise RuntimeError(f"o worker da porta {worker['porta']} terminou ao iniciar")
+        try:
+            with urllib.request.urlopen(f"http://{HOST}:{worker['porta']}/pronto", timeout=2) as resposta:
+                if resposta.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"o worker da porta {worker['porta']} não ficou pronto em {prazo:.0f} s")
+
+
+def parar_workers(workers):
+    for worker in workers:
+        worker["processo"].terminate()
+    for worker in workers:
+        try:
+            worker["processo"].wait(10)
+        except subprocess.TimeoutExpired:
+            worker["processo"].kill()
+
+
+# memória residente (VmRSS) e pico (VmHWM) do processo, em bytes; None fora do Linux
+def memoria_processo(pid):
+    try:
+        with open(f"/proc/{pid}/status") as arquivo:
+            campos = dict(linha.split(":", 1) for linha in arquivo if ":" in linha)
+    except OSError:
+        return None, None
+    bytes_ = lambda campo: int(campos[campo].split()[0]) * 1024 if campo in campos else None
+    return bytes_("VmRSS"), bytes_("VmHWM")
+
+
+async def acompanhar_memoria(workers, fim):
+    while time.perf_counter() < fim:
+        for worker in workers:
+            rss, _ = memoria_processo(worker["processo"].pid)
+            worker["rss_max_bytes"] = max(worker["rss_max_bytes"], rss or 0)
+        await asyncio.sleep(INTERVALO_MEMORIA_SEGUNDOS)
+
+
+# baldes acumulados (limite -> contagem), soma e total do histograma de atraso do event loop em /metrics
+async def histograma_atraso(porta):
+    _, _, _, corpo = await pedir(porta, "/metrics", guardar_corpo=True)
+    baldes, soma, total = {}, 0.0, 0
+    for linha in corpo.decode().splitlines():
+        if not linha.startswith("correcao_event_loop_atraso_segundos"):
+            continue
+        nome, valor = linha.rsplit(" ", 1)
+        if "_bucket" in nome:
+            baldes[float(nome.split('le="')[1].rstrip('"}'))] = int(valor)
+        elif nome.endswith("_sum"):
+            soma = float(valor)
+        elif nome.endswith("_count"):
+            total = int(valor)
+    return baldes, soma, total
+
+
+# resumo do atraso entre duas leituras do histograma: média e o limite do balde onde caem p50/p99
+def resumir_atraso(antes, depois):
+    baldes = {limite: contagem - antes[0].get(limite, 0) for limite, contagem in depois[0].items()}
+    total = depois[2] - antes[2]
+    if total <= 0:
+        return {"amostras": 0}
+    ate = lambda q: next((limite for limite, contagem in sorted(baldes.items()) if contagem >= q * total), None)
+    return {
+        "amostras": total,
+        "media_s": (depois[1] - antes[1]) / total,
+        "p50_ate_s": ate(0.50),
+        "p99_ate_s": ate(0.99),
+    }
+
+
+def percentis(tempos, falhas, segundos):
+    tempos = sorted(tempos)
+    n = len(tempos)
+    posicao = lambda q: tempos[min(n - 1, int(q * n))]
+    resumo = {"n": n, "falhas": falhas, "por_s": n / segundos}
+    if n:
+        resumo.update(media_s=sum(tempos) / n, p50_s=posicao(0.50), p90_s=posicao(0.90), p99_s=posicao(0.99), max_s=tempos[-1])
+    return resumo
+
+
+async def rodar_carga(args, workers):
+    registro = Registro()
+    rampa = min(args.rampa, args.duracao)
+    inicio = time.perf_counter()
+    fim = inicio + rampa + args.duracao
+    tarefas = [
+        asyncio.create_task(simular_sessao(
+            numero, workers[numero % len(workers)]["porta"], rampa * numero / args.sessoes, fim, args, registro
+        ))
+        for numero in range(args.sessoes)
+    ]
+    tarefas += [asyncio.create_task(sondar(worker["porta"], fim, registro)) for worker in workers]
+    tarefas.append(asyncio.create_task(acompanhar_memoria(workers, fim)))
+
+    # as medidas só contam depois que todas as sessões subiram
+    await asyncio.sleep(rampa)
+    atrasos_antes = [await histograma_atraso(worker["porta"]) for worker in workers]
+    registro.ativo = True
+    janela = time.perf_counter()
+    await asyncio.sleep(max(fim - janela, 0))
+    registro.ativo = False
+    segundos = time.perf_counter() - janela
+    atrasos_depois = [await histograma_atraso(worker["porta"]) for worker in workers]
+    resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+    falhas_sessoes = [repr(erro) for erro in resultados if isinstance(erro, BaseException)]
+
+    acoes = sorted(set(registro.tempos) | set(registro.falhas))
+    return {
+        "segundos_medidos": segundos,
+        "acoes": {
+            acao: percentis(registro.tempos.get(acao, []), registro.falhas.get(acao, 0), segundos) for acao in acoes
+        },
+        "sessoes_com_erro": falhas_sessoes,
+        "workers": [
+            {
+                "porta": worker["porta"],
+                "atraso_event_loop": resumir_atraso(antes, depois),
+                "rss_max_bytes": worker["rss_max_bytes"],
+                "rss_final_bytes": memoria_processo(worker["processo"].pid)[0],
+                "pico_rss_bytes": memoria_processo(worker["processo"].pid)[1],
+            }
+            for worker, antes, depois in zip(workers, atrasos_antes, atrasos_depois)
+        ],
+    }
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def imprimir(relatorio):
+    print(f"{'ação':26} {'n':>7} {'falhas':>7} {'por s':>8} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} {'máx (ms)':>10}", file=sys.stderr)
+    for acao, resumo in relatorio["acoes"].items():
+        tempos = "".join(f" {resumo[k] * 1000:10.1f}" if k in resumo else f" {'-':>10}" for k in ("p50_s", "p90_s", "p99_s", "max_s"))
+        print(f"{acao:26} {resumo['n']:7d} {resumo['falhas']:7d} {resumo['por_s']:8.2f}{tempos}", file=sys.stderr)
+    for worker in relatorio["workers"]:
+        atraso = worker["atraso_event_loop"]
+        texto_atraso = (
+            f"atraso do loop médio {atraso['media_s'] * 1000:.1f} ms, p99 <= {atraso['p99_ate_s'] * 1000:g} ms"
+            if atraso["amostras"] else "atraso do loop indisponível (CORRECAO_METRICAS=0?)"
+        )
+        print(f"worker :{worker['porta']}: {texto_atraso}, RSS máx {worker['rss_max_bytes'] / 2**20:.0f} MiB", file=sys.stderr)
+    for erro in relatorio["sessoes_com_erro"]:
+        print(f"sessão com erro: {erro}", file=sys.stderr)
+
+
+def comparar(atual, anterior, tolerancia=0.10):
+    antes = anterior["acoes"]
+    print(f"{'ação':26} {'p50 antes':>10} {'p50 agora':>10} {'p99 antes':>10} {'p99 agora':>10} {'razão p99':>10}")
+    for acao, resumo in atual["acoes"].items():
+        if acao not in antes or "p99_s" not in resumo or "p99_s" not in antes[acao]:
+            continue
+        a, b = antes[acao]["p99_s"], resumo["p99_s"]
+        marca = "  <- mais lento" if b > a * (1 + tolerancia) else ""
+        print(
+            f"{acao:26} {antes[acao]['p50_s'] * 1000:10.1f} {resumo['p50_s'] * 1000:10.1f} "
+            f"{a * 1000:10.1f} {b * 1000:10.1f} {b / a:10.2f}{marca}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga offline do app: sessões do Shiny simultâneas")
+    parser.add_argument("--sessoes", type=int, default=10, help="sessões simultâneas (padrão: 10)")
+    parser.add_argument("--workers", type=int, default=1, help="processos do app (padrão: 1)")
+    parser.add_argument("--duracao", type=float, default=30.0, help="segundos medidos, depois da subida (padrão: 30)")
+    parser.add_argument("--rampa", type=float, default=5.0, help="segundos para abrir todas as sessões (padrão: 5)")
+    parser.add_argument("--pensar", type=float, default=1.0, help="pausa média entre os cliques de uma sessão, em segundos (padrão: 1)")
+    parser.add_argument(
+        "--downloads", default=downloads_padrao,
+        help=f"ids dos downloads do app após cada cálculo (padrão: {downloads_padrao}; fora do padrão: "
+        "download_lote, download_parcelas e download_matriz_fatores)",
+    )
+    parser.add_argument("--porta", type=int, default=8900, help="porta do primeiro worker (padrão: 8900)")
+    parser.add_argument("--semente", type=int, default=0, help="semente das entradas sorteadas")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    workers = iniciar_workers(args.workers, args.porta)
+    try:
+        resultado = asyncio.run(rodar_carga(args, workers))
+    finally:
+        parar_workers(workers)
+
+    relatorio = {
+        "commit": commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "nucleos": os.cpu_count(),
+        "fixtures": TIPO_FIXTURES,
+        "configuracao": {
+            "sessoes": args.sessoes,
+            "workers": args.workers,
+            "duracao_s": args.duracao,
+            "pensar_s": args.pensar,
+            "downloads": args.downloads,
+            "semente": args.semente,
+            "ambiente": {nome: valor for nome, valor in os.environ.items() if nome.startswith("CORRECAO_")},
+        },
+        **resultado,
+    }
+    imprimir(relatorio)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            arquivo.write(texto)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(relatorio, json.load(arquivo))
+
+
+if __name__ == "__main__":
+    main()
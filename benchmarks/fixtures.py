@@ -0,0 +1,95 @@
+# --- fixtures das séries para rodar benchmarks sem rede ---
+#   python benchmarks/fixtures.py gravar      -> baixa as 7 séries do Ipeadata (precisa de rede, uma vez) para benchmarks/fixtures/
+#   python benchmarks/fixtures.py sinteticas  -> gera séries sintéticas determinísticas (sem rede) em benchmarks/fixtures_sinteticas/
+# os arquivos têm o mesmo formato do cache_indices (um parquet por índice), então basta apontar o
+# CORRECAO_CACHE_DIR para o diretório. As fixtures gravadas têm prioridade; as sintéticas só existem para
+# que os benchmarks rodem em máquinas sem rede e sem gravação (os números ficam comparáveis entre commits,
+# mas não são os dados reais).
+import os
+import sys
+import zlib
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_GRAVADAS = os.path.join(RAIZ, "benchmarks", "fixtures")
+DIR_SINTETICAS = os.path.join(RAIZ, "benchmarks", "fixtures_sinteticas")
+
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+# início aproximado de cada série no Ipeadata (só usado nas sintéticas)
+inicio_series = {
+    "IPCA": "1979-12-01",
+    "IGP_M": "1989-06-01",
+    "IGP_DI": "1944-02-01",
+    "SELIC_OVER": "1974-01-01",
+    "INPC": "1979-04-01",
+    "IPC_BR": "1990-01-01",
+    "IPC_FIPE": "1939-01-01",
+}
+
+
+def gravar():
+    from cache_indices import CacheParquet, FonteIpeadata, carregar_serie
+    from motor_correcao import indices
+
+    cache = CacheParquet(DIR_GRAVADAS, ttl_horas=0)
+    for nome, codigo in indices.items():
+        df = carregar_serie(nome, codigo, cache=cache, fonte=FonteIpeadata())
+        print(f"{nome}: {len(df)} meses ({df.index.min():%Y-%m} a {df.index.max():%Y-%m})")
+
+
+def sinteticas(ate="2025-06-01"):
+    import numpy as np
+    import pandas as pd
+
+    from cache_indices import CacheParquet
+    from motor_correcao import indices
+
+    cache = CacheParquet(DIR_SINTETICAS)
+    for nome, codigo in indices.items():
+        rng = np.random.default_rng(zlib.crc32(codigo.encode()))
+        datas = pd.date_range(inicio_series[nome], ate, freq="MS", name="DATE")
+        variacoes = rng.gamma(2.0, 0.35, len(datas)) - 0.1
+        hiperinflacao = (datas >= "1980-01-01") & (datas < "1994-07-01")
+        variacoes[hiperinflacao] *= 25
+        df = pd.DataFrame(
+            {
+                "CODE": codigo,
+                "RAW DATE": datas.strftime("%Y-%m-%dT00:00:00-03:00"),
+                "DAY": datas.day,
+                "MONTH": datas.month,
+                "YEAR": datas.year,
+                "VALUE ((% a.m.))": variacoes,
+            },
+            index=datas,
+        )
+        cache.gravar(nome, df)
+
+
+# diretório de fixtures a usar (gravadas, se existirem; senão sintéticas, geradas na hora) e o tipo
+def diretorio_fixtures():
+    if os.path.isdir(DIR_GRAVADAS) and os.listdir(DIR_GRAVADAS):
+        return DIR_GRAVADAS, "gravadas"
+    if not (os.path.isdir(DIR_SINTETICAS) and os.listdir(DIR_SINTETICAS)):
+        sinteticas()
+    return DIR_SINTETICAS, "sinteticas"
+
+
+# aponta o cache_indices para as fixtures, sem TTL e sem rede: neste processo (trocando o cache e a fonte
+# padrão) e nos subprocessos (variáveis de ambiente)
+def configurar_ambiente(diretorio):
+    os.environ["CORRECAO_CACHE_DIR"] = diretorio
+    os.environ["CORRECAO_CACHE_TTL_HORAS"] = "inf"
+    os.environ["CORRECAO_OFFLINE"] = "1"
+
+    import cache_indices
+
+    cache_indices.cache_padrao = cache_indices.CacheParquet(diretorio, ttl_horas=float("inf"))
+    cache_indices.fonte_padrao = cache_indices.FonteOffline()
+
+
+if __name__ == "__main__":
+    comandos = {"gravar": gravar, "sinteticas": sinteticas}
+    if len(sys.argv) != 2 or sys.argv[1] not in comandos:
+        sys.exit(f"uso: python {sys.argv[0]} {{{'|'.join(comandos)}}}")
+    comandos[sys.argv[1]]()
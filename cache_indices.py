@@ -0,0 +1,133 @@
+# --- cache local das séries do Ipeadata ---
+# cada série fica gravada em um arquivo parquet (colunar) no diretório do cache.
+# na inicialização a série é lida do disco; só quando o cache vence (TTL) buscamos no Ipeadata
+# os meses mais novos que a última data gravada e anexamos ao arquivo.
+# o cache e a fonte são "plugáveis": basta passar outros objetos com os mesmos métodos
+# (por exemplo um diretório de fixtures e uma fonte offline nos testes).
+import os
+import time
+
+import pandas as pd
+
+from metricas import etapa, incrementar
+
+# configuração por variável de ambiente
+DIRETORIO_CACHE = os.environ.get(
+    "CORRECAO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "correcao_monetaria")
+)
+TTL_CACHE_HORAS = float(os.environ.get("CORRECAO_CACHE_TTL_HORAS", "24"))
+OFFLINE = os.environ.get("CORRECAO_OFFLINE", "") not in ("", "0")
+
+
+# --- fontes de dados ---
+# fonte padrão: API OData do Ipeadata. Com "apos" só os meses posteriores a essa data são baixados.
+class FonteIpeadata:
+    api = "http://ipeadata.gov.br/api/odata4/ValoresSerie(SERCODIGO='%s')"
+
+    def buscar(self, codigo, apos=None):
+        import ipeadatapy as ipea
+
+        if apos is None:
+            return ipea.timeseries(codigo)
+
+        filtro = "?$filter=VALDATA gt " + apos.strftime("%Y-%m-%dT00:00:00-03:00")
+        bruto = ipea.api_call(self.api % codigo + filtro)
+        if bruto is None:
+            raise ConnectionError(f"Falha ao consultar o Ipeadata para a série {codigo}.")
+        return formatar_valores(bruto)
+
+
+# fonte sem rede: usada em testes/benchmarks e quando CORRECAO_OFFLINE=1
+class FonteOffline:
+    def buscar(self, codigo, apos=None):
+        raise ConnectionError(f"Modo offline: a série {codigo} não está no cache.")
+
+
+# converte a resposta crua da API (SERCODIGO, VALDATA, VALVALOR) para o mesmo formato do ipea.timeseries()
+def formatar_valores(bruto):
+    if bruto.empty:
+        return pd.DataFrame(columns=["CODE", "RAW DATE", "DAY", "MONTH", "YEAR", "VALUE"])
+    df = bruto[["SERCODIGO", "VALDATA", "VALVALOR"]].rename(
+        columns={"SERCODIGO": "CODE", "VALDATA": "RAW DATE", "VALVALOR": "VALUE"}
+    )
+    df["DATE"] = pd.to_datetime(df["RAW DATE"].str[0:10])
+    df["DAY"] = df["DATE"].dt.day
+    df["MONTH"] = df["DATE"].dt.month
+    df["YEAR"] = df["DATE"].dt.year
+    return df.set_index("DATE")[["CODE", "RAW DATE", "DAY", "MONTH", "YEAR", "VALUE"]]
+
+
+# --- cache em disco (parquet) ---
+class CacheParquet:
+    def __init__(self, diretorio=DIRETORIO_CACHE, ttl_horas=TTL_CACHE_HORAS):
+        self.diretorio = diretorio
+        self.ttl_horas = ttl_horas
+
+    def caminho(self, nome):
+        return os.path.join(self.diretorio, f"{nome}.parquet")
+
+    def ler(self, nome):
+        caminho = self.caminho(nome)
+        if not os.path.exists(caminho):
+            return None
+        return pd.read_parquet(caminho)
+
+    # o cache vale enquanto o arquivo tiver menos de ttl_horas desde a última gravação/verificação
+    def valido(self, nome):
+        idade_horas = (time.time() - os.path.getmtime(self.caminho(nome))) / 3600
+        return idade_horas < self.ttl_horas
+
+    # grava em arquivo temporário e troca de uma vez, para nenhum leitor ver um parquet pela metade
+    def gravar(self, nome, df):
+        os.makedirs(self.diretorio, exist_ok=True)
+        temporario = self.caminho(nome) + ".tmp"
+        df.to_parquet(temporario)
+        os.replace(temporario, self.caminho(nome))
+
+    # renova o TTL quando o Ipeadata não tinha meses novos
+    def tocar(self, nome):
+        os.utime(self.caminho(nome))
+
+
+cache_padrao = CacheParquet()
+fonte_padrao = FonteOffline() if OFFLINE else FonteIpeadata()
+
+
+# --- leitura de uma série passando pelo cache ---
+def carregar_serie(nome, codigo, cache=None, fonte=None):
+    cache = cache or cache_padrao
+    fonte = fonte or fonte_padrao
+
+    df = cache.ler(nome)
+    # sem cache: baixa a série inteira uma única vez
+    if df is None:
+        incrementar("correcao_cache_total", cache="series", resultado="falta")
+        with etapa("busca", metrica="correcao_busca_segundos", indice=nome, tipo="completa"):
+            df = fonte.buscar(codigo)
+        cache.gravar(nome, df)
+        return df
+
+    if cache.valido(nome):
+        incrementar("correcao_cache_total", cache="series", resultado="acerto")
+        return df
+
+    # cache vencido: atualização incremental a partir do último mês gravado
+    incrementar("correcao_cache_total", cache="series", resultado="vencido")
+    ultima_data = df.index.max()
+    try:
+        with etapa("busca", metrica="correcao_busca_segundos", indice=nome, tipo="incremental"):
+            novos = fonte.buscar(codigo, apos=ultima_data)
+    except Exception:
+        return df  # Ipeadata lento/fora do ar: seguimos com o cache vencido
+
+    if not novos.empty:
+        novos = novos[novos.index > ultima_data]
+    if novos.empty:
+        cache.tocar(nome)
+        return df
+
+    # a coluna de valor do ipea.timeseries() tem a unidade no nome, ex.: "VALUE ((% a.m.))"
+    novos = novos.rename(columns={"VALUE": [c for c in df.columns if c.startswith("VALUE")][0]})
+    df = pd.concat([df, novos[df.columns].astype(df.dtypes)])
+    cache.gravar(nome, df)
+    return df
@@ -0,0 +1,80 @@
+# --- cache LRU de resultados, compartilhado por todas as sessões do processo ---
+# a maioria dos usuários pede os mesmos poucos períodos (últimos 12 meses, ano corrente, aniversário de contrato),
+# então as tabelas de fatores e os recortes da comparação ficam guardados por (índice, início, fim, versão dos
+# dados). O cache é limitado em bytes (CORRECAO_CACHE_RESULTADOS_MB): ao passar do limite saem os itens usados
+# há mais tempo. Os objetos guardados são compartilhados entre sessões e não devem ser alterados por quem os recebe.
+import os
+import threading
+
+from collections import OrderedDict
+
+from metricas import incrementar
+
+LIMITE_MB = float(os.environ.get("CORRECAO_CACHE_RESULTADOS_MB", "64"))
+
+
+# memória aproximada de um resultado (dataframes, arrays e tuplas deles)
+def tamanho_bytes(valor):
+    if isinstance(valor, tuple):
+        return sum(tamanho_bytes(item) for item in valor)
+    if hasattr(valor, "memory_usage"):
+        return int(valor.memory_usage(deep=True, index=True).sum())
+    return int(getattr(valor, "nbytes", 0))
+
+
+class CacheLRU:
+    def __init__(self, nome, limite_bytes):
+        self.nome = nome
+        self.limite_bytes = limite_bytes
+        self.itens = OrderedDict()  # chave -> (valor, bytes), do usado há mais tempo para o mais recente
+        self.bytes = 0
+        self.acertos = 0
+        self.faltas = 0
+        self.trava = threading.Lock()
+
+    # valor guardado para a chave ou calcular(), guardado em seguida. O cálculo roda fora da trava (duas sessões
+    # pedindo a mesma chave ao mesmo tempo podem calcular as duas; a segunda só substitui o item).
+    def obter(self, chave, calcular):
+        with self.trava:
+            item = self.itens.get(chave)
+            if item is not None:
+                self.itens.move_to_end(chave)
+                self.acertos += 1
+        if item is not None:
+            incrementar("correcao_cache_total", cache=self.nome, resultado="acerto")
+            return item[0]
+
+        incrementar("correcao_cache_total", cache=self.nome, resultado="falta")
+        valor = calcular()
+        tamanho = tamanho_bytes(valor)
+        with self.trava:
+            self.faltas += 1
+            if tamanho > self.limite_bytes:
+                return valor  # maior que o cache inteiro: não guarda
+            antigo = self.itens.pop(chave, None)
+            if antigo is not None:
+                self.bytes -= antigo[1]
+            self.itens[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while self.bytes > self.limite_bytes:
+                self.bytes -= self.itens.popitem(last=False)[1][1]
+                incrementar("correcao_cache_total", cache=self.nome, resultado="descarte")
+        return valor
+
+    def limpar(self):
+        with self.trava:
+            self.itens.clear()
+            self.bytes = 0
+
+    def estatisticas(self):
+        with self.trava:
+            return {
+                "itens": len(self.itens),
+                "bytes": self.bytes,
+                "limite_bytes": self.limite_bytes,
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+            }
+
+
+cache_resultados = CacheLRU("resultados", int(LIMITE_MB * 1024 * 1024))
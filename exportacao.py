@@ -0,0 +1,307 @@
+# --- exportação das séries brutas ---
+# os bytes de cada série em cada formato são gerados uma única vez por versão dos dados e compartilhados
+# por todas as sessões; só são refeitos quando a série é atualizada (muda serie.versao).
+import gzip
+import io
+import math
+import re
+import threading
+import zipfile
+import zlib
+
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from metricas import etapa, incrementar
+from motor_correcao import blocos_matriz_fatores, dados_brutos, serie_pronta
+
+# formatos oferecidos: extensão do arquivo -> rótulo no app
+formatos_exportacao = {"xlsx": "XLSX", "csv": "CSV", "csv.gz": "CSV.GZ", "parquet": "Parquet"}
+
+# botões de download das séries brutas no app: índice -> (prefixo do id "download_<prefixo>" e do arquivo, rótulo)
+downloads_series = {
+    "IPCA": ("ipca", "IPCA"),
+    "IGP_M": ("igpm", "IGP-M"),
+    "IGP_DI": ("igpdi", "IGP-DI"),
+    "SELIC_OVER": ("selicover", "SELIC-OVER"),
+    "INPC": ("inpc", "INPC"),
+    "IPC_BR": ("ipcbr", "IPC-BR"),
+    "IPC_FIPE": ("ipcfipe", "IPC-FIPE"),
+}
+
+bytes_exportados = {}  # (nome, formato) -> (versao, bytes)
+travas_exportacao = {}  # uma trava por (nome, formato): duas sessões pedindo o mesmo arquivo geram ele uma vez só
+trava_global = threading.Lock()
+
+
+def gerar_bytes(nome, df, formato):
+    if formato == "csv.gz":
+        return gzip.compress(bytes_serie(nome, "csv"))
+    buffer = io.BytesIO()  # O buffer é uma memória temporária onde exportamos o arquivo antes de enviá-lo para download.
+    if formato == "xlsx":
+        df.to_excel(buffer)
+    elif formato == "csv":
+        df.to_csv(buffer)
+    elif formato == "parquet":
+        df.to_parquet(buffer)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}. Use um de {', '.join(formatos_exportacao)}.")
+    return buffer.getvalue()
+
+
+# bytes da série no formato pedido, da versão atual dos dados
+def bytes_serie(nome, formato):
+    serie = serie_pronta(nome)
+    chave = (nome, formato)
+    with trava_global:
+        trava = travas_exportacao.setdefault(chave, threading.Lock())
+    with trava:
+        guardado = bytes_exportados.get(chave)
+        if guardado is not None and guardado[0] == serie.versao:
+            incrementar("correcao_cache_total", cache="exportacao", resultado="acerto")
+            return guardado[1]
+        incrementar("correcao_cache_total", cache="exportacao", resultado="falta")
+        with etapa("exportacao", formato=formato):
+            conteudo = gerar_bytes(nome, dados_brutos(serie), formato)
+        bytes_exportados[chave] = (serie.versao, conteudo)
+        return conteudo
+
+
+# --- tabelas de resultado gravadas em streaming (memória constante) ---
+# toda tabela que o app e a API entregam (resultado da correção, lote, parcelas, comparação, tabelas de fatores)
+# passa por escrever_tabela(): recebe os blocos de linhas (DataFrames com as mesmas colunas) e devolve os bytes
+# do arquivo em pedaços, à medida que cada bloco é gravado. Só um bloco fica na memória por vez.
+#   - csv: cada bloco vira texto na hora (cabeçalho só no primeiro)
+#   - csv.gz: o mesmo csv passando por um compressor gzip incremental
+#   - xlsx: o zip do arquivo é escrito direto na saída (zipfile aceita destino sem seek), com a planilha em xml
+#     montada aqui, coluna a coluna: sem openpyxl, sem arquivo temporário e bem mais rápido. Passando de
+#     LINHAS_POR_FOLHA linhas o resto vai para folhas seguintes ("dados (2)", ...), o limite do Excel.
+formatos_tabela = {"xlsx": "XLSX", "csv": "CSV", "csv.gz": "CSV.GZ"}
+TAMANHO_PEDACO = 1024 * 1024
+LINHAS_BLOCO = 50_000
+LINHAS_POR_FOLHA = 1_048_575  # mais o cabeçalho
+
+# datas no excel: dias desde 30/12/1899, com o estilo 1 (formato aaaa-mm-dd) do styles.xml abaixo
+EPOCA_EXCEL = np.datetime64("1899-12-30", "ns")
+DIA_NS = 86_400 * 10**9
+caracteres_invalidos_xml = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+tipos_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">\
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>\
+<Default Extension="xml" ContentType="application/xml"/>\
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>\
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>\
+{folhas}</Types>"""
+tipo_folha_xlsx = '<Override PartName="/xl/worksheets/sheet{n}.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+relacoes_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">\
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>\
+</Relationships>"""
+pasta_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" \
+xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>{folhas}</sheets></workbook>"""
+folha_pasta_xlsx = '<sheet name="{nome}" sheetId="{n}" r:id="rId{n}"/>'
+relacoes_pasta_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{folhas}\
+<Relationship Id="rIdEstilos" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>\
+</Relationships>"""
+relacao_folha_xlsx = '<Relationship Id="rId{n}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet{n}.xml"/>'
+estilos_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">\
+<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>\
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>\
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>\
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>\
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>\
+<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>\
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>\
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>\
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>\
+</styleSheet>"""
+inicio_folha_xlsx = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">\
+<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>\
+<sheetData>"""
+fim_folha_xlsx = "</sheetData></worksheet>"
+
+
+def validar_formato_tabela(formato):
+    if formato not in formatos_tabela:
+        raise ValueError(f"Formato de tabela desconhecido: {formato}. Use um de {', '.join(formatos_tabela)}.")
+
+
+# destino do zip: guarda o que foi escrito até alguém retirar (zipfile só precisa de write/flush)
+class SaidaPedacos:
+    def __init__(self):
+        self.pedacos = []
+
+    def write(self, dados):
+        self.pedacos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        conteudo = b"".join(self.pedacos)
+        self.pedacos = []
+        return conteudo
+
+
+# um DataFrame já pronto (resultado, parcelas, comparação) em blocos de "linhas" linhas, para o escrever_tabela
+def em_blocos(df, linhas=LINHAS_BLOCO):
+    for a in range(0, max(len(df), 1), linhas):
+        yield df.iloc[a:a + linhas]
+
+
+def texto_xlsx(valor):
+    texto = escape(caracteres_invalidos_xml.sub("", str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+# uma célula de uma coluna de tipos misturados (object): número, data, booleano ou texto
+def celula_xlsx(valor):
+    if valor is None or valor is pd.NaT:
+        return "<c/>"
+    if isinstance(valor, (bool, np.bool_)):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, np.number)):
+        valor = float(valor)
+        return f"<c><v>{valor!r}</v></c>" if math.isfinite(valor) else "<c/>"
+    if isinstance(valor, (datetime, date, np.datetime64)):
+        dias = (pd.Timestamp(valor).to_datetime64() - EPOCA_EXCEL) / DIA_NS
+        return f'<c s="1"><v>{float(dias)!r}</v></c>'
+    return texto_xlsx(valor)
+
+
+# as células (xml) de uma coluna inteira do bloco, tratadas pelo tipo da coluna
+def celulas_xlsx(coluna):
+    if pd.api.types.is_bool_dtype(coluna.dtype):
+        return [celula_xlsx(valor) for valor in coluna.tolist()]
+    if pd.api.types.is_numeric_dtype(coluna.dtype):
+        valores = coluna.to_numpy(dtype=float, na_value=np.nan)
+        finitos = np.isfinite(valores).tolist()
+        return [f"<c><v>{valor!r}</v></c>" if finito else "<c/>" for valor, finito in zip(valores.tolist(), finitos)]
+    if pd.api.types.is_datetime64_any_dtype(coluna.dtype):
+        datas = coluna.dt.tz_localize(None) if coluna.dt.tz is not None else coluna
+        valores = datas.to_numpy(dtype="datetime64[ns]")
+        dias = ((valores - EPOCA_EXCEL).astype(np.int64) / DIA_NS).tolist()
+        return ["<c/>" if vazia else f'<c s="1"><v>{dia!r}</v></c>' for dia, vazia in zip(dias, np.isnat(valores).tolist())]
+    return [celula_xlsx(valor) for valor in coluna.tolist()]
+
+
+def linhas_xlsx(bloco):
+    colunas = [celulas_xlsx(bloco.iloc[:, j]) for j in range(bloco.shape[1])]
+    return "".join(["<row>" + "".join(celulas) + "</row>" for celulas in zip(*colunas)])
+
+
+def cabecalho_xlsx(colunas):
+    celulas = "".join(texto_xlsx(coluna).replace("<c ", '<c s="2" ', 1) for coluna in colunas)
+    return f"<row>{celulas}</row>"
+
+
+# blocos com o índice virando coluna (indice=True) e as colunas do primeiro bloco, na mesma ordem
+# (a linha de total das parcelas, por exemplo, só preenche algumas)
+def alinhar_blocos(blocos, indice):
+    colunas = None
+    for bloco in blocos:
+        if indice:
+            bloco = bloco.reset_index()
+        if colunas is None:
+            colunas = list(bloco.columns)
+        elif list(bloco.columns) != colunas:
+            bloco = bloco.reindex(columns=colunas)
+        yield bloco
+
+
+def escrever_csv(blocos):
+    for n, bloco in enumerate(blocos):
+        yield bloco.to_csv(index=False, header=(n == 0)).encode()
+
+
+def escrever_csv_gz(blocos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: cabeçalho e rodapé gzip
+    for texto in escrever_csv(blocos):
+        if pedaco := compressor.compress(texto):
+            yield pedaco
+    yield compressor.flush()
+
+
+def escrever_xlsx(blocos, folha):
+    saida = SaidaPedacos()
+    nomes_folhas = []
+    with zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as pacote:
+        arquivo = None
+        linhas_na_folha = 0
+        try:
+            for bloco in blocos:
+                a = 0
+                while a < len(bloco) or arquivo is None:
+                    if arquivo is None or linhas_na_folha == LINHAS_POR_FOLHA:
+                        if arquivo is not None:
+                            arquivo.write(fim_folha_xlsx.encode())
+                            arquivo.close()
+                        nomes_folhas.append(folha if not nomes_folhas else f"{folha} ({len(nomes_folhas) + 1})")
+                        arquivo = pacote.open(f"xl/worksheets/sheet{len(nomes_folhas)}.xml", "w", force_zip64=True)
+                        arquivo.write((inicio_folha_xlsx + cabecalho_xlsx(bloco.columns)).encode())
+                        linhas_na_folha = 0
+                    b = min(len(bloco), a + LINHAS_POR_FOLHA - linhas_na_folha)
+                    arquivo.write(linhas_xlsx(bloco.iloc[a:b]).encode())
+                    linhas_na_folha += b - a
+                    a = b
+                if pedaco := saida.retirar():
+                    yield pedaco
+            if arquivo is None:  # nenhum bloco: planilha vazia
+                nomes_folhas.append(folha)
+                arquivo = pacote.open("xl/worksheets/sheet1.xml", "w")
+                arquivo.write(inicio_folha_xlsx.encode())
+            arquivo.write(fim_folha_xlsx.encode())
+        finally:
+            if arquivo is not None:
+                arquivo.close()
+
+        # a pasta e os tipos vão no fim do zip (a ordem das partes não importa), quando já se sabe quantas folhas há
+        numeros = range(1, len(nomes_folhas) + 1)
+        pacote.writestr("[Content_Types].xml", tipos_xlsx.format(folhas="".join(tipo_folha_xlsx.format(n=n) for n in numeros)))
+        pacote.writestr("_rels/.rels", relacoes_xlsx)
+        pacote.writestr("xl/workbook.xml", pasta_xlsx.format(folhas="".join(
+            folha_pasta_xlsx.format(nome=escape(nome, {'"': "&quot;"}), n=n) for n, nome in zip(numeros, nomes_folhas)
+        )))
+        pacote.writestr("xl/_rels/workbook.xml.rels", relacoes_pasta_xlsx.format(
+            folhas="".join(relacao_folha_xlsx.format(n=n) for n in numeros)
+        ))
+        pacote.writestr("xl/styles.xml", estilos_xlsx)
+    yield saida.retirar()
+
+
+# bytes do arquivo (csv, csv.gz ou xlsx) com as linhas de todos os blocos, em pedaços, medido na etapa "nome".
+# "folha" é o nome da folha no xlsx; com indice=True o índice de cada bloco vira a primeira coluna.
+def escrever_tabela(nome, blocos, formato, folha="dados", indice=False):
+    validar_formato_tabela(formato)
+    folha = re.sub(r"[\[\]:*?/\\]", "_", folha)[:25] or "dados"
+    blocos = alinhar_blocos(blocos, indice)
+    with etapa(nome, formato=formato):
+        if formato == "csv":
+            yield from escrever_csv(blocos)
+        elif formato == "csv.gz":
+            yield from escrever_csv_gz(blocos)
+        else:
+            yield from escrever_xlsx(blocos, folha)
+
+
+# --- tabelas de fatores (motor_correcao.tabela_fatores_alvo e blocos_matriz_fatores) ---
+# tabela de fatores até a data alvo (poucas centenas de linhas, já calculada por tabela_fatores_alvo)
+def tabela_fatores_bytes(tabela, formato):
+    tabela = tabela.assign(versao_dados=tabela.attrs["versao_dados"])
+    return escrever_tabela("exportacao_tabela_fatores", [tabela], formato, folha=tabela.attrs["indice"])
+
+
+# matriz completa (data inicial x data final) do índice, gravada bloco a bloco: cada bloco de LINHAS_BLOCO_MATRIZ
+# datas iniciais sai assim que fica pronto, sem a matriz inteira na memória
+def matriz_fatores_bytes(nome, formato):
+    validar_formato_tabela(formato)
+    return escrever_tabela("exportacao_matriz_fatores", blocos_matriz_fatores(nome), formato, folha=nome, indice=True)
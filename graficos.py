@@ -0,0 +1,94 @@
+# --- gráficos (plotly) ---
+# para períodos longos (ex.: 1980-2025, vários índices) o navegador fica lento com milhares de marcadores SVG.
+# então cada linha é reduzida no servidor para no máximo PONTOS_MAXIMOS pontos com LTTB (que preserva os picos
+# da hiperinflação), os marcadores só aparecem em séries curtas e, acima de LIMITE_WEBGL pontos no total,
+# as linhas passam a ser desenhadas em WebGL (Scattergl). O tamanho do gráfico fica ~constante, qualquer que seja o período.
+# isso só reduz os dados do gráfico: o widget em si é criado uma única vez por sessão e reaproveitado (widget_vazio,
+# atualizar_widget), porque o estado inicial de cada FigureWidget leva o javascript inteiro do plotly.
+import numpy as np
+import plotly.graph_objects as go
+
+from metricas import etapa
+
+PONTOS_MAXIMOS = 500
+LIMITE_MARCADORES = 120
+LIMITE_WEBGL = 1000
+
+
+# Largest-Triangle-Three-Buckets: escolhe n_saida pontos que preservam a forma da curva (picos e vales)
+def lttb(x, y, n_saida):
+    n = len(y)
+    if n <= n_saida or n_saida < 3:
+        return x, y
+
+    # datas viram números para o cálculo das áreas
+    if np.issubdtype(x.dtype, np.datetime64):
+        xs = x.astype("datetime64[s]").astype(np.int64).astype(float)
+    else:
+        xs = x.astype(float)
+
+    selecionados = np.empty(n_saida, dtype=np.int64)
+    selecionados[0], selecionados[-1] = 0, n - 1
+    limites = np.linspace(1, n - 1, n_saida - 1).astype(np.int64)  # n_saida - 2 baldes entre o primeiro e o último ponto
+    a = 0
+    for k in range(n_saida - 2):
+        inicio, fim = limites[k], limites[k + 1]
+        # média do balde seguinte (para o último balde, o último ponto)
+        proximo_fim = limites[k + 2] if k + 2 < len(limites) else n
+        media_x, media_y = xs[fim:proximo_fim].mean(), y[fim:proximo_fim].mean()
+        areas = np.abs((xs[a] - media_x) * (y[inicio:fim] - y[a]) - (xs[a] - xs[inicio:fim]) * (media_y - y[a]))
+        a = inicio + int(np.argmax(areas))
+        selecionados[k + 1] = a
+    return x[selecionados], y[selecionados]
+
+
+# gráfico de linhas a partir de um dataframe "largo" (índice = eixo x, uma coluna por linha)
+def figura_linhas(df, titulo_x, titulo_y, escala_log=False):
+    with etapa("grafico"):
+        return montar_figura(df, titulo_x, titulo_y, escala_log)
+
+
+def montar_figura(df, titulo_x, titulo_y, escala_log):
+    total_pontos = int(df.notna().to_numpy().sum())
+    Linha = go.Scattergl if total_pontos > LIMITE_WEBGL else go.Scatter
+
+    fig = go.Figure()
+    for coluna in df.columns:
+        serie = df[coluna].dropna()
+        x, y = lttb(serie.index.to_numpy(), serie.to_numpy(dtype=float), PONTOS_MAXIMOS)
+        fig.add_trace(Linha(x=x, y=y, name=str(coluna), mode="lines+markers" if len(x) <= LIMITE_MARCADORES else "lines"))
+
+    fig.update_layout(
+        xaxis_title=titulo_x,
+        yaxis_title=titulo_y,
+        hovermode="x unified",
+        showlegend=len(df.columns) > 1,
+    )
+    # o tipo do eixo vai sempre explícito: no widget persistente o layout é mesclado, e um "log" anterior ficaria
+    fig.update_yaxes(type="log" if escala_log else "linear")
+    return fig
+
+
+# --- widgets persistentes ---
+# cada FigureWidget novo manda ao navegador o estado inicial inteiro, com o javascript do plotly (~5 MB), e essa
+# serialização roda no event loop. Por isso o app cria cada gráfico uma única vez por sessão (widget_vazio) e a
+# cada cálculo só troca as linhas e o layout do widget existente (atualizar_widget): a mensagem leva só os dados.
+def widget_vazio():
+    return go.FigureWidget()
+
+
+# põe no widget as linhas e o layout de "fig" (uma figura do figura_linhas; None deixa o gráfico vazio), numa única
+# atualização. Com as mesmas linhas (quantidade e tipo) x, y, nome e modo são trocados no lugar; senão as linhas
+# são recriadas. O zoom do usuário é desfeito, como ao desenhar um gráfico novo.
+def atualizar_widget(widget, fig):
+    linhas = () if fig is None else fig.data
+    layout = {} if fig is None else fig.layout.to_plotly_json()
+    layout.pop("template", None)
+    with widget.batch_update():
+        if [linha.type for linha in widget.data] == [linha.type for linha in linhas]:
+            for atual, nova in zip(widget.data, linhas):
+                atual.update(x=nova.x, y=nova.y, name=nova.name, mode=nova.mode)
+        else:
+            widget.data = ()
+            widget.add_traces(linhas)
+        widget.update_layout(layout, xaxis_autorange=True, yaxis_autorange=True)
@@ -0,0 +1,134 @@
+# --- séries compartilhadas entre os workers do uvicorn (arquivos mapeados em memória) ---
+# com vários workers (uvicorn --workers N) cada processo buscava, lia e guardava a própria cópia das 7 séries.
+# com CORRECAO_COMPARTILHAR=1 as séries são publicadas uma única vez em arquivos .npy (variações mensais e o
+# índice de fatores já calculado; o mês inicial vai no manifesto) no diretório do cache, e cada worker só mapeia
+# esses arquivos (np.load com mmap_mode="r"): somente leitura, sem cópia, com as páginas compartilhadas pelo
+# sistema operacional.
+#   - uma trava de arquivo por série garante que só um processo busca/publica; os outros esperam e mapeiam
+#   - <nome>.json (o manifesto) aponta para a versão publicada; é trocado por último, de uma vez (os.replace)
+#   - uma série publicada há menos de "idade_maxima_horas" é só mapeada; mais velha, quem pegar a trava atualiza
+#     (pelo cache_indices) e publica, e os outros workers passam a mapear a versão nova na próxima verificação
+# arquivos de versões antigas são apagados ao publicar; quem ainda os tem mapeados continua lendo (POSIX).
+import hashlib
+import json
+import os
+import time
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from cache_indices import DIRETORIO_CACHE
+
+ATIVO = os.environ.get("CORRECAO_COMPARTILHAR", "") not in ("", "0")
+DIRETORIO_COMPARTILHADO = os.path.join(DIRETORIO_CACHE, "compartilhado")
+
+partes = ("variacoes", "fatores")
+
+
+# versão de uma série: hash do índice de fatores (a mesma regra do motor_correcao)
+def versao_fatores(fatores):
+    return hashlib.sha1(np.ascontiguousarray(fatores).tobytes()).hexdigest()[:12]
+
+
+def caminho(nome, sufixo, diretorio=None):
+    return os.path.join(diretorio or DIRETORIO_COMPARTILHADO, f"{nome}{sufixo}")
+
+
+# trava exclusiva entre processos (flock); sem fcntl (Windows) cada processo carrega por conta própria
+@contextmanager
+def trava_serie(nome, diretorio=None):
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(diretorio or DIRETORIO_COMPARTILHADO, exist_ok=True)
+    with open(caminho(nome, ".trava", diretorio), "a") as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+
+def ler_manifesto(nome, diretorio=None):
+    try:
+        with open(caminho(nome, ".json", diretorio), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+# mapeia (somente leitura, sem cópia) os arrays da versão publicada: {"variacoes", "fatores", "mes_inicial", "versao"}
+def mapear(nome, manifesto, diretorio=None):
+    arrays = {
+        parte: np.load(caminho(nome, f"-{manifesto['versao']}-{parte}.npy", diretorio), mmap_mode="r").view(np.ndarray)
+        for parte in partes
+    }
+    arrays["mes_inicial"] = manifesto["mes_inicial"]
+    arrays["versao"] = manifesto["versao"]
+    return arrays
+
+
+def gravar_array(destino, array):
+    temporario = destino + ".tmp"
+    with open(temporario, "wb") as arquivo:
+        np.save(arquivo, array)
+    os.replace(temporario, destino)
+
+
+# grava os arrays da série (se a versão ainda não existe), troca o manifesto e apaga as versões antigas
+def publicar(nome, mes_inicial, variacoes, fatores, diretorio=None):
+    diretorio = diretorio or DIRETORIO_COMPARTILHADO
+    os.makedirs(diretorio, exist_ok=True)
+    versao = versao_fatores(fatores)
+    arrays = {
+        "variacoes": np.asarray(variacoes, dtype=float),
+        "fatores": np.asarray(fatores, dtype=float),
+    }
+    for parte, array in arrays.items():
+        destino = caminho(nome, f"-{versao}-{parte}.npy", diretorio)
+        if not os.path.exists(destino):
+            gravar_array(destino, array)
+
+    manifesto = {
+        "versao": versao, "mes_inicial": int(mes_inicial), "publicado_em": time.time(), "tamanho": len(arrays["variacoes"]),
+    }
+    temporario = caminho(nome, ".json.tmp", diretorio)
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo)
+    os.replace(temporario, caminho(nome, ".json", diretorio))
+
+    for arquivo in os.listdir(diretorio):
+        if arquivo.startswith(f"{nome}-") and arquivo.endswith(".npy") and f"-{versao}-" not in arquivo:
+            os.remove(os.path.join(diretorio, arquivo))
+    return manifesto
+
+
+# manifesto no formato atual
+def valido(manifesto):
+    return manifesto is not None and "mes_inicial" in manifesto
+
+
+def recente(manifesto, idade_maxima_horas):
+    return valido(manifesto) and (time.time() - manifesto["publicado_em"]) / 3600 < idade_maxima_horas
+
+
+# arrays mapeados da série. Se a versão publicada estiver vencida (ou não existir), um único processo chama
+# carregar() -> (mes_inicial, variacoes, fatores), publica o resultado e todos mapeiam a mesma versão.
+def obter(nome, carregar, idade_maxima_horas, diretorio=None):
+    manifesto = ler_manifesto(nome, diretorio)
+    if recente(manifesto, idade_maxima_horas):
+        return mapear(nome, manifesto, diretorio)
+    with trava_serie(nome, diretorio):
+        # outro worker pode ter publicado enquanto esperávamos a trava
+        manifesto = ler_manifesto(nome, diretorio)
+        if not recente(manifesto, idade_maxima_horas):
+            try:
+                manifesto = publicar(nome, *carregar(), diretorio=diretorio)
+            except Exception:
+                if not valido(manifesto):
+                    raise
+                # fonte fora do ar: seguimos com a versão vencida (como o cache_indices)
+        return mapear(nome, manifesto, diretorio)
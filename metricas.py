@@ -0,0 +1,161 @@
+# --- métricas de desempenho (formato de texto do Prometheus) e rastreio por requisição ---
+# instrumentação leve dos pontos quentes (carga das séries, resultados(), exportações, gráficos, lote, API, pool de tarefas),
+# sem dependências: os valores ficam em dicionários do processo e são servidos em /metrics pelo app_correcao.
+#   CORRECAO_METRICAS=0  desliga a coleta (etapa() vira um "with" vazio e /metrics responde 404)
+#   CORRECAO_RASTREIO=1  escreve no log uma linha por etapa, com o id do rastreio da requisição/clique
+# com vários workers do uvicorn cada processo tem as próprias métricas (o Prometheus soma pelo "instance").
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+
+ATIVO = os.environ.get("CORRECAO_METRICAS", "1") not in ("", "0")
+RASTREIO = os.environ.get("CORRECAO_RASTREIO", "") not in ("", "0")
+
+# limites (segundos) dos baldes dos histogramas
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# métricas conhecidas: nome -> (tipo, descrição)
+descricoes = {
+    "correcao_etapa_segundos": ("histogram", "Duração de cada etapa instrumentada"),
+    "correcao_etapa_falhas_total": ("counter", "Etapas que terminaram com exceção"),
+    "correcao_busca_segundos": ("histogram", "Duração das consultas à fonte de dados (Ipeadata)"),
+    "correcao_busca_falhas_total": ("counter", "Consultas à fonte de dados que falharam"),
+    "correcao_cache_total": ("counter", "Consultas aos caches, por cache e resultado (acerto/falta/vencido)"),
+    "correcao_lote_linhas_total": ("counter", "Linhas corrigidas na correção em lote"),
+    "correcao_atualizacoes_total": ("counter", "Atualizações em segundo plano que trocaram o retrato dos dados"),
+    "correcao_tarefas_ativas": ("gauge", "Tarefas pesadas rodando no pool (tarefas.py)"),
+    "correcao_tarefas_na_fila": ("gauge", "Tarefas pesadas esperando uma thread livre do pool"),
+    "correcao_tarefa_espera_segundos": ("histogram", "Tempo de espera na fila do pool até a tarefa começar"),
+    "correcao_tarefas_canceladas_total": ("counter", "Tarefas pesadas abandonadas por quem esperava (entradas mudaram, cliente saiu)"),
+    "correcao_sessoes_ativas": ("gauge", "Sessões do Shiny abertas"),
+    "correcao_sessoes_total": ("counter", "Sessões do Shiny abertas desde o início do processo"),
+    "correcao_event_loop_atraso_segundos": ("histogram", "Atraso do event loop: quanto um timer pronto esperou para rodar"),
+}
+
+trava = threading.Lock()
+contadores = {}  # (nome, rótulos) -> valor
+medidores = {}  # (nome, rótulos) -> valor
+histogramas = {}  # (nome, rótulos) -> [contagem por balde..., soma, total]
+
+rastreio_atual = contextvars.ContextVar("rastreio_atual", default=None)
+log_rastreio = logging.getLogger("correcao.rastreio")
+if RASTREIO and not log_rastreio.handlers:
+    manipulador = logging.StreamHandler()
+    manipulador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    log_rastreio.addHandler(manipulador)
+    log_rastreio.setLevel(logging.INFO)
+
+
+def chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def incrementar(nome, valor=1, **rotulos):
+    if not ATIVO:
+        return
+    k = chave(nome, rotulos)
+    with trava:
+        contadores[k] = contadores.get(k, 0) + valor
+
+
+def ajustar(nome, delta, **rotulos):
+    if not ATIVO:
+        return
+    k = chave(nome, rotulos)
+    with trava:
+        medidores[k] = medidores.get(k, 0) + delta
+
+
+def observar(nome, segundos, **rotulos):
+    if not ATIVO:
+        return
+    k = chave(nome, rotulos)
+    with trava:
+        baldes = histogramas.get(k)
+        if baldes is None:
+            baldes = histogramas[k] = [0] * len(LIMITES_SEGUNDOS) + [0.0, 0]
+        for posicao, limite in enumerate(LIMITES_SEGUNDOS):
+            if segundos <= limite:
+                baldes[posicao] += 1
+        baldes[-2] += segundos
+        baldes[-1] += 1
+
+
+# mede um trecho: duração no histograma "metrica" (por padrão correcao_etapa_segundos{etapa=...}),
+# falhas em correcao_etapa_falhas_total e, com o rastreio ligado, uma linha no log
+@contextmanager
+def etapa(nome, metrica="correcao_etapa_segundos", **rotulos):
+    if not (ATIVO or RASTREIO):
+        yield
+        return
+    inicio = time.perf_counter()
+    falhou = False
+    try:
+        yield
+    except BaseException:
+        falhou = True
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        if metrica == "correcao_etapa_segundos":
+            rotulos = {"etapa": nome, **rotulos}
+        observar(metrica, duracao, **rotulos)
+        if falhou:
+            incrementar(metrica.replace("_segundos", "_falhas_total"), **rotulos)
+        if RASTREIO:
+            extras = " ".join(f"{k}={v}" for k, v in rotulos.items() if k != "etapa")
+            log_rastreio.info(
+                "rastreio=%s etapa=%s %.2f ms%s %s",
+                rastreio_atual.get() or "-", nome, duracao * 1000, " FALHOU" if falhou else "", extras,
+            )
+
+
+# abre um rastreio (uma requisição da API, um clique em Calcular): as etapas dentro dele saem no log com o mesmo id
+@contextmanager
+def rastreio(nome, id_rastreio=None):
+    id_rastreio = id_rastreio or uuid.uuid4().hex[:12]
+    token = rastreio_atual.set(id_rastreio)
+    try:
+        with etapa(nome):
+            yield id_rastreio
+    finally:
+        rastreio_atual.reset(token)
+
+
+def formatar_rotulos(rotulos, extra=()):
+    pares = [*rotulos, *extra]
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+# todas as métricas no formato de texto do Prometheus (versão 0.0.4)
+def texto_prometheus():
+    with trava:
+        valores = {**contadores, **medidores}
+        baldes = {k: list(v) for k, v in histogramas.items()}
+
+    linhas = []
+    for nome, (tipo, ajuda) in descricoes.items():
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        if tipo == "histogram":
+            for (n, rotulos), contagens in sorted(baldes.items()):
+                if n != nome:
+                    continue
+                for limite, contagem in zip(LIMITES_SEGUNDOS, contagens):
+                    linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos, [('le', limite)])} {contagem}")
+                linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos, [('le', '+Inf')])} {contagens[-1]}")
+                linhas.append(f"{nome}_sum{formatar_rotulos(rotulos)} {contagens[-2]}")
+                linhas.append(f"{nome}_count{formatar_rotulos(rotulos)} {contagens[-1]}")
+        else:
+            for (n, rotulos), valor in sorted(valores.items()):
+                if n == nome:
+                    linhas.append(f"{nome}{formatar_rotulos(rotulos)} {valor}")
+    return "\n".join(linhas) + "\n"
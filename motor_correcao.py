@@ -0,0 +1,1005 @@
+# --- motor de correção monetária ---
+# toda a lógica de cálculo, sem nenhuma dependência de interface (shiny/plotly): séries dos índices,
+# regimes monetários, fatores acumulados, inflação/deflação e correção em lote.
+# pode ser importado por scripts e jobs em lote; a carga das séries só começa com iniciar_carga()
+# (ou sob demanda, na primeira vez que uma série é usada).
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import memoria_compartilhada
+
+from cache_indices import TTL_CACHE_HORAS, carregar_serie
+from cache_resultados import CacheLRU, cache_resultados
+from metricas import etapa, incrementar
+
+# --- Premissas para correção monetária considerando as datas ---
+# 1970 até fev/1986 -> cruzeiro (Cr$) | cruzeiro para real fator de conversão = 1 / (1000^3 * 2750);
+data_corte_cruzeiro = datetime(1986, 3, 1)
+fator_cruzeiro_real = 1 / (1000**3 * 2750)
+fator_real_cruzeiro = 1000**3 * 2750
+# mar/1986 até jan/1989 -> cruzado (Cz$) | cruzado para real fator de conversão = 1 / (1000^2 * 2750);
+data_corte_cruzado = datetime(1989, 2, 1)
+fator_cruzado_real = 1 / (1000**2 * 2750)
+fator_real_cruzado = 1000**2 * 2750
+# fev/1989 até mar/1990 -> cruzado novo (NCz$) | cruzado novo para real fator de conversão = 1 / (1000 * 2750);
+data_corte_cruzadonovo = datetime(1990, 4, 1)
+fator_cruzadonovo_real = 1 / (1000 * 2750)
+fator_real_cruzadonovo = 1000 * 2750
+# abr/1990 até jul/1993 ->  cruzeiro (Cr$) | cruzeiro para real fator de conversão = 1 / (1000 * 2750);
+data_corte_cruzeiro2 = datetime(1993, 8, 1)
+fator_cruzeiro2_real = 1 / (1000 * 2750)
+fator_real_cruzeiro2 = 1000 * 2750
+# ago/1993 até jun/1994 -> cruzeiro real (CR$) | cruzeiro real para real fator de conversão = 1 / 2750;
+data_corte_cruzeiroreal = datetime(1994, 7, 1)
+fator_cruzeiroreal_real = 1 / 2750
+fator_real_cruzeiroreal = 2750
+# jul/1994 em diante -> real (R$)
+
+# --- tabela de regimes monetários ---
+# uma linha por moeda: data de corte (primeiro dia da moeda seguinte), fator moeda -> real, fator real -> moeda e símbolo.
+# datas anteriores a cortes_moeda[k] (e posteriores ao corte anterior) pertencem à moeda k; depois do último corte é real.
+cortes_moeda = np.array(
+    [data_corte_cruzeiro, data_corte_cruzado, data_corte_cruzadonovo, data_corte_cruzeiro2, data_corte_cruzeiroreal],
+    dtype="datetime64[D]",
+)
+fatores_moeda_real = np.array(
+    [fator_cruzeiro_real, fator_cruzado_real, fator_cruzadonovo_real, fator_cruzeiro2_real, fator_cruzeiroreal_real, 1.0]
+)
+fatores_real_moeda = np.array(
+    [fator_real_cruzeiro, fator_real_cruzado, fator_real_cruzadonovo, fator_real_cruzeiro2, fator_real_cruzeiroreal, 1.0]
+)
+simbolos_moeda = np.array(["Cr$", "Cz$", "NCz$", "Cr$", "CR$", "R$"])
+
+# --- Funções globais ---
+# posição de cada data na tabela de regimes; aceita uma data ou um array/coluna de datas (uma única busca vetorizada)
+def regime_moeda(datas):
+    return np.searchsorted(cortes_moeda, np.asarray(datas, dtype="datetime64[D]"), side="right")
+
+# função para definir o fator histórico da moeda antiga para real
+def fator_historico(datas):
+    return fatores_moeda_real[regime_moeda(datas)]
+
+# função para definir o fator histórico do real para  moeda antiga
+def fator_historico_real_moedaantiga(datas):
+    return fatores_real_moeda[regime_moeda(datas)]
+
+# símbolo monetário vigente na(s) data(s)
+def simbolo_moeda(datas):
+    return simbolos_moeda[regime_moeda(datas)]
+
+# --- série mensal compacta ---
+# das séries do Ipeadata só usamos a variação mensal e as datas. Cada série guarda apenas um array float64
+# contíguo com as variações e o número do mês inicial (meses desde jan/1970, o mesmo valor de um datetime64[M]):
+# a posição de um mês na série é "mes - mes_inicial", sem índice de datas nem buscas. Objetos do pandas só são
+# montados na borda (tabela do app, exportações e matriz de comparação).
+
+# número do mês (meses desde jan/1970) de uma data (date, datetime, Timestamp) ou de um array de datas
+def numero_mes(datas):
+    if isinstance(datas, (date, pd.Timestamp)):
+        return (datas.year - 1970) * 12 + datas.month - 1
+    numeros = np.asarray(datas, dtype="datetime64[M]").astype(np.int64)
+    return int(numeros) if numeros.ndim == 0 else numeros
+
+# número do dia (dias desde 01/01/1970, o mesmo valor de um datetime64[D]) de uma data ou de um array de datas
+def numero_dia(datas):
+    if isinstance(datas, (date, pd.Timestamp)):
+        return (date(datas.year, datas.month, datas.day) - date(1970, 1, 1)).days
+    numeros = np.asarray(datas, dtype="datetime64[D]").astype(np.int64)
+    return int(numeros) if numeros.ndim == 0 else numeros
+
+# rótulos "mm-aaaa" a partir dos números de mês (a coluna "date" da tabela)
+def rotulos_mes(numeros):
+    return [f"{numero % 12 + 1:02d}-{numero // 12 + 1970}" for numero in numeros.tolist()]
+
+# dataframe do Ipeadata -> (mes_inicial, variacoes). Um mês que falte no meio da série vira NaN: ele não passa na
+# validação das datas e vale fator 1 (como no antigo loc[inicio:fim], que só via as datas existentes)
+def variacoes_mensais(indice_df):
+    meses = numero_mes(indice_df.index.to_numpy())
+    mes_inicial = int(meses.min())
+    variacoes = np.full(int(meses.max()) - mes_inicial + 1, np.nan)
+    variacoes[meses - mes_inicial] = indice_df["VALUE ((% a.m.))"].to_numpy(dtype=float)
+    return mes_inicial, variacoes
+
+# --- índice de fatores acumulados (produto prefixado) ---
+# para cada índice guardamos um array "fatores" com fatores[0] = 1 e fatores[k + 1] = fatores[k] * (1 + variacao_k / 100),
+# calculado uma única vez quando a série é carregada. Assim o fator entre dois meses é uma única divisão.
+def indice_fatores(variacoes):
+    fatores = np.empty(len(variacoes) + 1)
+    fatores[0] = 1.0
+    np.cumprod(1 + np.nan_to_num(variacoes) / 100, out=fatores[1:])
+    return fatores
+
+# --- índice diário (correção pro rata die) ---
+# dentro de cada mês o índice cresce de forma geométrica: no dia d do mês m vale
+# fatores[m] * (1 + variacao_m / 100) ** (decorridos / duracao), com os dias decorridos desde o dia 1 e a duração
+# do mês contados em dias corridos ou em dias úteis (segunda a sexta, menos os feriados do arquivo CORRECAO_FERIADOS,
+# uma data aaaa-mm-dd por linha). O dia 1 de cada mês tem exatamente o fatores[m] da série mensal.
+# o array tem uma posição por dia, do dia 1 do primeiro mês ao dia 1 do mês seguinte ao último, e é montado uma
+# vez por série e por modo (SerieIndice.fatores_diarios): o fator entre dois dias é uma divisão, como no mensal.
+DIAS_PRO_RATA = os.environ.get("CORRECAO_PRO_RATA_DIAS", "corridos")
+modos_pro_rata = ("corridos", "uteis")
+
+def ler_feriados(caminho):
+    if not caminho:
+        return np.array([], dtype="datetime64[D]")
+    with open(caminho, encoding="utf-8") as arquivo:
+        return np.array([linha.strip() for linha in arquivo if linha.strip()], dtype="datetime64[D]")
+
+FERIADOS = ler_feriados(os.environ.get("CORRECAO_FERIADOS"))
+
+def validar_pro_rata(dias):
+    if dias not in modos_pro_rata:
+        raise ValueError(f"Contagem de dias desconhecida: {dias}. Use um de {', '.join(modos_pro_rata)}.")
+
+def indice_diario(mes_inicial, variacoes, fatores, dias):
+    inicio_meses = np.arange(mes_inicial, mes_inicial + len(variacoes) + 1).astype("datetime64[M]").astype("datetime64[D]")
+    todos = np.arange(inicio_meses[0], inicio_meses[-1] + 1)
+    mes = np.searchsorted(inicio_meses, todos, side="right") - 1  # o último dia cai no "mês" len(variacoes): fatores[-1]
+    taxas = np.append(1 + np.nan_to_num(variacoes) / 100, 1.0)
+    if dias == "uteis":
+        decorridos = np.busday_count(inicio_meses[mes], todos, holidays=FERIADOS)
+        duracao = np.busday_count(inicio_meses[:-1], inicio_meses[1:], holidays=FERIADOS)
+    else:
+        decorridos = (todos - inicio_meses[mes]).astype(np.int64)
+        duracao = np.diff(inicio_meses).astype(np.int64)
+    duracao = np.append(np.maximum(duracao, 1), 1)
+    return fatores[mes] * taxas[mes] ** (decorridos / duracao[mes])
+
+# as funções abaixo recebem a SerieIndice (e não o nome) para que um cálculo use do começo ao fim a mesma
+# versão da série, mesmo que uma atualização troque os dados no meio dele
+# função para fazer a correção monetária considerando a inflação
+def inflacao(serie, inicio, fim):
+    i, j = serie.posicoes(inicio, fim)
+    return serie.fatores[j] / serie.fatores[i]
+
+# função para fazer a correção monetária considerando uma deflação
+def deflacao(serie, inicio, fim):
+    return 1 / inflacao(serie, inicio, fim)
+
+
+# --- lógica para ler e guardar os dados dos índices de correção monetária do ipeadata ---
+# dicionário de índices de correção monetária
+indices = {
+    "IPCA": "PRECOS12_IPCAG12",
+    "IGP_M": "IGP12_IGPMG12",
+    "IGP_DI": "IGP12_IGPDIG12",
+    "SELIC_OVER": "BM12_TJOVER12",
+    "INPC": "PRECOS12_INPCBR12",
+    "IPC_BR": "IGP12_IPCG12",
+    "IPC_FIPE": "FIPE12_FIPE0001"
+}
+
+# estados de carregamento de cada série
+CARREGANDO = "carregando"
+PRONTO = "pronto"
+FALHOU = "falhou"
+
+# cada índice carregado: variações mensais, mês inicial, índice de fatores acumulados e o estado do carregamento
+class SerieIndice:
+    def __init__(self, nome, codigo):
+        self.nome = nome
+        self.codigo = codigo
+        self.estado = CARREGANDO
+        self.mes_inicial = None
+        self.variacoes = None
+        self.fatores = None
+        self.erro = None
+        self.futuro = None
+        self.versao = None
+        self.atualizada_em = None
+        self.diarios = {}  # modo pro rata ("corridos", "uteis") -> (número do primeiro dia, índice diário)
+
+    # arrays, fatores e versão de uma série carregada (depois disso a série não muda mais)
+    def preencher(self, mes_inicial, variacoes, fatores=None):
+        self.mes_inicial = mes_inicial
+        self.variacoes = variacoes
+        self.fatores = indice_fatores(variacoes) if fatores is None else fatores
+        self.versao = memoria_compartilhada.versao_fatores(self.fatores)
+        self.atualizada_em = datetime.now()
+        self.estado = PRONTO
+
+    # memória dos arrays da série (para o limite do cache de compostos)
+    @property
+    def nbytes(self):
+        arrays = [self.variacoes, self.fatores] + [diario for _, diario in self.diarios.values()]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    # posições [i, j) do período na série, equivalente ao loc[inicio:fim] nas datas, só com aritmética de meses
+    def posicoes(self, inicio, fim):
+        tamanho = len(self.variacoes)
+        i = min(max(numero_mes(inicio) - self.mes_inicial, 0), tamanho)
+        j = min(max(numero_mes(fim) - self.mes_inicial + 1, 0), tamanho)
+        return i, j
+
+    # o mês da data tem variação na série
+    def contem(self, data):
+        k = numero_mes(data) - self.mes_inicial
+        return 0 <= k < len(self.variacoes) and not np.isnan(self.variacoes[k])
+
+    # números de mês das posições [i, j)
+    def meses(self, i=0, j=None):
+        j = len(self.variacoes) if j is None else j
+        return np.arange(self.mes_inicial + i, self.mes_inicial + j)
+
+    # índice diário da série (pro rata die), montado na primeira vez que cada modo é pedido
+    def fatores_diarios(self, dias=None):
+        dias = dias or DIAS_PRO_RATA
+        diario = self.diarios.get(dias)
+        if diario is None:
+            validar_pro_rata(dias)
+            with etapa("indice_diario", dias=dias):
+                diario = (numero_dia(np.datetime64(self.mes_inicial, "M")), indice_diario(self.mes_inicial, self.variacoes, self.fatores, dias))
+            diario = self.diarios.setdefault(dias, diario)
+        return diario
+
+    # a série como pandas.Series (índice DATE), sem os meses faltantes; só para a borda (matriz, exportações)
+    def como_pandas(self):
+        datas = pd.DatetimeIndex(self.meses().astype("datetime64[M]").astype("datetime64[ns]"), name="DATE")
+        return pd.Series(self.variacoes, index=datas, name="VALUE ((% a.m.))").dropna()
+
+# lê a série pelo cache_indices ou, com CORRECAO_COMPARTILHAR=1, mapeando os arquivos publicados uma única vez
+# para todos os workers (memoria_compartilhada)
+def ler_serie(serie):
+    if not memoria_compartilhada.ATIVO:
+        serie.preencher(*variacoes_mensais(carregar_serie(serie.nome, serie.codigo)))
+        return
+
+    def carregar():
+        mes_inicial, variacoes = variacoes_mensais(carregar_serie(serie.nome, serie.codigo))
+        return mes_inicial, variacoes, indice_fatores(variacoes)
+
+    arrays = memoria_compartilhada.obter(serie.nome, carregar, INTERVALO_ATUALIZACAO_HORAS or TTL_CACHE_HORAS)
+    serie.preencher(arrays["mes_inicial"], arrays["variacoes"], arrays["fatores"])
+
+# dataframe no formato do Ipeadata (CODE, RAW DATE, DAY, MONTH, YEAR, VALUE) para exportar a série bruta,
+# refeito a partir das variações (as colunas de metadados não ficam na memória)
+def dados_brutos(serie):
+    variacoes = serie.como_pandas()
+    datas = variacoes.index
+    return pd.DataFrame(
+        {
+            "CODE": serie.codigo,
+            "RAW DATE": datas.strftime("%Y-%m-%dT00:00:00-03:00"),
+            "DAY": datas.day,
+            "MONTH": datas.month,
+            "YEAR": datas.year,
+            "VALUE ((% a.m.))": variacoes,
+        },
+        index=datas,
+    )
+
+def carregar_indice(serie):
+    try:
+        with etapa("carga_indice", indice=serie.nome):
+            ler_serie(serie)
+    except Exception as erro:
+        serie.erro = erro
+        serie.estado = FALHOU
+        return
+    retrato_atual.montar_matriz()
+
+
+# --- retrato dos dados: todas as séries + a matriz de comparação + a versão ---
+# as sessões sempre leem o retrato_atual. Uma atualização monta um retrato novo inteiro fora do event loop
+# e troca a referência de uma vez (uma atribuição); quem já pegou o retrato antigo termina o cálculo nele.
+# os índices compostos de cada retrato ocupam no máximo CORRECAO_CACHE_COMPOSTOS_MB (sai o usado há mais tempo)
+LIMITE_COMPOSTOS_MB = float(os.environ.get("CORRECAO_CACHE_COMPOSTOS_MB", "16"))
+
+class Retrato:
+    def __init__(self, series):
+        self.series = series  # nome -> SerieIndice
+        # variação mensal de todas as séries prontas, alinhadas pelo mês (meses x índices). A comparação entre
+        # índices vira um recorte dessa matriz, sem cópias nem concatenações por clique.
+        self.matriz = pd.DataFrame(dtype=float)
+        self.trava_matriz = threading.Lock()
+        # índices compostos já montados sobre as séries deste retrato (nome canônico -> SerieIndice). Os nomes vêm
+        # dos clientes (API e app): o cache é limitado em bytes e só guarda o nome canônico de cada composto
+        self.compostos = CacheLRU("compostos", int(LIMITE_COMPOSTOS_MB * 1024 * 1024))
+
+    # remontada a cada série que fica pronta na carga inicial; num retrato novo, uma única vez antes da troca
+    def montar_matriz(self):
+        with self.trava_matriz:
+            prontas = {nome: serie.como_pandas() for nome, serie in self.series.items() if serie.estado == PRONTO}
+            self.matriz = pd.DataFrame(prontas, dtype=float).sort_index()
+
+    # versão dos dados: muda sempre que alguma série muda (usada como ETag/chave de cache e mostrada no app)
+    def versao(self):
+        versoes = "|".join(f"{nome}:{serie.versao}" for nome, serie in self.series.items())
+        return hashlib.sha1(versoes.encode()).hexdigest()[:16]
+
+# retrato inicial: as séries são preenchidas pela carga em segundo plano (iniciar_carga)
+retrato_atual = Retrato({nome: SerieIndice(nome, codigo) for nome, codigo in indices.items()})
+
+executor_carga = ThreadPoolExecutor(max_workers=len(indices), thread_name_prefix="carga_indices")
+trava_carga = threading.Lock()
+
+# carregando os índices inflacionários em paralelo, em segundo plano (do cache local em disco; o Ipeadata só
+# é consultado quando o cache vence). Quem chama não espera a carga terminar.
+def iniciar_carga(nomes=None):
+    with trava_carga:
+        series = retrato_atual.series
+        for nome in nomes or series:
+            serie = series[nome]
+            if serie.futuro is None:
+                serie.futuro = executor_carga.submit(carregar_indice, serie)
+
+# espera (bloqueando a thread atual) a série pedida; para scripts, jobs em lote e threads de trabalho.
+# com "retrato" a série vem desse retrato (um cálculo com várias séries usa todas da mesma versão)
+def serie_pronta(nome, retrato=None):
+    if eh_composto(nome):
+        return serie_composta(nome, retrato or retrato_atual)
+    iniciar_carga([nome])
+    serie = (retrato or retrato_atual).series[nome]
+    serie.futuro.result()
+    if serie.estado == FALHOU:
+        raise ValueError(f"Não foi possível carregar o {nome}: {serie.erro}")
+    return serie
+
+# espera (sem bloquear o event loop) apenas a série pedida
+async def aguardar_indice(nome):
+    if eh_composto(nome):
+        for indice, _ in segmentos_composto(nome):
+            await aguardar_indice(indice)
+        return serie_composta(nome, retrato_atual)
+    iniciar_carga([nome])
+    serie = retrato_atual.series[nome]
+    await asyncio.wrap_future(serie.futuro)
+    if serie.estado == FALHOU:
+        raise ValueError(f"Não foi possível carregar o {nome}: {serie.erro}")
+    return serie
+
+# versão dos dados do retrato atual
+def versao_dados():
+    return retrato_atual.versao()
+
+# estado da carga de cada série (para o endpoint de prontidão)
+def estados_indices():
+    return {nome: serie.estado for nome, serie in retrato_atual.series.items()}
+
+
+# --- índices compostos (encadeados) ---
+# contratos que trocam de índice ao longo do tempo: "IGP_DI+IPCA@2010-01" usa o IGP-DI até dez/2009 e o IPCA a
+# partir de jan/2010 (quantos segmentos forem precisos, cada um com o mês a partir do qual vale; o primeiro pode
+# ter um mês inicial). A série combinada é uma SerieIndice comum (variações + índice de fatores), montada uma
+# única vez por retrato e guardada em retrato.compostos: daí em diante corrigir, tabelas, parcelas, lote e
+# comparação custam o mesmo que com um índice simples. Uma atualização dos dados cria um retrato novo, sem compostos.
+def eh_composto(nome):
+    return "+" in nome or "@" in nome
+
+# "IGP-DI + IPCA@2010-01" -> (("IGP_DI", None), ("IPCA", 480)): índice e número do mês a partir do qual vale
+def segmentos_composto(nome):
+    segmentos = []
+    for parte in nome.split("+"):
+        indice, _, mes = parte.partition("@")
+        indice = indice.strip().upper().replace("-", "_")
+        if indice not in indices:
+            raise ValueError(f"Índice desconhecido no composto: {indice}. Use um de {', '.join(indices)}.")
+        if segmentos and not mes.strip():
+            raise ValueError(f"Informe o mês a partir do qual vale o {indice} (ex. IGP_DI+IPCA@2010-01).")
+        numero = numero_mes(ler_data(mes)) if mes.strip() else None
+        if segmentos and segmentos[-1][1] is not None and numero <= segmentos[-1][1]:
+            raise ValueError("Os meses dos segmentos do índice composto devem estar em ordem crescente.")
+        segmentos.append((indice, numero))
+    return tuple(segmentos)
+
+# nome canônico do composto ("IGP_DI+IPCA@2010-01"), usado como chave e mostrado nas tabelas
+def nome_composto(segmentos):
+    return "+".join(
+        indice if numero is None else f"{indice}@{numero // 12 + 1970}-{numero % 12 + 1:02d}" for indice, numero in segmentos
+    )
+
+# nome digitado (índice simples ou composto) no formato usado pelo motor; um composto inválido volta como veio
+# (o erro aparece ao usar a série)
+def normalizar_nome(nome):
+    nome = str(nome).strip()
+    if not eh_composto(nome):
+        return nome.upper().replace("-", "_")
+    try:
+        return nome_composto(segmentos_composto(nome))
+    except ValueError:
+        return nome.upper()
+
+# nome válido (índice de "indices" ou composto bem formado) no formato do motor, ou ValueError
+def validar_nome(nome):
+    nome = normalizar_nome(nome)
+    if eh_composto(nome):
+        segmentos_composto(nome)
+    elif nome not in indices:
+        raise ValueError(f"Índice desconhecido: {nome}. Use um de {', '.join(indices)}.")
+    return nome
+
+# série combinada: em cada mês, a variação do segmento vigente. Vai até o último mês da série do último segmento.
+# cada segmento tem de ser coberto pela série do seu índice: um mês sem variação entre o início e o fim valeria
+# fator 1 (o nan_to_num do indice_fatores), e a inflação desse trecho sumiria da correção sem aviso
+def montar_serie_composta(nome, segmentos, componentes):
+    primeiro = componentes[segmentos[0][0]]
+    mes_inicial = primeiro.mes_inicial if segmentos[0][1] is None else segmentos[0][1]
+    ultimo = componentes[segmentos[-1][0]]
+    mes_final = ultimo.mes_inicial + len(ultimo.variacoes)
+    variacoes = np.full(max(mes_final - mes_inicial, 0), np.nan)
+    for k, (indice, numero) in enumerate(segmentos):
+        serie = componentes[indice]
+        de = mes_inicial if numero is None else numero
+        ate = segmentos[k + 1][1] if k + 1 < len(segmentos) else mes_final
+        fim_serie = serie.mes_inicial + len(serie.variacoes)
+        if de >= ate:  # o primeiro índice começa depois do mês do segundo, ou o último acaba antes do seu
+            raise ValueError(
+                f"O {indice} não tem dados no período em que vale no composto {nome} "
+                f"(a série vai de {rotulos_mes(np.array([serie.mes_inicial]))[0]} a {rotulos_mes(np.array([fim_serie - 1]))[0]})."
+            )
+        if de < serie.mes_inicial or ate > fim_serie:
+            faltando = (de, serie.mes_inicial - 1) if de < serie.mes_inicial else (fim_serie, ate - 1)
+            inicio_falta, fim_falta = rotulos_mes(np.array(faltando))
+            raise ValueError(
+                f"O {indice} não tem dados de {inicio_falta} a {fim_falta}, período em que ele vale no composto {nome} "
+                f"(a série vai de {rotulos_mes(np.array([serie.mes_inicial]))[0]} a {rotulos_mes(np.array([fim_serie - 1]))[0]})."
+            )
+        variacoes[de - mes_inicial:ate - mes_inicial] = serie.variacoes[de - serie.mes_inicial:ate - serie.mes_inicial]
+
+    composta = SerieIndice(nome, "composto")
+    composta.preencher(mes_inicial, variacoes)
+    composta.futuro = Future()
+    composta.futuro.set_result(None)
+    return composta
+
+# série do composto no retrato (montada na primeira vez, esperando as séries dos segmentos). A chave é sempre o
+# nome canônico: grafias diferentes do mesmo composto ("ipca + igp-m@2010-01") não ocupam entradas novas
+def serie_composta(nome, retrato):
+    segmentos = segmentos_composto(nome)
+    canonico = nome_composto(segmentos)
+
+    def montar():
+        componentes = {indice: serie_pronta(indice, retrato) for indice, _ in segmentos}
+        return montar_serie_composta(canonico, segmentos, componentes)
+
+    return retrato.compostos.obter(canonico, montar)
+
+# compostos cujas séries já estão prontas no retrato (para a comparação, que não espera a carga). Um composto
+# sem dados em algum segmento fica fora do gráfico; o erro aparece na correção dele
+def compostos_prontos(compostos, retrato):
+    prontos = {}
+    for nome in compostos:
+        segmentos = segmentos_composto(nome)
+        if all(retrato.series[indice].estado == PRONTO for indice, _ in segmentos):
+            try:
+                prontos[nome_composto(segmentos)] = serie_composta(nome, retrato)
+            except ValueError:
+                continue
+    return prontos
+
+
+# --- atualização periódica em segundo plano ---
+# a cada INTERVALO_ATUALIZACAO_HORAS relê as séries pelo cache_indices (que busca no Ipeadata só os meses novos
+# quando o cache vence), monta um retrato novo com fatores e matriz e troca o retrato_atual. As sessões abertas
+# continuam conectadas; o próximo cálculo de cada uma já usa os dados novos. Série que falhar mantém a versão anterior.
+INTERVALO_ATUALIZACAO_HORAS = float(os.environ.get("CORRECAO_ATUALIZACAO_HORAS", TTL_CACHE_HORAS))
+trava_atualizacao = threading.Lock()
+parar_atualizacao = threading.Event()
+
+def atualizar_dados():
+    global retrato_atual
+    with trava_atualizacao:
+        antigo = retrato_atual
+        series = {}
+        for nome, serie_antiga in antigo.series.items():
+            if serie_antiga.futuro is not None:
+                serie_antiga.futuro.result()  # não atualiza uma série que ainda está na carga inicial
+            serie = SerieIndice(nome, serie_antiga.codigo)
+            try:
+                with etapa("atualizacao_indice", indice=nome):
+                    ler_serie(serie)
+            except Exception:
+                series[nome] = serie_antiga
+                continue
+            if serie_antiga.estado == PRONTO and serie.versao == serie_antiga.versao:
+                serie = serie_antiga  # sem meses novos: reaproveita a série (e os caches ligados à versão dela)
+            series[nome] = serie
+
+        if all(series[nome] is antigo.series[nome] for nome in series):
+            return antigo
+        for serie in series.values():
+            if serie.futuro is None:
+                serie.futuro = Future()
+                serie.futuro.set_result(None)
+        novo = Retrato(series)
+        novo.montar_matriz()
+        retrato_atual = novo
+        # os resultados guardados são da versão anterior (as chaves têm a versão; limpar só libera a memória)
+        cache_resultados.limpar()
+        incrementar("correcao_atualizacoes_total")
+        return novo
+
+# com as séries compartilhadas a verificação é frequente (só lê os manifestos): quando outro worker publica
+# uma versão nova, este passa a usá-la em até INTERVALO_VERIFICACAO_SEGUNDOS, sem buscar nada na fonte
+INTERVALO_VERIFICACAO_SEGUNDOS = 60
+
+# segundos entre duas atualizações; Event.wait não aceita mais que threading.TIMEOUT_MAX (um intervalo enorme,
+# mas finito, derrubava a thread com OverflowError)
+def espera_atualizacao(intervalo_horas):
+    espera = min(intervalo_horas * 3600, threading.TIMEOUT_MAX)
+    if memoria_compartilhada.ATIVO:
+        espera = min(espera, INTERVALO_VERIFICACAO_SEGUNDOS)
+    return espera
+
+def laco_atualizacao(intervalo_horas):
+    espera = espera_atualizacao(intervalo_horas)
+    while not parar_atualizacao.wait(espera):
+        try:
+            atualizar_dados()
+        except Exception:
+            continue  # tenta de novo no próximo intervalo
+
+# inicia a thread de atualização (uma vez por processo); com intervalo 0 ou infinito (um cache que não vence, como
+# num retrato local das séries) a atualização fica desligada
+def iniciar_atualizacao(intervalo_horas=None):
+    intervalo_horas = INTERVALO_ATUALIZACAO_HORAS if intervalo_horas is None else intervalo_horas
+    if not 0 < intervalo_horas < float("inf") or any(t.name == "atualizacao_indices" for t in threading.enumerate()):
+        return
+    threading.Thread(target=laco_atualizacao, args=(intervalo_horas,), name="atualizacao_indices", daemon=True).start()
+
+
+# comparação entre índices no período: variação mensal (%) e quanto "base" reais viram mês a mês em cada índice,
+# as duas calculadas sobre o mesmo recorte da matriz em uma única passada vetorizada (e guardadas no cache_resultados).
+# "compostos" acrescenta colunas de índices compostos (os que já têm todas as séries prontas)
+def comparacao_periodo(inicio, fim, base=100.0, compostos=()):
+    retrato = retrato_atual
+    matriz = retrato.matriz
+    extras = compostos_prontos(compostos, retrato)
+
+    def calcular():
+        variacoes = matriz.loc[inicio:fim]
+        if extras:
+            variacoes = variacoes.assign(**{nome: serie.como_pandas() for nome, serie in extras.items()})
+        acumulado = base * (1 + variacoes / 100).cumprod()
+        return variacoes, acumulado
+
+    # as colunas entram na chave porque, durante a carga inicial, a matriz ainda não tem todas as séries prontas
+    chave = ("comparacao", inicio, fim, base, retrato.versao(), tuple(matriz.columns), tuple(extras))
+    return cache_resultados.obter(chave, calcular)
+
+
+# --- correção de um valor entre duas datas ---
+# converte as datas de entrada (date ou datetime) para o primeiro dia do mês e garante a ordem (menor, maior)
+def datas_mensais(data_inicial, data_final):
+    data_inicial_fmt = datetime(data_inicial.year, data_inicial.month, 1)
+    data_final_fmt = datetime(data_final.year, data_final.month, 1)
+    inicio = min(data_inicial_fmt, data_final_fmt)
+    fim = max(data_inicial_fmt, data_final_fmt)
+    return data_inicial_fmt, data_final_fmt, inicio, fim
+
+# valida se as datas existem na série
+def validar_datas(serie, data_inicial_fmt, data_final_fmt):
+    if not (serie.contem(data_inicial_fmt) and serie.contem(data_final_fmt)):
+        meses = serie.meses()[[0, -1]].astype("datetime64[M]")
+        data_inicial_valida, data_final_valida = pd.Timestamp(meses[0]), pd.Timestamp(meses[1])
+        raise ValueError(
+            f"As datas digitadas não estão no período do {serie.nome}. "
+            f"Use entre {data_inicial_valida} até {data_final_valida}."
+        )
+
+# aplicação do período no índice escolhido: posições [i, j) na série
+def dados_periodo(serie, data_inicial_fmt, data_final_fmt, inicio, fim):
+    validar_datas(serie, data_inicial_fmt, data_final_fmt)
+    return serie.posicoes(inicio, fim)
+
+# correção direta (sem a tabela mês a mês): fator acumulado, inflação no período e valor corrigido,
+# os mesmos números dos KPIs do app. Custa O(1): uma divisão no índice de fatores.
+def corrigir(nome, data_inicial, data_final, valor):
+    serie = serie_pronta(nome)
+    data_inicial_fmt, data_final_fmt, inicio, fim = datas_mensais(data_inicial, data_final)
+    validar_datas(serie, data_inicial_fmt, data_final_fmt)
+
+    if data_inicial_fmt <= data_final_fmt:
+        fator = inflacao(serie, inicio, fim)
+        valor_corrigido = valor * fator * fator_historico(data_inicial_fmt)
+    else:
+        fator = deflacao(serie, inicio, fim)
+        valor_corrigido = valor * fator * fator_historico_real_moedaantiga(data_final_fmt)
+
+    return {
+        "indice": nome,
+        "data_inicial": data_inicial_fmt.strftime("%Y-%m"),
+        "data_final": data_final_fmt.strftime("%Y-%m"),
+        "valor": valor,
+        "fator_acumulado": float(fator),
+        "inflacao_periodo": float((fator - 1) * 100),
+        "valor_corrigido": float(valor_corrigido),
+        "moeda": str(simbolo_moeda(data_final_fmt)),
+        "versao_dados": serie.versao,
+    }
+
+# correção pro rata die: como o corrigir, mas do dia exato da data inicial ao dia exato da data final, pelo índice
+# diário da série ("dias": corridos ou uteis; padrão CORRECAO_PRO_RATA_DIAS). De um dia 1 a outro dia 1 entram só
+# os meses inteiros entre eles (na correção mensal o mês final entra inteiro). Também O(1).
+def corrigir_pro_rata(nome, data_inicial, data_final, valor, dias=None):
+    serie = serie_pronta(nome)
+    data_inicial, data_final = (datetime(data.year, data.month, data.day) for data in (data_inicial, data_final))
+    validar_datas(serie, data_inicial, data_final)
+    dia_inicial, diario = serie.fatores_diarios(dias)
+    fator = diario[numero_dia(data_final) - dia_inicial] / diario[numero_dia(data_inicial) - dia_inicial]
+
+    if data_inicial <= data_final:
+        valor_corrigido = valor * fator * fator_historico(data_inicial)
+    else:
+        valor_corrigido = valor * fator * fator_historico_real_moedaantiga(data_final)
+
+    return {
+        "indice": nome,
+        "data_inicial": data_inicial.strftime("%Y-%m-%d"),
+        "data_final": data_final.strftime("%Y-%m-%d"),
+        "valor": valor,
+        "fator_acumulado": float(fator),
+        "inflacao_periodo": float((fator - 1) * 100),
+        "valor_corrigido": float(valor_corrigido),
+        "moeda": str(simbolo_moeda(data_final)),
+        "pro_rata": dias or DIAS_PRO_RATA,
+        "versao_dados": serie.versao,
+    }
+
+# tabela de fatores do período, sem o valor (date, variacao_mensal, fator_acumulado + o fator da moeda em attrs).
+# é a parte cara da tabela_correcao e só depende de (índice, data inicial, data final): quando apenas o valor
+# muda, basta aplicar_valor sobre a mesma tabela. Fica no cache_resultados, compartilhada entre as sessões.
+def tabela_fatores(nome, data_inicial, data_final):
+    serie = serie_pronta(nome)
+    data_inicial_fmt, data_final_fmt, inicio, fim = datas_mensais(data_inicial, data_final)
+    return cache_resultados.obter(
+        ("fatores", nome, data_inicial_fmt, data_final_fmt, serie.versao),
+        lambda: calcular_tabela_fatores(serie, data_inicial_fmt, data_final_fmt, inicio, fim),
+    )
+
+def calcular_tabela_fatores(serie, data_inicial_fmt, data_final_fmt, inicio, fim):
+    nome = serie.nome
+    i, j = dados_periodo(serie, data_inicial_fmt, data_final_fmt, inicio, fim)
+
+    # fatia das variações e fator acumulado mês a mês, lido direto do índice de fatores da série
+    variacoes = serie.variacoes[i:j]
+    fatores_acumulados = serie.fatores[i + 1:j + 1] / serie.fatores[i]
+
+    # inflação (data_inicial <= data_final)
+    if data_inicial_fmt <= data_final_fmt:
+        fator_moeda = fator_historico(data_inicial_fmt)
+
+    # deflação (data_inicial > data_final)
+    else:
+        fatores_acumulados = 1 / fatores_acumulados
+        fator_moeda = fator_historico_real_moedaantiga(data_final_fmt)
+
+    # o DataFrame só é montado aqui, na saída (meses faltantes na série não viram linhas)
+    existentes = ~np.isnan(variacoes)
+    meses = serie.meses(i, j)[existentes]
+    tabela = pd.DataFrame(
+        {
+            "date": rotulos_mes(meses),
+            "variacao_mensal": variacoes[existentes],
+            "fator_acumulado": fatores_acumulados[existentes],
+        },
+        index=pd.DatetimeIndex(meses.astype("datetime64[M]").astype("datetime64[ns]"), name="DATE"),
+    )
+    tabela.attrs["fator_moeda"] = fator_moeda
+    # versão da série usada no cálculo (o app mostra na tabela e no excel)
+    tabela.attrs["indice"] = nome
+    tabela.attrs["versao_dados"] = serie.versao
+    tabela.attrs["atualizada_em"] = serie.atualizada_em
+    return tabela
+
+# valor corrigido mês a mês sobre uma tabela de fatores: só a multiplicação valor * fator_acumulado * fator da moeda
+def aplicar_valor(tabela, valor):
+    return tabela.assign(valor_corrigido=valor * tabela["fator_acumulado"].to_numpy() * tabela.attrs["fator_moeda"])
+
+# tabela mês a mês da correção (date, variacao_mensal, fator_acumulado, valor_corrigido)
+def tabela_correcao(nome, data_inicial, data_final, valor):
+    return aplicar_valor(tabela_fatores(nome, data_inicial, data_final), valor)
+
+
+# --- tabelas de fatores "estilo tribunal" ---
+# para um índice, o fator que leva 1 unidade da moeda de cada mês até a data alvo, em reais (ou na moeda da
+# data alvo): o mesmo número que corrigir(nome, mes, data_alvo, 1)["valor_corrigido"] daria mês a mês, mas
+# calculado para todos os meses de uma vez sobre o índice de fatores, com o fator_historico de cada linha.
+DATA_INICIAL_TABELAS = datetime(1970, 1, 1)
+
+# posições (na série) dos meses com variação entre "desde" e "ate" (sem "ate": até o último mês da série)
+def posicoes_validas(serie, desde, ate=None):
+    i = serie.posicoes(desde, desde)[0]
+    j = len(serie.variacoes) if ate is None else serie.posicoes(desde, ate)[1]
+    return i + np.flatnonzero(~np.isnan(serie.variacoes[i:j]))
+
+# tabela de fatores de todos os meses desde "desde" até a data alvo (date, moeda, variacao_mensal,
+# fator_acumulado, fator_historico, fator). "fator" = fator_acumulado * fator_historico: multiplicado pelo valor
+# na moeda do mês dá o valor corrigido na data alvo. Fica no cache_resultados, como a tabela_fatores.
+def tabela_fatores_alvo(nome, data_alvo, desde=DATA_INICIAL_TABELAS):
+    serie = serie_pronta(nome)
+    data_alvo_fmt = datetime(data_alvo.year, data_alvo.month, 1)
+    desde_fmt = datetime(desde.year, desde.month, 1)
+    return cache_resultados.obter(
+        ("fatores_alvo", nome, data_alvo_fmt, desde_fmt, serie.versao),
+        lambda: calcular_tabela_fatores_alvo(serie, data_alvo_fmt, desde_fmt),
+    )
+
+def calcular_tabela_fatores_alvo(serie, data_alvo_fmt, desde_fmt):
+    validar_datas(serie, data_alvo_fmt, data_alvo_fmt)
+    k = numero_mes(data_alvo_fmt) - serie.mes_inicial
+    posicoes = posicoes_validas(serie, desde_fmt, data_alvo_fmt)
+
+    # uma divisão por linha no índice de fatores e o regime monetário de cada mês em uma única busca
+    meses = serie.meses()[posicoes]
+    datas = meses.astype("datetime64[M]")
+    fatores_acumulados = serie.fatores[k + 1] / serie.fatores[posicoes]
+    fatores_moeda = fator_historico(datas)
+    tabela = pd.DataFrame(
+        {
+            "date": rotulos_mes(meses),
+            "moeda": simbolo_moeda(datas),
+            "variacao_mensal": serie.variacoes[posicoes],
+            "fator_acumulado": fatores_acumulados,
+            "fator_historico": fatores_moeda,
+            "fator": fatores_acumulados * fatores_moeda,
+        },
+        index=pd.DatetimeIndex(datas.astype("datetime64[ns]"), name="DATE"),
+    )
+    tabela.attrs["indice"] = serie.nome
+    tabela.attrs["data_alvo"] = data_alvo_fmt
+    tabela.attrs["versao_dados"] = serie.versao
+    tabela.attrs["atualizada_em"] = serie.atualizada_em
+    return tabela
+
+# matriz completa (data inicial x data final) de um índice, em blocos de "linhas_bloco" datas iniciais, para ser
+# gravada aos poucos (exportacao.escrever_tabela) sem montar a matriz inteira: cada célula é o
+# valor_corrigido do corrigir(nome, data_inicial, data_final, 1), inflação acima da diagonal e deflação abaixo
+LINHAS_BLOCO_MATRIZ = 256
+
+def blocos_matriz_fatores(nome, desde=DATA_INICIAL_TABELAS, ate=None, linhas_bloco=LINHAS_BLOCO_MATRIZ):
+    serie = serie_pronta(nome)
+    posicoes = posicoes_validas(serie, desde, ate)
+    meses = serie.meses()[posicoes]
+    datas = meses.astype("datetime64[M]")
+    rotulos = rotulos_mes(meses)
+
+    # por coluna (data final): índice de fatores no fim do mês e no início (deflação) e o fator real -> moeda antiga
+    fim_coluna = serie.fatores[posicoes + 1]
+    inicio_coluna = serie.fatores[posicoes]
+    moeda_coluna = fator_historico_real_moedaantiga(datas)
+    # por linha (data inicial): o fator moeda antiga -> real
+    moeda_linha = fator_historico(datas)
+
+    for a in range(0, len(posicoes), linhas_bloco):
+        b = min(a + linhas_bloco, len(posicoes))
+        linhas = posicoes[a:b, None]
+        inflacao_bloco = fim_coluna / serie.fatores[linhas] * moeda_linha[a:b, None]
+        deflacao_bloco = inicio_coluna / serie.fatores[linhas + 1] * moeda_coluna
+        valores = np.where(linhas <= posicoes, inflacao_bloco, deflacao_bloco)
+        yield pd.DataFrame(valores, index=pd.Index(rotulos[a:b], name="data_inicial"), columns=rotulos)
+
+
+# --- correção em lote (planilhas com milhares de linhas) ---
+# colunas esperadas no arquivo: valor, data_inicial, data_final, indice
+TAMANHO_BLOCO = 50_000
+colunas_lote = ["valor", "data_inicial", "data_final", "indice"]
+
+# lê a planilha enviada em blocos de TAMANHO_BLOCO linhas (csv ou xlsx), sem carregar o arquivo inteiro na memória
+def ler_blocos(caminho, nome_arquivo):
+    if nome_arquivo.lower().endswith(".xlsx"):
+        from openpyxl import load_workbook
+
+        planilha = load_workbook(caminho, read_only=True, data_only=True)
+        linhas = planilha.active.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            planilha.close()
+            raise ValueError("Planilha vazia")
+        while bloco := list(itertools.islice(linhas, TAMANHO_BLOCO)):
+            yield pd.DataFrame(bloco, columns=cabecalho)
+        planilha.close()
+    else:
+        with open(caminho, encoding="utf-8-sig") as arquivo:
+            separador, decimal = formato_csv(arquivo.readline())
+        yield from pd.read_csv(caminho, sep=separador, decimal=decimal, chunksize=TAMANHO_BLOCO, encoding="utf-8-sig")
+
+# csv "brasileiro" (separador ; e decimal ,) ou csv padrão, pelo cabeçalho: (separador, decimal)
+def formato_csv(primeira_linha):
+    return (";", ",") if ";" in primeira_linha else (",", ".")
+
+# corrige todas as linhas de um bloco de uma vez (vetorizado), com a mesma regra do resultados():
+# inflação usa o fator_historico da data inicial, deflação o fator_historico_real_moedaantiga da data final.
+# com pro_rata ("corridos" ou "uteis") a correção vai do dia exato ao dia exato, pelo índice diário (corrigir_pro_rata)
+def corrigir_lote(lote, pro_rata=None):
+    if pro_rata is not None:
+        validar_pro_rata(pro_rata)
+    with etapa("lote"):
+        resultado = corrigir_lote_vetorizado(lote, pro_rata)
+    incrementar("correcao_lote_linhas_total", len(resultado))
+    return resultado
+
+def corrigir_lote_vetorizado(lote, pro_rata=None):
+    lote = lote.rename(columns=lambda coluna: str(coluna).strip().lower())
+    valores = pd.to_numeric(lote["valor"], errors="coerce").to_numpy(dtype=float)
+    unidade = "datetime64[M]" if pro_rata is None else "datetime64[D]"
+    datas_iniciais = datas_lote(lote["data_inicial"]).astype(unidade)
+    datas_finais = datas_lote(lote["data_final"]).astype(unidade)
+    # nomes normalizados uma vez por nome distinto (índices simples ou compostos)
+    codigos, distintos = pd.factorize(lote["indice"].astype(str))
+    nomes = np.array([normalizar_nome(nome) for nome in distintos], dtype=object)[codigos]
+
+    retrato = retrato_atual
+    versoes = {}  # nome -> versão da série usada (a mesma do corrigir)
+    fatores_acumulados = np.full(len(lote), np.nan)
+    erros = np.full(len(lote), "", dtype=object)
+    erros[~np.isfinite(valores) | np.isnat(datas_iniciais) | np.isnat(datas_finais)] = "valor ou data inválidos"
+
+    for nome in pd.unique(nomes):
+        linhas = nomes == nome
+        if nome not in indices and not eh_composto(nome):
+            erros[linhas] = "índice desconhecido"
+            continue
+        try:
+            serie = serie_pronta(nome, retrato) # espera apenas pelas séries usadas no arquivo
+        except ValueError as erro:
+            erros[linhas] = str(erro) if eh_composto(nome) else f"não foi possível carregar o {nome}"
+            continue
+        versoes[nome] = serie.versao
+
+        # posições do mês inicial (i) e do mês final (k) na série, por aritmética de meses
+        tamanho = len(serie.variacoes)
+        i = numero_mes(np.minimum(datas_iniciais[linhas], datas_finais[linhas])) - serie.mes_inicial
+        k = numero_mes(np.maximum(datas_iniciais[linhas], datas_finais[linhas])) - serie.mes_inicial
+        # as duas datas precisam existir na série (mesma validação do dados_periodo)
+        fora = (i < 0) | (i >= tamanho) | (k < 0) | (k >= tamanho)
+        i, k = np.clip(i, 0, tamanho - 1), np.clip(k, 0, tamanho - 1)
+        fora |= np.isnan(serie.variacoes[i]) | np.isnan(serie.variacoes[k])
+        if pro_rata is None:
+            fator = serie.fatores[k + 1] / serie.fatores[i]
+        else:
+            # dias da data menor (a) e da maior (b) no índice diário
+            dia_inicial, diario = serie.fatores_diarios(pro_rata)
+            a = numero_dia(np.minimum(datas_iniciais[linhas], datas_finais[linhas])) - dia_inicial
+            b = numero_dia(np.maximum(datas_iniciais[linhas], datas_finais[linhas])) - dia_inicial
+            fator = diario[np.clip(b, 0, len(diario) - 1)] / diario[np.clip(a, 0, len(diario) - 1)]
+        fator[fora] = np.nan
+        fatores_acumulados[linhas] = fator
+        erros[np.flatnonzero(linhas)[fora & (erros[linhas] == "")]] = f"data fora do período do {nome}"
+
+    eh_inflacao = datas_iniciais <= datas_finais
+    fatores_acumulados = np.where(eh_inflacao, fatores_acumulados, 1 / fatores_acumulados)
+    fatores_moeda = np.where(
+        eh_inflacao, fator_historico(datas_iniciais), fator_historico_real_moedaantiga(datas_finais)
+    )
+
+    resultado = lote[colunas_lote].copy()
+    resultado["fator_acumulado"] = fatores_acumulados
+    resultado["fator_historico"] = fatores_moeda
+    resultado["valor_corrigido"] = valores * fatores_acumulados * fatores_moeda
+    resultado["erro"] = erros
+    resultado.attrs["versoes_dados"] = versoes
+    return resultado
+
+# datas de uma coluna do lote (datetime64[ns]), com as regras do ler_data: 01/02/2020 é 1º de fevereiro, e
+# 2020-02 e 01/2020 podem vir misturados na mesma coluna. Cada valor distinto é lido uma vez; datas que já vêm
+# como datas (xlsx, parcelas) passam direto e o que não for reconhecido vira NaT (erro na linha)
+def datas_lote(coluna):
+    if pd.api.types.is_datetime64_any_dtype(coluna.dtype):
+        return coluna.to_numpy(dtype="datetime64[ns]")
+    codigos, distintos = pd.factorize(coluna)
+    datas = pd.DatetimeIndex([data_lote(valor) for valor in distintos] + [pd.NaT]).to_numpy()
+    return datas[codigos]  # código -1 (vazio) -> o NaT do fim
+
+def data_lote(valor):
+    if isinstance(valor, (date, pd.Timestamp, np.datetime64)):
+        return valor
+    try:
+        return ler_data(valor)
+    except ValueError:
+        return pd.NaT
+
+# corrige a planilha bloco a bloco; cada bloco corrigido é gravado (exportacao.escrever_tabela) e enviado ao
+# cliente à medida que fica pronto
+def corrigir_arquivo(caminho, nome_arquivo, pro_rata=None):
+    for lote in ler_blocos(caminho, nome_arquivo):
+        yield corrigir_lote(lote, pro_rata)
+
+
+# --- correção de parcelas (fluxo de pagamentos) ---
+# uma lista de parcelas (data, valor) de um índice, todas corrigidas até a mesma data alvo e somadas. É uma única
+# chamada ao corrigir_lote (uma divisão por parcela no índice de fatores), com a conversão de moeda de cada parcela:
+# parcela antes da data alvo usa a inflação e o fator_historico da data dela; depois, a deflação para a moeda da data alvo.
+colunas_parcelas = ["data", "valor"]
+
+# formatos de data aceitos (o dia só conta na correção pro rata die)
+formatos_data = ["%Y-%m-%d", "%Y-%m", "%m-%Y", "%m/%Y", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S"]
+
+def ler_data(texto):
+    for formato in formatos_data:
+        try:
+            return datetime.strptime(str(texto).strip(), formato)
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {texto!r}. Use, por exemplo, 2020-01 ou 01-2020.")
+
+# valor digitado: "1500.50", "1500,50" ou "1.500,50"
+def ler_valor(texto):
+    texto = str(texto).strip().replace(" ", "")
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return float(texto)
+    except ValueError:
+        raise ValueError(f"Valor inválido: {texto!r}.")
+
+# parcelas digitadas, uma por linha: "data;valor" (ou separadas por tabulação/espaço), ex. "01/2020;1.500,00"
+def ler_parcelas(texto):
+    datas, valores = [], []
+    for numero, linha in enumerate(texto.splitlines(), start=1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        partes = linha.replace("\t", ";").split(";") if ("\t" in linha or ";" in linha) else linha.split()
+        if len(partes) != 2:
+            raise ValueError(f"Linha {numero} das parcelas: use \"data;valor\" (ex. 01/2020;1.500,00).")
+        datas.append(ler_data(partes[0]))
+        valores.append(ler_valor(partes[1]))
+    return pd.DataFrame({"data": datas, "valor": valores})
+
+# parcelas de uma planilha (csv ou xlsx com as colunas data e valor). Colunas lidas como texto passam pelo
+# ler_data/ler_valor (01/2020, 1.500,00); o que não for reconhecido vira uma linha com erro na correção
+def ler_arquivo_parcelas(caminho, nome_arquivo):
+    parcelas = pd.concat(list(ler_blocos(caminho, nome_arquivo)), ignore_index=True)
+    parcelas = parcelas.rename(columns=lambda coluna: str(coluna).strip().lower())
+    if "data" in parcelas.columns and not pd.api.types.is_datetime64_any_dtype(parcelas["data"]):
+        parcelas["data"] = pd.to_datetime([ou_vazio(ler_data, data, pd.NaT) for data in parcelas["data"]])
+    if "valor" in parcelas.columns and not pd.api.types.is_numeric_dtype(parcelas["valor"]):
+        parcelas["valor"] = [ou_vazio(ler_valor, valor, np.nan) for valor in parcelas["valor"]]
+    return parcelas
+
+def ou_vazio(ler, texto, vazio):
+    if isinstance(texto, (date, pd.Timestamp, int, float)):
+        return texto
+    try:
+        return ler(texto)
+    except ValueError:
+        return vazio
+
+# parcelas (dataframe com as colunas data e valor) corrigidas até a data alvo: uma linha por parcela (data, valor,
+# moeda, fator_acumulado, fator_historico, valor_corrigido, erro) e o total corrigido das parcelas sem erro.
+# com pro_rata ("corridos" ou "uteis") cada parcela é corrigida do dia em que foi paga até o dia da data alvo
+def corrigir_parcelas(nome, parcelas, data_alvo, pro_rata=None):
+    parcelas = parcelas.rename(columns=lambda coluna: str(coluna).strip().lower())
+    faltando = [coluna for coluna in colunas_parcelas if coluna not in parcelas.columns]
+    if faltando:
+        raise ValueError(f"Faltam as colunas {', '.join(faltando)} nas parcelas.")
+    data_alvo_fmt = datetime(data_alvo.year, data_alvo.month, 1 if pro_rata is None else data_alvo.day)
+    formato_data = "%m-%Y" if pro_rata is None else "%d-%m-%Y"
+    serie = serie_pronta(nome)
+
+    with etapa("parcelas"):
+        corrigido = corrigir_lote(pd.DataFrame({
+            "valor": parcelas["valor"].to_numpy(),
+            "data_inicial": parcelas["data"].to_numpy(),
+            "data_final": data_alvo_fmt,
+            "indice": nome,
+        }), pro_rata)
+        datas = pd.to_datetime(corrigido["data_inicial"], errors="coerce")
+        tabela = pd.DataFrame({
+            "data": datas.dt.strftime(formato_data).fillna(""),
+            "valor": corrigido["valor"],
+            # moeda em que a parcela foi paga; o valor corrigido está na moeda da data alvo
+            "moeda": np.where(datas.isna(), "", simbolo_moeda(datas.fillna(data_alvo_fmt))),
+            "fator_acumulado": corrigido["fator_acumulado"],
+            "fator_historico": corrigido["fator_historico"],
+            "valor_corrigido": corrigido["valor_corrigido"],
+            "erro": corrigido["erro"],
+        })
+        total = float(tabela.loc[tabela["erro"] == "", "valor_corrigido"].sum())
+
+    tabela.attrs["indice"] = nome
+    tabela.attrs["data_alvo"] = data_alvo_fmt
+    tabela.attrs["moeda_alvo"] = str(simbolo_moeda(data_alvo_fmt))
+    tabela.attrs["pro_rata"] = pro_rata
+    tabela.attrs["versao_dados"] = serie.versao
+    return tabela, total
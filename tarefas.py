@@ -0,0 +1,83 @@
+# --- trabalho pesado fora do event loop ---
+# o Shiny roda os cálculos reativos de todas as sessões de um worker no mesmo event loop: uma planilha grande,
+# um gráfico de 50 anos ou uma matriz de fatores travavam a interface de todos os conectados ao worker.
+# esse trabalho vai para um pool próprio de CORRECAO_TAREFAS_MAX threads (padrão: até 4, limitado pelos núcleos):
+#   - o limite vale para o processo inteiro; pedidos pesados além dele esperam na fila, enquanto o trabalho leve
+#     (KPIs, API avulsa, carga das séries) segue no event loop e no pool padrão, sem esperar atrás deles
+#   - executar(): uma função no pool. Se quem espera for cancelado (as entradas mudaram, a sessão fechou, o
+#     cliente desistiu do download) antes de a tarefa começar, ela sai da fila sem rodar
+#   - iterar(): um gerador (blocos do lote, da matriz de fatores) puxado item a item no pool, com progresso
+#     e cancelamento entre os itens
+# as etapas medidas (metricas.etapa) continuam dentro das funções; aqui ficam a fila, as tarefas ativas e a espera.
+import asyncio
+import contextvars
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import ajustar, incrementar, observar
+
+MAX_TAREFAS = int(os.environ.get("CORRECAO_TAREFAS_MAX", str(min(4, os.cpu_count() or 1))))
+
+executor_tarefas = ThreadPoolExecutor(max_workers=MAX_TAREFAS, thread_name_prefix="tarefas")
+
+
+def rodar(nome, funcao, args, enfileirada_em):
+    ajustar("correcao_tarefas_na_fila", -1)
+    observar("correcao_tarefa_espera_segundos", time.perf_counter() - enfileirada_em, tarefa=nome)
+    ajustar("correcao_tarefas_ativas", 1)
+    try:
+        return funcao(*args)
+    finally:
+        ajustar("correcao_tarefas_ativas", -1)
+
+
+# põe funcao(*args) na fila do pool; o rastreio atual (metricas.rastreio) segue junto para a thread
+def submeter(nome, funcao, *args):
+    ajustar("correcao_tarefas_na_fila", 1)
+    contexto = contextvars.copy_context()
+    return executor_tarefas.submit(contexto.run, rodar, nome, funcao, args, time.perf_counter())
+
+
+def desistir(nome, futuro):
+    incrementar("correcao_tarefas_canceladas_total", tarefa=nome)
+    if futuro.cancel():
+        ajustar("correcao_tarefas_na_fila", -1)  # ainda não tinha começado: sai da fila sem rodar
+
+
+async def executar(nome, funcao, *args):
+    futuro = submeter(nome, funcao, *args)
+    try:
+        return await asyncio.wrap_future(futuro)
+    except asyncio.CancelledError:
+        desistir(nome, futuro)
+        raise
+
+
+# itens de um gerador, cada um produzido no pool. "progresso(n)" é chamado (no event loop) a cada item pronto.
+# se o consumidor parar no meio (cancelamento, cliente desconectou) o gerador é fechado assim que o item em
+# andamento terminar, liberando arquivos temporários e planilhas abertas.
+async def iterar(nome, gerador, progresso=None):
+    futuro = None
+    n = 0
+    try:
+        while True:
+            futuro = submeter(nome, next, gerador, None)
+            item = await asyncio.wrap_future(futuro)
+            if item is None:
+                return
+            n += 1
+            if progresso is not None:
+                progresso(n)
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        if futuro is not None and not futuro.done():
+            desistir(nome, futuro)
+        raise
+    finally:
+        if futuro is not None and futuro.running():
+            futuro.add_done_callback(lambda _: gerador.close())
+        else:
+            gerador.close()
+
@@ -0,0 +1,17 @@
+# --- testes: séries das fixtures, sem rede ---
+# as séries vêm das fixtures dos benchmarks (gravadas, se existirem; senão as sintéticas, geradas na hora) e o
+# cache_indices é apontado para elas antes de importar o motor, como no benchmarks/bench_correcao.py.
+#   python -m pytest -q
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import fixtures
+
+DIRETORIO_FIXTURES, TIPO_FIXTURES = fixtures.diretorio_fixtures()
+fixtures.configurar_ambiente(DIRETORIO_FIXTURES)
+
+import motor_correcao as motor
+
+motor.iniciar_carga()
@@ -0,0 +1,128 @@
+# --- API JSON (api_correcao) chamada direto pelo ASGI, sem servidor ---
+import asyncio
+import json
+
+from urllib.parse import urlencode
+
+import pytest
+
+from starlette.applications import Starlette
+
+import motor_correcao as motor
+
+from api_correcao import rotas_api
+
+app = Starlette(routes=rotas_api)
+
+# (status, cabeçalhos, corpo em bytes) de um pedido à API
+def pedir(caminho, parametros=None, corpo=None, cabecalhos=None):
+    async def executar_pedido():
+        escopo = {
+            "type": "http", "method": "GET" if corpo is None else "POST", "path": caminho,
+            "query_string": urlencode(parametros or {}).encode(), "http_version": "1.1",
+            "headers": [(nome.lower().encode(), valor.encode()) for nome, valor in (cabecalhos or {}).items()],
+            "scheme": "http", "server": ("teste", 80), "client": ("teste", 1), "root_path": "",
+        }
+        mensagens = []
+
+        async def receber():
+            return {"type": "http.request", "body": json.dumps(corpo).encode(), "more_body": False}
+
+        async def enviar(mensagem):
+            mensagens.append(mensagem)
+
+        await app(escopo, receber, enviar)
+        inicio = next(mensagem for mensagem in mensagens if mensagem["type"] == "http.response.start")
+        resposta = b"".join(mensagem.get("body", b"") for mensagem in mensagens if mensagem["type"] == "http.response.body")
+        return inicio["status"], {nome.decode(): valor.decode() for nome, valor in inicio["headers"]}, resposta
+
+    return asyncio.run(executar_pedido())
+
+# (status, corpo em JSON) de um pedido à API
+def chamar(caminho, parametros=None, corpo=None):
+    status, _, resposta = pedir(caminho, parametros, corpo)
+    return status, json.loads(resposta)
+
+
+def test_get_igual_ao_corrigir():
+    status, resposta = chamar("/api/correcao", {"indice": "ipca", "data_inicial": "01/2020", "data_final": "2021-01", "valor": "100"})
+    esperado = motor.corrigir("IPCA", motor.ler_data("2020-01"), motor.ler_data("2021-01"), 100.0)
+    assert status == 200
+    assert resposta == esperado
+
+
+@pytest.mark.parametrize("valor", ["nan", "inf", "-inf", "Infinity"])
+def test_get_valor_nao_finito(valor):
+    status, resposta = chamar("/api/correcao", {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": valor})
+    assert status == 400
+    assert "Valor inválido" in resposta["erro"]
+
+
+@pytest.mark.filterwarnings("ignore:overflow")
+def test_get_resultado_fora_do_float():
+    status, resposta = chamar("/api/correcao", {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": "1.7e308"})
+    assert status == 400
+    assert "fora do intervalo" in resposta["erro"]
+
+
+def test_post_lista():
+    pedidos = [
+        {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": 100},
+        {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": "inf"},
+        {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": "nan"},
+        {"indice": "IGP_DI+IPCA@2010-01", "data_inicial": "2005-01", "data_final": "2015-01", "valor": 100},
+        {"indice": "IPCA", "data_inicial": "17/01/2020", "data_final": "2021-01-05", "valor": 100, "pro_rata": True},
+        {"indice": "IPCA"},
+    ]
+    status, respostas = chamar("/api/correcao", corpo=pedidos)
+    assert status == 200
+    assert respostas[0] == motor.corrigir("IPCA", motor.ler_data("2020-01"), motor.ler_data("2021-01"), 100.0)
+    assert "Valor inválido" in respostas[1]["erro"] and "Valor inválido" in respostas[2]["erro"]
+    composto = motor.corrigir("IGP_DI+IPCA@2010-01", motor.ler_data("2005-01"), motor.ler_data("2015-01"), 100.0)
+    assert respostas[3]["valor_corrigido"] == pytest.approx(composto["valor_corrigido"], rel=1e-12)
+    assert respostas[3]["versao_dados"] == composto["versao_dados"]
+    pro_rata = motor.corrigir_pro_rata("IPCA", motor.ler_data("2020-01-17"), motor.ler_data("2021-01-05"), 100.0)
+    assert respostas[4] == pro_rata
+    assert "Pedido incompleto" in respostas[5]["erro"]
+
+
+# GET: ETag com a versão dos dados e cache público; If-None-Match conferido como no RFC 9110 (lista, W/, *)
+parametros_get = {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": "100"}
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"outra", W/{etag}', "*"])
+def test_get_if_none_match(if_none_match):
+    status, cabecalhos, _ = pedir("/api/correcao", parametros_get)
+    etag = cabecalhos["etag"]
+    assert status == 200 and etag == f'"{motor.versao_dados()}"'
+    assert cabecalhos["cache-control"].startswith("public, max-age=")
+    status, cabecalhos, resposta = pedir("/api/correcao", parametros_get, cabecalhos={"If-None-Match": if_none_match.format(etag=etag)})
+    assert status == 304 and resposta == b""
+    assert cabecalhos["etag"] == etag
+
+
+def test_get_if_none_match_diferente():
+    status, _, resposta = pedir("/api/correcao", parametros_get, cabecalhos={"If-None-Match": '"outra", W/"mais uma"'})
+    assert status == 200 and json.loads(resposta)["valor_corrigido"]
+
+
+# POST (avulso ou lista) não é guardado por proxies, e If-None-Match não vale para ele
+@pytest.mark.parametrize("corpo", [
+    {"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": 100},
+    [{"indice": "IPCA", "data_inicial": "2020-01", "data_final": "2021-01", "valor": 100}],
+])
+def test_post_sem_cache(corpo):
+    status, cabecalhos, _ = pedir("/api/correcao", corpo=corpo, cabecalhos={"If-None-Match": "*"})
+    assert status == 200
+    assert cabecalhos["cache-control"] == "no-store"
+
+
+# parcelas finitas uma a uma, mas cuja soma passa do maior float
+@pytest.mark.filterwarnings("ignore:overflow")
+def test_parcelas_total_fora_do_float():
+    corpo = {
+        "indice": "IPCA", "data_alvo": "2020-01",
+        "parcelas": [{"data": "2020-01", "valor": 1.5e308}, {"data": "2020-01", "valor": 1.5e308}],
+    }
+    status, resposta = chamar("/api/parcelas", corpo=corpo)
+    assert status == 400
+    assert "fora do intervalo" in resposta["erro"]
@@ -0,0 +1,93 @@
+# --- atualização periódica das séries (motor_correcao.iniciar_atualizacao) ---
+import os
+import shutil
+import threading
+
+import pandas as pd
+import pytest
+
+import cache_indices
+import motor_correcao as motor
+
+from cache_indices import CacheParquet, formatar_valores
+from cache_resultados import cache_resultados
+
+
+def threads_atualizacao():
+    return [thread for thread in threading.enumerate() if thread.name == "atualizacao_indices"]
+
+
+# intervalo 0, infinito (o TTL das fixtures) ou inválido: a atualização fica desligada, sem thread
+@pytest.mark.parametrize("intervalo_horas", [0, -1, float("inf"), float("nan")])
+def test_atualizacao_desligada(intervalo_horas):
+    motor.iniciar_atualizacao(intervalo_horas)
+    assert threads_atualizacao() == []
+
+
+# um intervalo enorme, mas finito, fica no limite do Event.wait (antes: OverflowError na thread)
+def test_espera_limitada():
+    assert motor.espera_atualizacao(1e12) == threading.TIMEOUT_MAX
+    assert motor.espera_atualizacao(2) == 7200
+    motor.parar_atualizacao.set()
+    try:
+        motor.laco_atualizacao(1e12)  # com parar_atualizacao ligado, sai na primeira espera
+    finally:
+        motor.parar_atualizacao.clear()
+
+
+# fonte de teste: um mês novo (variação de 1%) para o código pedido; nenhum mês novo para os outros
+class FonteUmMes:
+    def __init__(self, codigo):
+        self.codigo = codigo
+        self.pedidos = []
+
+    def buscar(self, codigo, apos=None):
+        self.pedidos.append((codigo, apos))
+        if codigo != self.codigo:
+            return formatar_valores(pd.DataFrame(columns=["SERCODIGO", "VALDATA", "VALVALOR"]))
+        mes = (apos + pd.DateOffset(months=1)).strftime("%Y-%m-%dT00:00:00-03:00")
+        return formatar_valores(pd.DataFrame({"SERCODIGO": [codigo], "VALDATA": [mes], "VALVALOR": [1.0]}))
+
+
+# uma atualização com um mês novo do IPCA: retrato novo trocado de uma vez, o antigo continua com os dados antigos
+# (quem já o pegou termina o cálculo nele), versão nova e caches de resultados e de compostos vazios
+def test_atualizacao_troca_o_retrato(tmp_path, monkeypatch):
+    fixtures = cache_indices.cache_padrao.diretorio
+    for arquivo in os.listdir(fixtures):
+        shutil.copy(os.path.join(fixtures, arquivo), tmp_path)
+    fonte = FonteUmMes(motor.indices["IPCA"])
+    monkeypatch.setattr(cache_indices, "cache_padrao", CacheParquet(str(tmp_path), ttl_horas=0))
+    monkeypatch.setattr(cache_indices, "fonte_padrao", fonte)
+    monkeypatch.setattr(motor, "retrato_atual", motor.retrato_atual)  # devolve o retrato das fixtures no fim
+
+    antigo = motor.retrato_atual
+    ipca = motor.serie_pronta("IPCA", antigo)
+    fatores_antigos = ipca.fatores.copy()
+    composto = motor.serie_composta("IGP_DI+IPCA@2010-01", antigo)
+    versao = motor.versao_dados()
+    motor.comparacao_periodo(pd.Timestamp("2020-01-01"), pd.Timestamp("2021-01-01"))
+    assert cache_resultados.estatisticas()["itens"] > 0
+
+    novo = motor.atualizar_dados()
+
+    assert motor.retrato_atual is novo and novo is not antigo
+    assert len(fonte.pedidos) == len(motor.indices)
+    assert motor.versao_dados() != versao and antigo.versao() == versao
+    # o retrato antigo não mudou
+    assert antigo.series["IPCA"] is ipca
+    assert (ipca.fatores == fatores_antigos).all()
+    assert motor.serie_composta("IGP_DI+IPCA@2010-01", antigo) is composto
+    # o novo tem o mês a mais (1%), e as séries sem meses novos são as mesmas
+    novo_ipca = novo.series["IPCA"]
+    assert len(novo_ipca.variacoes) == len(ipca.variacoes) + 1
+    assert novo_ipca.fatores[-1] == pytest.approx(fatores_antigos[-1] * 1.01, rel=1e-12)
+    assert novo.matriz["IPCA"].dropna().index[-1] > antigo.matriz["IPCA"].dropna().index[-1]
+    assert all(novo.series[nome] is antigo.series[nome] for nome in motor.indices if nome != "IPCA")
+    # caches da versão anterior vazios
+    assert cache_resultados.estatisticas()["itens"] == 0
+    assert novo.compostos.estatisticas()["itens"] == 0
+    assert motor.serie_composta("IGP_DI+IPCA@2010-01", novo) is not composto
+
+    # sem meses novos, nada muda
+    fonte.codigo = None
+    assert motor.atualizar_dados() is novo
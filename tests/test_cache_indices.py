@@ -0,0 +1,91 @@
+# --- cache das séries (cache_indices.carregar_serie) com uma fonte de teste, num diretório temporário ---
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import cache_indices
+
+from cache_indices import CacheParquet, carregar_serie, formatar_valores
+
+CODIGO = "PRECOS12_IPCAG12"
+
+
+# fonte de teste: devolve os meses dados (no formato da API do Ipeadata) e guarda os pedidos
+class FonteTeste:
+    def __init__(self, meses=(), erro=None):
+        self.meses = meses
+        self.erro = erro
+        self.pedidos = []
+
+    def buscar(self, codigo, apos=None):
+        self.pedidos.append((codigo, apos))
+        if self.erro:
+            raise self.erro
+        bruto = pd.DataFrame(
+            {
+                "SERCODIGO": codigo,
+                "VALDATA": [f"{mes}-01T00:00:00-03:00" for mes, _ in self.meses],
+                "VALVALOR": [valor for _, valor in self.meses],
+            }
+        )
+        return formatar_valores(bruto)
+
+
+# cache vencido (ttl 0) com o IPCA das fixtures, o arquivo com a data de gravação de uma hora atrás
+@pytest.fixture
+def cache_vencido(tmp_path):
+    df = cache_indices.cache_padrao.ler("IPCA")
+    cache = CacheParquet(str(tmp_path), ttl_horas=0)
+    cache.gravar("IPCA", df)
+    uma_hora_atras = time.time() - 3600
+    os.utime(cache.caminho("IPCA"), (uma_hora_atras, uma_hora_atras))
+    return cache, df
+
+
+def ultimos_meses(df, quantidade):
+    ultima = df.index.max()
+    return [(ultima + pd.DateOffset(months=k)).strftime("%Y-%m") for k in range(1, quantidade + 1)]
+
+
+# cache vencido: busca só depois do último mês, anexa os novos com os mesmos tipos e grava o arquivo
+def test_atualizacao_incremental(cache_vencido):
+    cache, df = cache_vencido
+    novos = ultimos_meses(df, 2)
+    repetido = df.index.max().strftime("%Y-%m")  # a fonte pode devolver o último mês de novo: não duplica
+    fonte = FonteTeste([(repetido, 9.9), (novos[0], 0.5), (novos[1], 0.25)])
+
+    resultado = carregar_serie("IPCA", CODIGO, cache=cache, fonte=fonte)
+
+    assert fonte.pedidos == [(CODIGO, df.index.max())]
+    assert len(resultado) == len(df) + 2
+    pd.testing.assert_frame_equal(resultado.iloc[:len(df)], df)
+    assert resultado.dtypes.equals(df.dtypes)
+    acrescentados = resultado.iloc[len(df):]
+    assert acrescentados.index.strftime("%Y-%m").tolist() == novos
+    assert acrescentados["VALUE ((% a.m.))"].tolist() == [0.5, 0.25]
+    assert acrescentados["CODE"].tolist() == [CODIGO, CODIGO]
+    assert acrescentados["MONTH"].tolist() == [int(mes[5:]) for mes in novos]
+    pd.testing.assert_frame_equal(cache.ler("IPCA"), resultado, check_freq=False)
+    assert time.time() - os.path.getmtime(cache.caminho("IPCA")) < 60
+
+
+# sem meses novos: o arquivo fica igual e só o prazo do cache é renovado (tocar)
+def test_sem_meses_novos_renova_o_cache(cache_vencido):
+    cache, df = cache_vencido
+    resultado = carregar_serie("IPCA", CODIGO, cache=cache, fonte=FonteTeste())
+    pd.testing.assert_frame_equal(resultado, df)
+    pd.testing.assert_frame_equal(cache.ler("IPCA"), df)
+    assert time.time() - os.path.getmtime(cache.caminho("IPCA")) < 60
+
+
+# fonte fora do ar: segue com o cache vencido, sem mexer no arquivo
+def test_fonte_fora_do_ar_mantem_o_cache_vencido(cache_vencido):
+    cache, df = cache_vencido
+    modificado = os.path.getmtime(cache.caminho("IPCA"))
+    fonte = FonteTeste(erro=ConnectionError("fora do ar"))
+    resultado = carregar_serie("IPCA", CODIGO, cache=cache, fonte=fonte)
+    assert len(fonte.pedidos) == 1
+    pd.testing.assert_frame_equal(resultado, df)
+    assert os.path.getmtime(cache.caminho("IPCA")) == modificado
@@ -0,0 +1,61 @@
+# --- cache LRU de resultados (cache_resultados.CacheLRU) ---
+import numpy as np
+
+from cache_resultados import CacheLRU
+
+
+# um array de "kb" kilobytes (float64), para controlar o tamanho de cada item
+def array_kb(kb):
+    return np.zeros(kb * 128)
+
+
+def test_acertos_e_faltas():
+    cache = CacheLRU("teste", 10 * 1024)
+    calculos = []
+
+    def calcular():
+        calculos.append(1)
+        return array_kb(1)
+
+    primeiro = cache.obter("a", calcular)
+    assert cache.obter("a", calcular) is primeiro
+    assert len(calculos) == 1
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["acertos"], estatisticas["faltas"]) == (1, 1)
+    assert (estatisticas["itens"], estatisticas["bytes"]) == (1, 1024)
+
+
+# ao passar do limite sai o item usado há mais tempo (um acerto conta como uso)
+def test_descarte_pelo_uso_mais_antigo():
+    cache = CacheLRU("teste", 3 * 1024)
+    for chave in "abc":
+        cache.obter(chave, lambda: array_kb(1))
+    cache.obter("a", lambda: array_kb(1))  # "a" passa a ser o mais recente
+    cache.obter("d", lambda: array_kb(1))
+    assert list(cache.itens) == ["c", "a", "d"]
+    cache.obter("e", lambda: array_kb(2))
+    assert list(cache.itens) == ["d", "e"]
+    assert cache.bytes == 3 * 1024
+
+
+# um item maior que o cache inteiro é devolvido, mas não é guardado nem derruba os outros
+def test_item_maior_que_o_limite():
+    cache = CacheLRU("teste", 2 * 1024)
+    cache.obter("a", lambda: array_kb(1))
+    grande = cache.obter("grande", lambda: array_kb(3))
+    assert len(grande) == 3 * 128
+    assert list(cache.itens) == ["a"] and cache.bytes == 1024
+    assert cache.estatisticas()["faltas"] == 2
+
+
+# limpar libera os itens (os contadores continuam) e o próximo pedido calcula de novo
+def test_limpar():
+    cache = CacheLRU("teste", 10 * 1024)
+    cache.obter("a", lambda: array_kb(1))
+    cache.obter("a", lambda: array_kb(1))
+    cache.limpar()
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["itens"], estatisticas["bytes"]) == (0, 0)
+    assert (estatisticas["acertos"], estatisticas["faltas"]) == (1, 1)
+    cache.obter("a", lambda: array_kb(1))
+    assert cache.estatisticas()["faltas"] == 2
@@ -0,0 +1,59 @@
+# --- lote_cli: o comando de verdade (subprocesso), sobre as séries das fixtures ---
+import subprocess
+import sys
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fixtures
+import lote_cli
+import motor_correcao as motor
+
+# csv "brasileiro" (; e decimal ,) com datas dd/mm/aaaa e formatos misturados, como sai de uma planilha
+linhas_entrada = [
+    ("1500,25", "01/02/2020", "01/03/2021", "IPCA"),
+    ("100,50", "17/02/2020", "05/03/2021", "igp-m"),
+    ("100,50", "2020-02", "03/2021", "INPC"),
+    ("100,50", "2021-03-01", "2020-02", "IPCA"),
+    ("100,50", "31/02/2020", "03/2021", "IPCA"),
+]
+
+
+def corrigir_pela_linha_de_comando(tmp_path, saida, *opcoes):
+    entrada = tmp_path / "carteira.csv"
+    texto = "valor;data_inicial;data_final;indice\n" + "".join(";".join(linha) + "\n" for linha in linhas_entrada)
+    entrada.write_text(texto, encoding="utf-8")
+    subprocess.run(
+        [sys.executable, lote_cli.__file__, str(entrada), str(tmp_path / saida), "--series", fixtures.diretorio_fixtures()[0], *opcoes],
+        check=True, capture_output=True,
+    )
+    return tmp_path / saida
+
+
+def esperados():
+    datas = [(datetime(2020, 2, 1), datetime(2021, 3, 1))] * 3 + [(datetime(2021, 3, 1), datetime(2020, 2, 1))]
+    valores = [1500.25, 100.5, 100.5, 100.5]
+    return [
+        motor.corrigir(motor.normalizar_nome(nome), data_inicial, data_final, valor)["valor_corrigido"]
+        for (data_inicial, data_final), valor, (_, _, _, nome) in zip(datas, valores, linhas_entrada)
+    ]
+
+
+@pytest.mark.parametrize("saida,processos", [("corrigida.csv.gz", "1"), ("corrigida.csv", "2")])
+def test_cli_csv_brasileiro(tmp_path, saida, processos):
+    resultado = pd.read_csv(
+        corrigir_pela_linha_de_comando(tmp_path, saida, "--processos", processos, "--linhas", "2"),
+        keep_default_na=False, float_precision="round_trip",
+    )
+    assert resultado["erro"].tolist() == ["", "", "", "", "valor ou data inválidos"]
+    np.testing.assert_allclose(resultado["valor_corrigido"].iloc[:4].astype(float), esperados(), rtol=1e-12)
+
+
+def test_cli_parquet_com_datas(tmp_path):
+    resultado = pd.read_parquet(corrigir_pela_linha_de_comando(tmp_path, "corrigida.parquet", "--processos", "1"))
+    assert resultado["erro"].tolist() == ["", "", "", "", "valor ou data inválidos"]
+    assert [str(data) for data in resultado["data_inicial"]] == ["2020-02-01", "2020-02-17", "2020-02-01", "2021-03-01", "None"]
+    np.testing.assert_allclose(resultado["valor_corrigido"].iloc[:4], esperados(), rtol=1e-12)
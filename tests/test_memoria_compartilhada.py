@@ -0,0 +1,82 @@
+# --- séries compartilhadas entre processos (memoria_compartilhada), num diretório temporário ---
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+import memoria_compartilhada
+import motor_correcao as motor
+
+RAIZ = os.path.dirname(os.path.abspath(memoria_compartilhada.__file__))
+
+# outro processo (um segundo worker): obtém a série já publicada, sem chamar carregar(), e grava o que mapeou
+script_worker = textwrap.dedent("""
+    import sys
+    import numpy as np
+    sys.path.insert(0, sys.argv[1])
+    import memoria_compartilhada
+
+    def carregar():
+        raise AssertionError("a série já publicada não deveria ser carregada de novo")
+
+    arrays = memoria_compartilhada.obter("IPCA", carregar, 24, diretorio=sys.argv[2])
+    np.savez(sys.argv[3], variacoes=arrays["variacoes"], fatores=arrays["fatores"], mes_inicial=arrays["mes_inicial"])
+    print(arrays["versao"])
+""")
+
+
+def arrays_ipca(mes_final=None):
+    serie = motor.serie_pronta("IPCA")
+    variacoes = np.array(serie.variacoes[:mes_final])
+    return serie.mes_inicial, variacoes, motor.indice_fatores(variacoes)
+
+
+def arquivos_npy(diretorio):
+    return sorted(arquivo for arquivo in os.listdir(diretorio) if arquivo.endswith(".npy"))
+
+
+# um processo publica; um segundo processo só mapeia e vê os mesmos arrays e a mesma versão
+def test_segundo_processo_mapeia_o_publicado(tmp_path):
+    diretorio = str(tmp_path / "compartilhado")
+    mes_inicial, variacoes, fatores = arrays_ipca()
+    publicados = memoria_compartilhada.obter("IPCA", lambda: (mes_inicial, variacoes, fatores), 24, diretorio=diretorio)
+    assert publicados["versao"] == memoria_compartilhada.versao_fatores(fatores)
+
+    saida = tmp_path / "worker.npz"
+    resultado = subprocess.run(
+        [sys.executable, "-c", script_worker, RAIZ, diretorio, str(saida)], check=True, capture_output=True, text=True,
+    )
+    assert resultado.stdout.strip() == publicados["versao"]
+    with np.load(saida) as lidos:
+        np.testing.assert_array_equal(lidos["variacoes"], variacoes)
+        np.testing.assert_array_equal(lidos["fatores"], fatores)
+        assert int(lidos["mes_inicial"]) == mes_inicial
+
+
+# versão vencida: carregar() traz fatores novos, a versão muda e os arquivos da anterior são apagados.
+# se a fonte falhar, a versão vencida continua valendo
+def test_fatores_novos_publicam_outra_versao(tmp_path):
+    diretorio = str(tmp_path / "compartilhado")
+    antigos = arrays_ipca(-1)
+    novos = arrays_ipca()
+    primeira = memoria_compartilhada.obter("IPCA", lambda: antigos, 24, diretorio=diretorio)
+    versao_antiga = primeira["versao"]
+    assert arquivos_npy(diretorio) == [f"IPCA-{versao_antiga}-{parte}.npy" for parte in ("fatores", "variacoes")]
+
+    segunda = memoria_compartilhada.obter("IPCA", lambda: novos, 0, diretorio=diretorio)
+    assert segunda["versao"] == memoria_compartilhada.versao_fatores(novos[2]) != versao_antiga
+    np.testing.assert_array_equal(segunda["fatores"], novos[2])
+    assert arquivos_npy(diretorio) == [f"IPCA-{segunda['versao']}-{parte}.npy" for parte in ("fatores", "variacoes")]
+    # quem já tinha a versão antiga mapeada continua lendo os mesmos números
+    np.testing.assert_array_equal(primeira["fatores"], antigos[2])
+
+    def fonte_fora_do_ar():
+        raise ConnectionError("fora do ar")
+
+    terceira = memoria_compartilhada.obter("IPCA", fonte_fora_do_ar, 0, diretorio=diretorio)
+    assert terceira["versao"] == segunda["versao"]
+    with pytest.raises(ConnectionError):
+        memoria_compartilhada.obter("IPCA", fonte_fora_do_ar, 0, diretorio=str(tmp_path / "vazio"))
@@ -0,0 +1,284 @@
+# --- motor de correção contra o cálculo original do app ---
+# a referência é o loop da primeira versão do app_correcao: loc[inicio:fim] no dataframe do Ipeadata, produto mês
+# a mês e o fator da moeda por if/elif nas datas de corte. O motor (índice de fatores, lote vetorizado, matriz,
+# tabelas, compostos e pro rata) tem de dar os mesmos números.
+import io
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import exportacao
+import motor_correcao as motor
+
+from cache_indices import carregar_serie
+
+# --- cálculo original ---
+def fator_historico_original(data):
+    if data < motor.data_corte_cruzeiro:
+        return motor.fator_cruzeiro_real
+    elif data < motor.data_corte_cruzado:
+        return motor.fator_cruzado_real
+    elif data < motor.data_corte_cruzadonovo:
+        return motor.fator_cruzadonovo_real
+    elif data < motor.data_corte_cruzeiro2:
+        return motor.fator_cruzeiro2_real
+    elif data < motor.data_corte_cruzeiroreal:
+        return motor.fator_cruzeiroreal_real
+    else:
+        return 1.0
+
+def fator_historico_real_moedaantiga_original(data):
+    if data < motor.data_corte_cruzeiro:
+        return motor.fator_real_cruzeiro
+    elif data < motor.data_corte_cruzado:
+        return motor.fator_real_cruzado
+    elif data < motor.data_corte_cruzadonovo:
+        return motor.fator_real_cruzadonovo
+    elif data < motor.data_corte_cruzeiro2:
+        return motor.fator_real_cruzeiro2
+    elif data < motor.data_corte_cruzeiroreal:
+        return motor.fator_real_cruzeiroreal
+    else:
+        return 1.0
+
+dados_originais = {}
+
+def indice_original(nome):
+    if nome not in dados_originais:
+        dados_originais[nome] = carregar_serie(nome, motor.indices[nome])
+    return dados_originais[nome]
+
+# (fator acumulado mês a mês, valor corrigido) ou None se alguma data não está na série
+def correcao_original(nome, data_inicial, data_final, valor):
+    indice_df = indice_original(nome)
+    data_inicial_fmt = datetime(data_inicial.year, data_inicial.month, 1)
+    data_final_fmt = datetime(data_final.year, data_final.month, 1)
+    if data_inicial_fmt not in indice_df.index or data_final_fmt not in indice_df.index:
+        return None
+    periodo = indice_df.loc[min(data_inicial_fmt, data_final_fmt):max(data_inicial_fmt, data_final_fmt), "VALUE ((% a.m.))"]
+    fatores = []
+    fator = 1.0
+    for variacao in periodo:
+        fator = fator * (1 + variacao / 100)
+        fatores.append(fator)
+    fatores = np.array(fatores)
+    if data_inicial_fmt <= data_final_fmt:
+        return fatores, valor * fatores[-1] * fator_historico_original(data_inicial_fmt)
+    fatores = 1 / fatores
+    return fatores, valor * fatores[-1] * fator_historico_real_moedaantiga_original(data_final_fmt)
+
+# pares de datas sorteados dentro da série (inflação e deflação, antes e depois do real)
+def periodos(nome, quantidade, semente=0):
+    meses = indice_original(nome).index
+    rng = np.random.default_rng(semente)
+    return [(meses[a].to_pydatetime(), meses[b].to_pydatetime()) for a, b in rng.integers(0, len(meses), (quantidade, 2))]
+
+
+@pytest.mark.parametrize("nome", list(motor.indices))
+def test_corrigir_igual_ao_original(nome):
+    for data_inicial, data_final in periodos(nome, 40):
+        fatores, valor_corrigido = correcao_original(nome, data_inicial, data_final, 1500.0)
+        resultado = motor.corrigir(nome, data_inicial, data_final, 1500.0)
+        assert resultado["fator_acumulado"] == pytest.approx(fatores[-1], rel=1e-9)
+        assert resultado["valor_corrigido"] == pytest.approx(valor_corrigido, rel=1e-9)
+        assert resultado["moeda"] == motor.simbolo_moeda(datetime(data_final.year, data_final.month, 1))
+
+
+def test_corrigir_moedas_antigas():
+    # cruzeiro de 1985 até o real e o caminho de volta
+    _, valor_corrigido = correcao_original("IPCA", datetime(1985, 6, 1), datetime(2020, 1, 1), 1e9)
+    assert motor.corrigir("IPCA", datetime(1985, 6, 1), datetime(2020, 1, 1), 1e9)["valor_corrigido"] == pytest.approx(valor_corrigido, rel=1e-9)
+    _, valor_corrigido = correcao_original("IPCA", datetime(2020, 1, 1), datetime(1991, 3, 1), 100.0)
+    resultado = motor.corrigir("IPCA", datetime(2020, 1, 1), datetime(1991, 3, 1), 100.0)
+    assert resultado["valor_corrigido"] == pytest.approx(valor_corrigido, rel=1e-9)
+    assert resultado["moeda"] == "Cr$"
+
+
+def test_corrigir_fora_do_periodo():
+    with pytest.raises(ValueError, match="não estão no período"):
+        motor.corrigir("IPC_BR", datetime(1985, 1, 1), datetime(2000, 1, 1), 100.0)
+
+
+@pytest.mark.parametrize("nome", ["IPCA", "IGP_DI"])
+def test_tabela_correcao_igual_ao_original(nome):
+    for data_inicial, data_final in periodos(nome, 10, semente=1):
+        fatores, valor_corrigido = correcao_original(nome, data_inicial, data_final, 250.0)
+        tabela = motor.tabela_correcao(nome, data_inicial, data_final, 250.0)
+        np.testing.assert_allclose(tabela["fator_acumulado"].to_numpy(), fatores, rtol=1e-9)
+        assert tabela["valor_corrigido"].iloc[-1] == pytest.approx(valor_corrigido, rel=1e-9)
+
+
+# o lote vetorizado linha a linha contra o cálculo original, com linhas inválidas no meio
+def test_lote_igual_ao_original():
+    linhas = []
+    for nome in motor.indices:
+        for data_inicial, data_final in periodos(nome, 25, semente=2):
+            linhas.append((1000.0, data_inicial.strftime("%Y-%m"), data_final.strftime("%Y-%m"), nome))
+    linhas += [
+        (10.0, "2020-01", "2021-01", "XYZ"),
+        ("abc", "2020-01", "2021-01", "IPCA"),
+        (10.0, "2020-13", "2021-01", "IPCA"),
+        (10.0, "1950-01", "2021-01", "IPCA"),
+    ]
+    lote = pd.DataFrame(linhas, columns=motor.colunas_lote)
+    resultado = motor.corrigir_lote(lote)
+
+    for linha, (valor, data_inicial, data_final, nome) in zip(resultado.itertuples(index=False), linhas):
+        original = None
+        if nome in motor.indices and isinstance(valor, float) and data_inicial != "2020-13":
+            original = correcao_original(nome, motor.ler_data(data_inicial), motor.ler_data(data_final), valor)
+        if original is None:
+            assert linha.erro and np.isnan(linha.valor_corrigido)
+        else:
+            assert linha.erro == ""
+            assert linha.valor_corrigido == pytest.approx(original[1], rel=1e-9)
+    assert list(resultado["erro"].iloc[-4:]) == [
+        "índice desconhecido", "valor ou data inválidos", "valor ou data inválidos", "data fora do período do IPCA",
+    ]
+
+
+# csv "brasileiro" (; e decimal ,) com datas dd/mm/aaaa e formatos misturados na mesma coluna
+def test_lote_csv_com_datas_brasileiras(tmp_path):
+    caminho = tmp_path / "lote.csv"
+    caminho.write_text(
+        "valor;data_inicial;data_final;indice\n"
+        "100,50;01/02/2020;01/03/2021;IPCA\n"
+        "100,50;17/02/2020;05/03/2021;IPCA\n"
+        "100,50;2020-02;03/2021;IPCA\n"
+        "100,50;2020-02-01;2021-03;IPCA\n"
+        "100,50;31/02/2020;03/2021;IPCA\n",
+        encoding="utf-8",
+    )
+    resultado = pd.concat(list(motor.corrigir_arquivo(str(caminho), "lote.csv")), ignore_index=True)
+    esperado = motor.corrigir("IPCA", datetime(2020, 2, 1), datetime(2021, 3, 1), 100.5)["valor_corrigido"]
+    assert resultado["erro"].tolist() == ["", "", "", "", "valor ou data inválidos"]
+    np.testing.assert_allclose(resultado["valor_corrigido"].iloc[:4].to_numpy(), esperado, rtol=1e-12)
+
+
+def test_lote_xlsx_com_datas_e_textos(tmp_path):
+    from openpyxl import Workbook
+
+    planilha = Workbook()
+    planilha.active.append(["Valor", "Data_Inicial", "Data_Final", "Indice"])
+    planilha.active.append([100.0, datetime(2020, 2, 1), "01/03/2021", "ipca"])
+    planilha.active.append([100.0, "02/2020", datetime(2021, 3, 1), "IPCA"])
+    planilha.save(tmp_path / "lote.xlsx")
+    resultado = pd.concat(list(motor.corrigir_arquivo(str(tmp_path / "lote.xlsx"), "lote.xlsx")), ignore_index=True)
+    esperado = motor.corrigir("IPCA", datetime(2020, 2, 1), datetime(2021, 3, 1), 100.0)["valor_corrigido"]
+    assert resultado["erro"].tolist() == ["", ""]
+    np.testing.assert_allclose(resultado["valor_corrigido"].to_numpy(), esperado, rtol=1e-12)
+
+
+def test_lote_xlsx_vazio(tmp_path):
+    from openpyxl import Workbook
+
+    Workbook().save(tmp_path / "vazio.xlsx")
+    with pytest.raises(ValueError, match="Planilha vazia"):
+        list(motor.corrigir_arquivo(str(tmp_path / "vazio.xlsx"), "vazio.xlsx"))
+
+
+def test_matriz_igual_ao_corrigir():
+    desde, ate = datetime(1992, 1, 1), datetime(1996, 12, 1)
+    matriz = pd.concat(motor.blocos_matriz_fatores("IPCA", desde, ate, linhas_bloco=16))
+    assert matriz.shape == (60, 60)
+    for data_inicial, data_final in [("01-1992", "12-1996"), ("06-1994", "07-1994"), ("12-1996", "03-1993"), ("05-1995", "05-1995")]:
+        esperado = motor.corrigir("IPCA", datetime.strptime(data_inicial, "%m-%Y"), datetime.strptime(data_final, "%m-%Y"), 1)
+        assert matriz.loc[data_inicial, data_final] == pytest.approx(esperado["valor_corrigido"], rel=1e-12)
+
+
+def test_tabela_fatores_alvo_igual_ao_corrigir():
+    data_alvo = datetime(2024, 1, 1)
+    tabela = motor.tabela_fatores_alvo("INPC", data_alvo, desde=datetime(1985, 1, 1))
+    for data in tabela.index[::37]:
+        esperado = motor.corrigir("INPC", data, data_alvo, 1)["valor_corrigido"]
+        assert tabela.loc[data, "fator"] == pytest.approx(esperado, rel=1e-12)
+
+
+# --- pro rata die ---
+def test_pro_rata_de_dia_1_a_dia_1_igual_ao_mensal():
+    pro_rata = motor.corrigir_pro_rata("IPCA", datetime(2020, 1, 1), datetime(2021, 1, 1), 100.0, "corridos")
+    mensal = motor.corrigir("IPCA", datetime(2020, 1, 1), datetime(2020, 12, 1), 100.0)
+    assert pro_rata["fator_acumulado"] == pytest.approx(mensal["fator_acumulado"], rel=1e-12)
+
+
+def test_pro_rata_dentro_do_mes():
+    serie = motor.serie_pronta("IPCA")
+    variacao = serie.variacoes[motor.numero_mes(datetime(2020, 1, 1)) - serie.mes_inicial]
+    resultado = motor.corrigir_pro_rata("IPCA", datetime(2020, 1, 1), datetime(2020, 1, 16), 100.0, "corridos")
+    assert resultado["fator_acumulado"] == pytest.approx((1 + variacao / 100) ** (15 / 31), rel=1e-12)
+
+
+@pytest.mark.parametrize("dias", motor.modos_pro_rata)
+def test_lote_pro_rata_igual_ao_corrigir_pro_rata(dias):
+    linhas = [
+        (100.0, "2020-01-17", "2021-03-05", "IPCA"),
+        (100.0, "2021-03-05", "2020-01-17", "IPCA"),
+        (50.0, "1993-07-10", "1994-08-20", "IGP_M"),
+    ]
+    resultado = motor.corrigir_lote(pd.DataFrame(linhas, columns=motor.colunas_lote), dias)
+    for linha, (valor, data_inicial, data_final, nome) in zip(resultado.itertuples(index=False), linhas):
+        esperado = motor.corrigir_pro_rata(nome, motor.ler_data(data_inicial), motor.ler_data(data_final), valor, dias)
+        assert linha.valor_corrigido == pytest.approx(esperado["valor_corrigido"], rel=1e-12)
+
+
+# --- índices compostos ---
+def test_composto_igual_aos_segmentos():
+    fatores_igp, _ = correcao_original("IGP_DI", datetime(2005, 1, 1), datetime(2009, 12, 1), 1)
+    fatores_ipca, _ = correcao_original("IPCA", datetime(2010, 1, 1), datetime(2015, 1, 1), 1)
+    resultado = motor.corrigir("IGP-DI + IPCA@2010-01", datetime(2005, 1, 1), datetime(2015, 1, 1), 1)
+    assert resultado["fator_acumulado"] == pytest.approx(fatores_igp[-1] * fatores_ipca[-1], rel=1e-9)
+
+
+# um segmento que começa antes da série do seu índice deixaria meses sem variação (fator 1) no meio do composto
+def test_composto_com_meses_sem_dados():
+    inicio_ipc_br = motor.serie_pronta("IPC_BR").meses()[0]
+    with pytest.raises(ValueError, match=r"O IPC_BR não tem dados de 01-1985 a"):
+        motor.corrigir("IPCA+IPC_BR@1985-01", datetime(1984, 6, 1), datetime(2000, 1, 1), 100.0)
+    with pytest.raises(ValueError, match="O IPC_BR não tem dados"):
+        motor.corrigir("IPC_BR+IPCA@1985-01", datetime(1986, 1, 1), datetime(2000, 1, 1), 100.0)
+    # no lote, o erro vai para as linhas do composto
+    lote = pd.DataFrame([(100.0, "1984-06", "2000-01", "IPCA+IPC_BR@1985-01")], columns=motor.colunas_lote)
+    assert "IPC_BR não tem dados" in motor.corrigir_lote(lote)["erro"].iloc[0]
+    # e o composto fica fora da comparação, sem derrubar a dos outros índices
+    assert motor.compostos_prontos(["IPCA+IPC_BR@1985-01"], motor.retrato_atual) == {}
+    assert motor.compostos_prontos([f"IPCA+IPC_BR@{inicio_ipc_br.astype('datetime64[M]')}"], motor.retrato_atual)
+
+
+# grafias diferentes do mesmo composto usam uma única entrada do cache do retrato, e o cache respeita o limite
+def test_cache_de_compostos():
+    retrato = motor.Retrato(motor.retrato_atual.series)
+    serie = motor.serie_composta("IGP_DI+IPCA@2010-01", retrato)
+    for nome in ["igp-di + ipca@2010-01", " IGP_DI+IPCA @ 01/2010", "Igp_Di+Ipca@2010-01-15"]:
+        assert motor.serie_composta(nome, retrato) is serie
+    assert list(retrato.compostos.itens) == ["IGP_DI+IPCA@2010-01"]
+
+    # os IGP_M+IPCA@aaaa-01 têm todos o mesmo tamanho: cabem dois
+    retrato.compostos.limite_bytes = motor.serie_composta("IGP_M+IPCA@2001-01", retrato).nbytes * 2
+    for ano in range(2002, 2006):
+        motor.serie_composta(f"IGP_M+IPCA@{ano}-01", retrato)
+    assert list(retrato.compostos.itens) == ["IGP_M+IPCA@2004-01", "IGP_M+IPCA@2005-01"]
+    assert retrato.compostos.bytes <= retrato.compostos.limite_bytes
+
+
+# --- parcelas ---
+def test_parcelas_somam_as_correcoes():
+    datas = [datetime(2015, 3, 1), datetime(2018, 7, 1), datetime(2026, 1, 1)]
+    parcelas = pd.DataFrame({"data": datas, "valor": [100.0, 200.0, 300.0]})
+    tabela, total = motor.corrigir_parcelas("IPCA", parcelas, datetime(2022, 1, 1))
+    assert tabela["erro"].tolist()[:2] == ["", ""] and tabela["erro"].iloc[2]
+    esperado = sum(motor.corrigir("IPCA", data, datetime(2022, 1, 1), valor)["valor_corrigido"] for data, valor in zip(datas[:2], [100.0, 200.0]))
+    assert total == pytest.approx(esperado, rel=1e-12)
+
+
+# --- exportação em xlsx: o que foi gravado volta igual ---
+def test_xlsx_ida_e_volta():
+    tabela = motor.tabela_correcao("IPCA", datetime(1990, 1, 1), datetime(2024, 12, 1), 1000.0)
+    arquivo = b"".join(exportacao.escrever_tabela("teste_xlsx", exportacao.em_blocos(tabela, 100), "xlsx"))
+    lido = pd.read_excel(io.BytesIO(arquivo), sheet_name="dados")
+    assert list(lido.columns) == list(tabela.columns)
+    assert lido["date"].tolist() == tabela["date"].tolist()
+    for coluna in ["variacao_mensal", "fator_acumulado", "valor_corrigido"]:
+        np.testing.assert_array_equal(lido[coluna].to_numpy(), tabela[coluna].to_numpy())